@@ -1,16 +1,17 @@
-from .check_field import check_status, check_phone, check_expire, check_card, clean_balance_for_bigint
 from django.contrib import admin
-from django.urls import path
+from django.urls import path, reverse
 from django.shortcuts import render, redirect
-from django.http import HttpResponse
 from django.contrib.admin import SimpleListFilter
-from openpyxl import load_workbook
-import pandas as pd
-from .models import Card
+from .models import Card, CardStatus, DeliveryStatus, ImportChunk, ImportJob, ImportStatus, SmsJob
+from .exporter import export_response
 from .forms import ExcelImportForm
-from django.db import models
+from .import_jobs import spool_upload
+from .sms_jobs import create_job as create_sms_job, retry_failed
+from django.db import models, transaction
+from django.utils.html import format_html_join
 
-from .send_sms import send_sms
+from notif_worker.tasks import start_import_job, start_sms_job
+from transfer import card_cache, stats
 
 
 class StatusFilter(SimpleListFilter):
@@ -18,11 +19,7 @@ class StatusFilter(SimpleListFilter):
     parameter_name = 'status'
 
     def lookups(self, request, model_admin):
-        return (
-            ('active', 'Active'),
-            ('inactive', 'Inactive'),
-            ('expired', 'Expired'),
-        )
+        return CardStatus.choices
 
     def queryset(self, request, queryset):
         if self.value():
@@ -32,12 +29,30 @@ class StatusFilter(SimpleListFilter):
 
 @admin.register(Card)
 class CardAdmin(admin.ModelAdmin):
-    list_display = ('card_number', 'expire', 'phone', 'status', 'balance')
+    list_display = ('card_number', 'expire', 'phone', 'status', 'balance_display')
     change_list_template = "admin/excel/change_list.html"  # Maxsus shablon
     list_filter = (StatusFilter,)
     search_fields = ['status']
     actions = ['show_selected_cards', ]
 
+    def get_queryset(self, request):
+        # balance - compact_ledger gacha eski snapshot; card.info va eksport bilan bir xil balans ko'rsatiladi
+        return super().get_queryset(request).with_current_balance()
+
+    def get_readonly_fields(self, request, obj=None):
+        # balans faqat ledger orqali o'zgaradi: qo'lda yozilgan balance ustiga kutilayotgan yozuvlar qo'shilib ketadi,
+        # balance_entry_id o'zgarsa yozuvlar yo'qoladi yoki ikki marta hisoblanadi. Yangi kartaga boshlang'ich balans
+        # berish mumkin (unda hali yozuv yo'q)
+        if obj is None:
+            return ('balance_entry_id',)
+        return ('balance', 'balance_entry_id', 'balance_display')
+
+    def balance_display(self, obj):
+        return obj.current_balance()
+
+    balance_display.short_description = "Balance"
+    balance_display.admin_order_field = 'ledger_balance'
+
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
@@ -46,6 +61,28 @@ class CardAdmin(admin.ModelAdmin):
         ]
         return custom_urls + urls
 
+    # karta statistikasi (transfer.stats) admin orqali qo'shish/o'zgartirish/o'chirishda yangilanadi
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        card_cache.invalidate([obj.card_number, form.initial.get('card_number')])
+        if not change:
+            stats.cards_changed(added=[obj.status])
+        elif 'status' in form.changed_data:
+            stats.cards_changed(removed=[form.initial.get('status')], added=[obj.status])
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            super().delete_model(request, obj)
+            stats.cards_changed(removed=[obj.status])
+            card_cache.invalidate([obj.card_number])
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            cards = list(queryset.values_list('status', 'card_number'))
+            super().delete_queryset(request, queryset)
+            stats.cards_changed(removed=[status for status, _ in cards])
+            card_cache.invalidate(number for _, number in cards)
+
     def changelist_view(self, request, extra_context=None):
         extra_context = extra_context or {}
         extra_context['show_import_button'] = True
@@ -55,36 +92,12 @@ class CardAdmin(admin.ModelAdmin):
         if request.method == 'POST':
             form = ExcelImportForm(request.POST, request.FILES)
             if form.is_valid():
-                excel_file = request.FILES['file']
-                wb = load_workbook(excel_file)
-                ws = wb.active
-
-                for row in ws.iter_rows(min_row=1):
-                    print("\n\n>>>>>>>>>>>>>", row, "\n\n")
-                    if row[0].value == "id":
-                        continue
-
-                    card_number = str(row[0].value)
-                    expire = str(row[1].value)
-                    phone = str(row[2].value)
-                    status = str(row[3].value)
-                    balance_str = str(row[4].value)
-                    if card_number and Card.objects.filter(card_number=card_number).exists():
-                        self.message_user(
-                            request,
-                            f"Karta raqami {card_number} allaqachon bazada mavjud! Ushbu qator o'tkazib yuborildi.",
-                            level='warning'
-                        )
-                        continue
-                    Card.objects.create(
-                        card_number=check_card(card_number),
-                        expire=check_expire(expire),
-                        phone=check_phone(phone),
-                        status=check_status(status),
-                        balance=clean_balance_for_bigint(balance_str)
-                    )
-                self.message_user(request, "Excel file muvaffaqiyatli yuklandi!")
-                return redirect("..")
+                # Fayl diskka yoziladi va import Celery worker'larida bajariladi
+                with transaction.atomic():
+                    job = spool_upload(request.FILES['file'])
+                    transaction.on_commit(lambda: start_import_job.delay(job.pk))
+                self.message_user(request, f"Import #{job.pk} navbatga qo'yildi.")
+                return redirect(reverse('admin:excell_importjob_change', args=[job.pk]))
         else:
             form = ExcelImportForm()
 
@@ -107,8 +120,6 @@ class CardAdmin(admin.ModelAdmin):
             # Agar status filtri tanlanmagan bo'lsa, barcha ma'lumotlarni eksport qilamiz
             self.message_user(request, "Iltimos, status bo'yicha filtr tanlang!", level='warning')
 
-        print("\n\n>>>>>>>>>>>>>>", queryset, status, request.GET, "<<<<<<<<<<<<<<<<<\n\n")
-
         # Qidiruv parametri (agar qo'llanilgan bo'lsa)
         search_query = request.GET.get('q')
         if search_query:
@@ -123,14 +134,8 @@ class CardAdmin(admin.ModelAdmin):
             self.message_user(request, "Tanlangan filtrlar bo'yicha ma'lumotlar topilmadi!", level='warning')
             return redirect("..")
 
-        # Eksport qilish
-        cards = queryset.values('id', 'card_number', 'expire', 'phone', 'status', 'balance')
-        df = pd.DataFrame(list(cards))
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response[
-            'Content-Disposition'] = f'attachment; filename="cards_export_{status or "all"}_{pd.Timestamp.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
-        df.to_excel(response, index=False, engine='openpyxl')
-        return response
+        # Eksport qilish (?format=csv yoki xlsx)
+        return export_response(queryset, f"cards_export_{status or 'all'}", request.GET.get('format', 'xlsx'))
 
     # Yangi action: Tanlangan qatorlarni ro'yxat sifatida ko'rsatish
     def show_selected_cards(self, request, queryset):
@@ -154,19 +159,14 @@ class CardAdmin(admin.ModelAdmin):
         if not queryset.exists():
             self.message_user(request, "Hech qanday qator tanlanmadi!", level='warning')
             return
-        # Bu yerda sms yuborganma
-        for card in queryset:
-            phone = card.phone
-            balance = card.balance
-            card_number = card.card_number
-            if phone != "None" and card_number:
-                send_sms(balance, phone)
+        # SMS lar Celery worker'larida bo'laklab yuboriladi, admin faqat job yaratadi
+        with transaction.atomic():
+            job = create_sms_job(queryset)
+            transaction.on_commit(lambda: start_sms_job.delay(job.pk))
+        self.message_user(request, f"SMS #{job.pk} navbatga qo'yildi.")
+        return redirect(reverse('admin:excell_smsjob_change', args=[job.pk]))
 
-        context = {
-            'cards': queryset,
-            'opts': self.model._meta,
-        }
-        return render(request, 'admin/excel/selected_cards.html', context)
+    show_selected_cards.short_description = "Tanlangan kartalarga balans SMS yuborish"
 
     def get_actions(self, request):
         actions = super().get_actions(request)
@@ -180,14 +180,108 @@ class CardAdmin(admin.ModelAdmin):
         if not queryset.exists():
             self.message_user(request, "Hech qanday qator tanlanmadi!", level='warning')
             return
-        cards = queryset.values('id', 'card_number', 'expire', 'phone', 'status', 'balance')
-        df = pd.DataFrame(list(cards))
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response[
-            'Content-Disposition'] = f'attachment; filename="selected_cards_{pd.Timestamp.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
-        df.to_excel(response, index=False, engine='openpyxl')
-        return response
+        return export_response(queryset, "selected_cards", request.GET.get('format', 'xlsx'))
 
     export_selected_cards.short_description = "Tanlangan kartalarni Excel'ga eksport qilish"
 
-    actions = ['show_selected_cards', 'export_selected_cards']
+    def export_selected_cards_csv(self, request, queryset):
+        if not queryset.exists():
+            self.message_user(request, "Hech qanday qator tanlanmadi!", level='warning')
+            return
+        return export_response(queryset, "selected_cards", "csv")
+
+    export_selected_cards_csv.short_description = "Tanlangan kartalarni CSV'ga eksport qilish"
+
+    actions = ['show_selected_cards', 'export_selected_cards', 'export_selected_cards_csv']
+
+
+class ImportChunkInline(admin.TabularInline):
+    model = ImportChunk
+    fields = ('start_row', 'end_row', 'status', 'created_rows', 'rejected_rows', 'finished_at')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'original_name', 'status', 'progress_display', 'processed_rows', 'created_rows',
+                    'rejected_rows', 'throughput_display', 'created_at')
+    list_filter = ('status',)
+    readonly_fields = ('original_name', 'status', 'progress_display', 'total_rows', 'processed_rows',
+                       'created_rows', 'rejected_rows', 'throughput_display', 'error', 'created_at',
+                       'started_at', 'finished_at', 'rejections_display')
+    exclude = ('file_name',)
+    inlines = (ImportChunkInline,)
+    actions = ('resume_jobs',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def progress_display(self, obj):
+        return f"{obj.progress()}%"
+
+    progress_display.short_description = "Progress"
+
+    def throughput_display(self, obj):
+        return f"{obj.throughput()} qator/s"
+
+    throughput_display.short_description = "Throughput"
+
+    def rejections_display(self, obj):
+        rejections = [r for chunk in obj.chunks.exclude(rejected_rows=0) for r in chunk.rejections][:1000]
+        return format_html_join('\n', "<div>{}-qator: {} &mdash; {}</div>", rejections) or "-"
+
+    rejections_display.short_description = "Rad etilgan qatorlar"
+
+    def resume_jobs(self, request, queryset):
+        jobs = list(queryset.exclude(status=ImportStatus.DONE).values_list('pk', flat=True))
+        for job_id in jobs:
+            start_import_job.delay(job_id)
+        self.message_user(request, f"{len(jobs)} ta import qayta navbatga qo'yildi.")
+
+    resume_jobs.short_description = "To'xtagan importlarni davom ettirish"
+
+
+@admin.register(SmsJob)
+class SmsJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'progress_display', 'total', 'sent', 'failed', 'throughput_display',
+                    'created_at')
+    list_filter = ('status',)
+    readonly_fields = ('status', 'progress_display', 'total', 'sent', 'failed', 'throughput_display',
+                       'created_at', 'started_at', 'finished_at', 'failures_display')
+    actions = ('retry_failed_deliveries',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def progress_display(self, obj):
+        return f"{obj.progress()}%"
+
+    progress_display.short_description = "Progress"
+
+    def throughput_display(self, obj):
+        return f"{obj.throughput()} sms/s"
+
+    throughput_display.short_description = "Throughput"
+
+    def failures_display(self, obj):
+        failures = obj.deliveries.filter(status=DeliveryStatus.FAILED).values_list('phone', 'error')[:1000]
+        return format_html_join('\n', "<div>{}: {}</div>", failures) or "-"
+
+    failures_display.short_description = "Yuborilmagan SMS lar"
+
+    def retry_failed_deliveries(self, request, queryset):
+        resent = 0
+        # ishlayotgan vazifa o'zi tugaydi; qayta ishga tushirilsa bo'laklar ikki marta navbatga qo'yiladi
+        for job_id in queryset.exclude(status=ImportStatus.RUNNING).values_list('pk', flat=True):
+            count = retry_failed(job_id)
+            if count:
+                resent += count
+                start_sms_job.delay(job_id)
+        self.message_user(request, f"{resent} ta SMS qayta navbatga qo'yildi.")
+
+    retry_failed_deliveries.short_description = "Yuborilmagan SMS larni qayta yuborish"
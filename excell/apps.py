@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ExcellConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'excell'
+
+    def ready(self):
+        from . import views  # noqa: F401  JSON-RPC metodlarini ro'yxatdan o'tkazadi
@@ -1,59 +1,60 @@
 import re
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+STATUSES = ("active", "expired", "inactive")
+_STATUS_SET = frozenset(STATUSES)
+
+# MM-YYYY, MM/YY, YYYY-MM, DD-MM-YY(YY) ... (ajratuvchi: - / .)
+_EXPIRE_RE = re.compile(
+    r'^(?:(\d{4})[-/.](\d{2})'  # YYYY-MM yoki YYYY/MM
+    r'|(\d{2})[-/.](\d{2,4})'  # MM-YYYY, MM/YY, 20.2024 ...
+    r'|\d{2}[-/.](\d{2})[-/.](\d{2,4}))$'  # DD-MM-YY(YY)
+)
+
+
+def _digits(value):
+    return "".join(filter(str.isdigit, value))
+
+
+def _format_expire(month, year):
+    if not (1 <= month <= 12):
+        return None
+
+    if year < 100:
+        year += 2000
+
+    return f"{month:02}/{str(year)[-2:]}"
 
 
 def check_card(card_number):
-    empty = ""
-    for num in card_number:
-        if num.isdigit():
-            empty += num
+    empty = _digits(card_number)
     return empty if len(empty) == 16 else "None"
 
 
 def check_expire(date_str):
-    date_str = date_str.strip()
-
-    patterns = [
-        r'^(\d{2})[-/.](\d{4})$',  # MM-YYYY or MM.YYYY or MM/YYYY
-        r'^(\d{4})[-/.](\d{2})$',  # YYYY-MM or YYYY/MM
-        r'^(\d{2})[-/.](\d{2})$',  # MM-YY or MM/YY
-        r'^(\d{2})[-/.](\d{2})[-/.](\d{2,4})$',  # DD-MM-YY(YY)
-        r'^(\d{2})[-/.](\d{4})$',  # DD-YYYY
-        r'^(\d{2})[-/.](\d{2,4})$'  # fallback: e.g. 20.2024
-    ]
-
-    for pattern in patterns:
-        match = re.match(pattern, date_str)
-        if match:
-            groups = list(map(int, match.groups()))
-            if len(groups) == 2:
-                if groups[0] > 12:
-                    month = groups[1]
-                    year = groups[0]
-                else:
-                    month = groups[0]
-                    year = groups[1]
-            elif len(groups) == 3:
-                _, month, year = groups
-            else:
-                continue
-
-            if not (1 <= month <= 12):
-                return None
-
-            if year < 100:
-                year += 2000
-
-            return f"{month:02}/{str(year)[-2:]}"
+    match = _EXPIRE_RE.match(date_str.strip())
+    if not match:
+        return "None"
 
-    return "None"
+    year_first, month_second, first, second, month, year = match.groups()
+    if month is not None:
+        return _format_expire(int(month), int(year))
+
+    if year_first is not None:
+        first, second = year_first, month_second
+    first, second = int(first), int(second)
+    # 2 ta qism: birinchisi 12 dan katta bo'lsa u yil hisoblanadi
+    if first > 12:
+        return _format_expire(second, first)
+    return _format_expire(first, second)
 
 
 def check_phone(phone):
     """998 99 1205577  991205577"""
-    empty = ""
-    for p in phone:
-        if p.isdigit():
-            empty += p
+    empty = _digits(phone)
     if len(empty) == 9:
         return f"+998{empty}"
     elif len(empty) == 12:
@@ -62,13 +63,9 @@ def check_phone(phone):
 
 
 def check_status(status):
-    st = ["active", "expired", "inactive"]
-    empty = ""
-    for s in status:
-        if s.isalpha():
-            empty += s
-    if empty.lower() in st:
-        return empty.lower()
+    empty = "".join(filter(str.isalpha, status)).lower()
+    if empty in STATUSES:
+        return empty
     return "None"
 
 
@@ -80,3 +77,195 @@ def clean_balance_for_bigint(balance_str):
         return 0
     except (ValueError, TypeError):
         return 0
+
+
+# Ustunlar bo'yicha (vektorli) tekshiruv. Butun ustun "\x00" bilan bitta satrga birlashtiriladi,
+# belgilar bitta bytes.translate chaqiruvida filtrlanadi va sonlar numpy bilan o'qiladi.
+# ASCII bo'lmagan belgili qatorlar (masalan arabcha raqamlar) bir xil natija uchun check_* ga beriladi.
+
+_SEPARATOR = "\x00"
+_ASCII_DIGITS = b"0123456789"
+_ASCII_LETTERS = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+
+def _delete_table(keep):
+    return bytes(code for code in range(1, 256) if code not in keep)
+
+
+_NOT_DIGITS = _delete_table(_ASCII_DIGITS)
+_NOT_LETTERS = _delete_table(_ASCII_LETTERS)
+# check_expire dagi regex uchun: d - raqam, s - ajratuvchi (- / .), x - boshqa belgi
+_SHAPE_TABLE = bytes(
+    0 if code == 0 else ord("d") if code in _ASCII_DIGITS else ord("s") if code in b"-/." else ord("x")
+    for code in range(256)
+)
+
+
+def _strings(column):
+    if hasattr(column, "tolist"):
+        column = column.tolist()
+    return list(map(str, column))
+
+
+def _translate(values, table=None, delete=b""):
+    """
+    Applies bytes.translate to every value with one call.
+    :return: (translated values, indexes of non-ASCII values) or (None, None) when a value
+             contains the separator and the column can not be joined
+    """
+    joined = _SEPARATOR.join(values)
+    parts = joined.encode("ascii", "replace").translate(table, delete).decode("ascii").split(_SEPARATOR)
+    if len(parts) != len(values):
+        return None, None
+    non_ascii = [] if joined.isascii() else [i for i, value in enumerate(values) if not value.isascii()]
+    return parts, non_ascii
+
+
+def _lengths(values):
+    return np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+
+
+def _result(values, check, fast_result, rows):
+    for i in rows:
+        fast_result[i] = check(values[i])
+    return fast_result
+
+
+def _per_row(values, check):
+    return np.array([check(value) for value in values], dtype=object)
+
+
+def clean_card_numbers(column):
+    values = _strings(column)
+    digits, non_ascii = _translate(values, delete=_NOT_DIGITS)
+    if digits is None:
+        return _per_row(values, check_card)
+    result = np.array(digits, dtype=object)
+    result[_lengths(digits) != 16] = "None"
+    return _result(values, check_card, result, non_ascii)
+
+
+def clean_phones(column):
+    values = _strings(column)
+    digits, non_ascii = _translate(values, delete=_NOT_DIGITS)
+    if digits is None:
+        return _per_row(values, check_phone)
+    digits = np.array(digits, dtype=object)
+    length = _lengths(digits)
+    result = np.full(len(values), "None", dtype=object)
+    result[length == 9] = "+998" + digits[length == 9]
+    result[length == 12] = "+" + digits[length == 12]
+    return _result(values, check_phone, result, non_ascii)
+
+
+def clean_statuses(column):
+    values = _strings(column)
+    letters, non_ascii = _translate(values, delete=_NOT_LETTERS)
+    if letters is None:
+        return _per_row(values, check_status)
+    letters = _SEPARATOR.join(letters).lower().split(_SEPARATOR)
+    known = np.fromiter(map(_STATUS_SET.__contains__, letters), dtype=bool, count=len(letters))
+    result = np.full(len(values), "None", dtype=object)
+    result[known] = np.array(letters, dtype=object)[known]
+    return _result(values, check_status, result, non_ascii)
+
+
+# shape: (birinchi son, ikkinchi son) pozitsiyalari va 2 qismli format ekanligi
+_EXPIRE_SHAPES = {
+    "ddddsdd": ((0, 4), (5, 7), True),  # YYYY-MM
+    "ddsdd": ((0, 2), (3, 5), True),  # MM-YY
+    "ddsddd": ((0, 2), (3, 6), True),
+    "ddsdddd": ((0, 2), (3, 7), True),  # MM-YYYY
+    "ddsddsdd": ((3, 5), (6, 8), False),  # DD-MM-YY
+    "ddsddsddd": ((3, 5), (6, 9), False),
+    "ddsddsdddd": ((3, 5), (6, 10), False),  # DD-MM-YYYY
+}
+_SHAPE_IDS = {shape: shape_id for shape_id, shape in enumerate(_EXPIRE_SHAPES)}
+
+
+def _to_int(codes, start, end):
+    """Reads the ASCII digits codes[:, start:end] as numbers."""
+    digits = codes[:, start:end].astype(np.int64) - 48
+    return digits @ (10 ** np.arange(end - start - 1, -1, -1, dtype=np.int64))
+
+
+def _format_expires(month, year):
+    """MM/YY strings for arrays of months and years."""
+    codes = np.empty((len(month), 5), dtype=np.uint8)
+    codes[:, 0], codes[:, 1] = month // 10 + 48, month % 10 + 48
+    codes[:, 2] = ord("/")
+    codes[:, 3], codes[:, 4] = year % 100 // 10 + 48, year % 10 + 48
+    return codes.view("S5").ravel().astype("U5").astype(object)
+
+
+def clean_expires(column):
+    values = _strings(column)
+    stripped = list(map(str.strip, values))
+    shapes, non_ascii = _translate(stripped, table=_SHAPE_TABLE)
+    if shapes is None:
+        return _per_row(values, check_expire)
+
+    shape_ids = np.fromiter(map(_SHAPE_IDS.get, shapes, repeat(-1)), dtype=np.int64, count=len(shapes))
+    stripped = np.array(stripped, dtype=object)
+    result = np.full(len(values), "None", dtype=object)
+    for shape_id, (shape, (first_at, second_at, two_parts)) in enumerate(_EXPIRE_SHAPES.items()):
+        rows = np.flatnonzero(shape_ids == shape_id)
+        if not len(rows):
+            continue
+        matched = "".join(stripped[rows]).encode("ascii")
+        codes = np.frombuffer(matched, dtype=np.uint8).reshape(len(rows), len(shape))
+        month, year = _to_int(codes, *first_at), _to_int(codes, *second_at)
+        if two_parts:
+            # 2 ta qism: birinchisi 12 dan katta bo'lsa u yil hisoblanadi
+            swap = month > 12
+            month, year = np.where(swap, year, month), np.where(swap, month, year)
+        valid = (month >= 1) & (month <= 12)
+        result[rows[~valid]] = None
+        result[rows[valid]] = _format_expires(month[valid], year[valid])
+    return _result(values, check_expire, result, non_ascii)
+
+
+def clean_balances(column):
+    values = _strings(column)
+    joined = _SEPARATOR.join(values).replace(",", "").replace(" ", "")
+    cleaned = list(map(str.strip, joined.split(_SEPARATOR)))
+    if len(cleaned) != len(values):
+        return _per_row(values, clean_balance_for_bigint)
+    # isdigit() rost, lekin int() o'qiy olmaydigan belgilar (masalan '²') ham 0 bo'ladi
+    decimal = np.fromiter(map(str.isdecimal, cleaned), dtype=bool, count=len(cleaned))
+    numbers = np.array(cleaned, dtype=object)[decimal]
+    if not len(numbers):
+        return np.zeros(len(values), dtype=np.int64)
+    # int64 ga sig'maydigan qiymatlar bo'lsa ustun object bo'lib qoladi
+    fits = _lengths(numbers).max() <= 18
+    result = np.zeros(len(values), dtype=np.int64 if fits else object)
+    result[decimal] = numbers.astype(str).astype(np.int64) if fits and joined.isascii() else list(map(int, numbers))
+    return result
+
+
+def validate_columns(frame):
+    """
+    Cleans whole columns at once.
+    :param frame: pandas DataFrame, pyarrow Table or a dict of lists / arrays with any of the
+                  columns card_number, expire, phone, status, balance
+    :return: (cleaned DataFrame, error mask DataFrame) - the mask is True where a value
+             did not pass validation (the check_* functions returned "None"/None)
+    """
+    if hasattr(frame, "to_pandas"):
+        frame = frame.to_pandas()
+    index = frame.index if isinstance(frame, pd.DataFrame) else None
+    cleaners = {
+        "card_number": clean_card_numbers,
+        "expire": clean_expires,
+        "phone": clean_phones,
+        "status": clean_statuses,
+        "balance": clean_balances,
+    }
+    cleaned, errors = {}, {}
+    for name, cleaner in cleaners.items():
+        if name not in frame:
+            continue
+        cleaned[name] = cleaner(frame[name])
+        if name != "balance":
+            errors[name] = pd.isna(cleaned[name]) | (cleaned[name] == "None")
+    return pd.DataFrame(cleaned, index=index), pd.DataFrame(errors, index=index)
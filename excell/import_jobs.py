@@ -0,0 +1,144 @@
+"""
+Background Card imports.
+
+The admin only spools the upload into CARD_IMPORT_DIR and creates an
+ImportJob. `split_job` reads the file once and writes every
+CARD_IMPORT_CHUNK_ROWS rows into a CSV shard with its own ImportChunk; the
+shards are imported by separate `import_chunk` tasks, possibly on different
+workers. A chunk is imported and marked done in one transaction, so an
+interrupted job resumes from the first chunk that was not committed.
+"""
+import csv
+import shutil
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .importer import ImportReport, import_rows, iter_rows
+from .models import ImportChunk, ImportJob, ImportStatus
+
+REJECTIONS_PER_CHUNK = 1000  # bo'lak uchun saqlanadigan rad etilgan qatorlar soni
+
+
+def import_dir():
+    path = Path(settings.CARD_IMPORT_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _shard_dir(job):
+    return import_dir() / f"job_{job.pk}"
+
+
+def spool_upload(uploaded_file):
+    """Copies an uploaded file to CARD_IMPORT_DIR chunk by chunk and creates its ImportJob."""
+    file_name = f"{uuid.uuid4().hex}{Path(uploaded_file.name).suffix.lower()}"
+    with open(import_dir() / file_name, "wb") as out:
+        for chunk in uploaded_file.chunks():
+            out.write(chunk)
+    return ImportJob.objects.create(file_name=file_name, original_name=uploaded_file.name)
+
+
+def iter_file_rows(path):
+    """Yields (row_no, values) from an xlsx or csv file."""
+    path = Path(path)
+    if path.suffix == ".csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            yield from enumerate(csv.reader(f), start=1)
+    else:
+        yield from iter_rows(path)
+
+
+def split_job(job_id):
+    """
+    Writes the job's rows into CSV shards and creates their ImportChunk rows.
+    :return: ids of the chunks to import
+    """
+    job = ImportJob.objects.get(pk=job_id)
+    ImportJob.objects.filter(pk=job.pk).update(
+        status=ImportStatus.RUNNING, started_at=job.started_at or timezone.now(), error=""
+    )
+    if job.chunks.exists():
+        return pending_chunk_ids(job.pk)
+
+    shard_dir = _shard_dir(job)
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    shard_dir.mkdir(parents=True)
+
+    chunks = []
+    shard, writer = None, None
+    try:
+        for row_no, row in iter_file_rows(import_dir() / job.file_name):
+            if writer is None or chunks[-1].end_row - chunks[-1].start_row + 1 >= settings.CARD_IMPORT_CHUNK_ROWS:
+                if shard:
+                    shard.close()
+                file_name = f"{len(chunks)}.csv"
+                shard = open(shard_dir / file_name, "w", newline="", encoding="utf-8")
+                writer = csv.writer(shard)
+                chunks.append(ImportChunk(job=job, start_row=row_no, end_row=row_no, file_name=file_name))
+            writer.writerow([row_no, *("" if value is None else value for value in tuple(row)[:5])])
+            chunks[-1].end_row = row_no
+    finally:
+        if shard:
+            shard.close()
+
+    with transaction.atomic():
+        ImportChunk.objects.bulk_create(chunks)
+        ImportJob.objects.filter(pk=job.pk).update(
+            total_rows=sum(chunk.end_row - chunk.start_row + 1 for chunk in chunks)
+        )
+    finish_if_complete(job.pk)
+    return pending_chunk_ids(job.pk)
+
+
+def pending_chunk_ids(job_id):
+    return list(ImportChunk.objects.filter(job_id=job_id).exclude(status=ImportStatus.DONE)
+                .values_list("pk", flat=True))
+
+
+def _read_shard(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            yield int(row[0]), row[1:]
+
+
+def process_chunk(chunk_id):
+    with transaction.atomic():
+        chunk = ImportChunk.objects.select_for_update().select_related("job").get(pk=chunk_id)
+        if chunk.status == ImportStatus.DONE:
+            return
+        report = import_rows(_read_shard(_shard_dir(chunk.job) / chunk.file_name), report=ImportReport())
+        ImportChunk.objects.filter(pk=chunk.pk).update(
+            status=ImportStatus.DONE,
+            created_rows=report.created,
+            rejected_rows=len(report.rejected),
+            rejections=[list(rejection) for rejection in report.rejected[:REJECTIONS_PER_CHUNK]],
+            finished_at=timezone.now(),
+        )
+        ImportJob.objects.filter(pk=chunk.job_id).update(
+            processed_rows=F("processed_rows") + (chunk.end_row - chunk.start_row + 1),
+            created_rows=F("created_rows") + report.created,
+            rejected_rows=F("rejected_rows") + len(report.rejected),
+        )
+    finish_if_complete(chunk.job_id)
+
+
+def finish_if_complete(job_id):
+    if ImportChunk.objects.filter(job_id=job_id).exclude(status=ImportStatus.DONE).exists():
+        return False
+    finished = ImportJob.objects.filter(pk=job_id, status=ImportStatus.RUNNING).update(
+        status=ImportStatus.DONE, finished_at=timezone.now()
+    )
+    if finished:
+        job = ImportJob.objects.get(pk=job_id)
+        shutil.rmtree(_shard_dir(job), ignore_errors=True)
+        (import_dir() / job.file_name).unlink(missing_ok=True)
+    return True
+
+
+def fail_job(job_id, error):
+    ImportJob.objects.filter(pk=job_id).update(status=ImportStatus.FAILED, error=str(error)[:2000])
@@ -0,0 +1,134 @@
+"""
+Streaming Card import from xlsx workbooks.
+
+Rows are read with openpyxl in read-only mode, cleaned column-wise with
+check_field.validate_columns and written with bulk_create one batch at a time. Existing card numbers are
+fetched once per batch with a single IN query instead of one exists() per
+row. Rejected rows are collected in an ImportReport.
+"""
+from django.conf import settings
+from django.db import transaction
+from openpyxl import load_workbook
+
+from transfer import card_cache, stats
+
+from .check_field import validate_columns
+from .models import Card
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.rejected = []  # [(row_no, card_number, reason), ...]
+
+    def reject(self, row_no, card_number, reason):
+        self.rejected.append((row_no, card_number, reason))
+
+    @property
+    def processed(self):
+        return self.created + len(self.rejected)
+
+
+def iter_rows(file, min_row=1, max_row=None):
+    """Yields (row_no, values) from the active sheet without loading the workbook into memory."""
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        rows = ws.iter_rows(min_row=min_row, max_row=max_row, values_only=True)
+        for row_no, row in enumerate(rows, start=min_row):
+            yield row_no, row
+    finally:
+        wb.close()
+
+
+FIELDS = ("card_number", "expire", "phone", "status", "balance")
+
+
+def _values(row):
+    values = [("" if value is None else str(value)) for value in tuple(row)[:5]]
+    return values + [""] * (5 - len(values))
+
+
+def clean_rows(rows):
+    """
+    Cleans a batch of rows with one validate_columns call.
+    :param rows: list of (row_no, values)
+    :return: list of (row_no, raw_card_number, Card or None, reason or None); header / empty rows are skipped
+    """
+    rows = [(row_no, _values(row)) for row_no, row in rows]
+    rows = [(row_no, values) for row_no, values in rows if values[0] != "id" and any(values)]
+    if not rows:
+        return []
+    cleaned, errors = validate_columns({name: [values[i] for _, values in rows] for i, name in enumerate(FIELDS)})
+
+    result = []
+    columns = zip(cleaned["card_number"], cleaned["expire"], cleaned["phone"], cleaned["status"],
+                  cleaned["balance"], errors["card_number"], errors["expire"])
+    for (row_no, values), (card_number, expire, phone, status, balance, bad_card, bad_expire) in zip(rows, columns):
+        if bad_card:
+            result.append((row_no, values[0], None, "karta raqami noto'g'ri"))
+        elif bad_expire:
+            result.append((row_no, values[0], None, "amal qilish muddati noto'g'ri"))
+        else:
+            result.append((row_no, values[0], Card(
+                card_number=card_number,
+                expire=expire,
+                phone=phone,
+                status=None if status == "None" else status,
+                balance=int(balance),
+            ), None))
+    return result
+
+
+def _flush(batch, report):
+    numbers = [card.card_number for _, card in batch]
+    existing = set(Card.objects.filter(card_number__in=numbers).values_list("card_number", flat=True))
+    new_cards = []
+    for row_no, card in batch:
+        if card.card_number in existing:
+            report.reject(row_no, card.card_number, "allaqachon bazada mavjud")
+        else:
+            new_cards.append(card)
+    with transaction.atomic():
+        Card.objects.bulk_create(new_cards)
+        stats.cards_changed(added=[card.status for card in new_cards])
+        # "karta topilmadi" javobi ham keshlangan bo'lishi mumkin
+        card_cache.invalidate(card.card_number for card in new_cards)
+    report.created += len(new_cards)
+
+
+def import_rows(rows, batch_size=None, report=None):
+    """
+    :param rows: iterable of (row_no, values), e.g. iter_rows(file)
+    :param batch_size: rows per bulk_create, settings.CARD_IMPORT_BATCH_SIZE by default
+    """
+    batch_size = batch_size or settings.CARD_IMPORT_BATCH_SIZE
+    report = report or ImportReport()
+    seen = set()
+    raw = []
+
+    def flush_raw():
+        batch = []
+        for row_no, raw_card_number, card, reason in clean_rows(raw):
+            if reason:
+                report.reject(row_no, raw_card_number, reason)
+            elif card.card_number in seen:
+                report.reject(row_no, card.card_number, "faylda takrorlangan")
+            else:
+                seen.add(card.card_number)
+                batch.append((row_no, card))
+        if batch:
+            _flush(batch, report)
+
+    for row in rows:
+        raw.append(row)
+        if len(raw) >= batch_size:
+            flush_raw()
+            raw = []
+    if raw:
+        flush_raw()
+    return report
+
+
+def import_cards(file, batch_size=None):
+    return import_rows(iter_rows(file), batch_size=batch_size)
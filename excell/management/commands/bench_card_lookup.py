@@ -0,0 +1,48 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from excell.models import Card, CardStatus
+from src.benchmark import Rollback, summarize, time_calls
+
+
+class Command(BaseCommand):
+    help = ("Karta qidirish vaqtini jadval hajmiga qarab o'lchaydi: card_number (unique), "
+            "(card_number, expire) va indekssiz phone ustuni. Ma'lumotlar oxirida o'chiriladi.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+        parser.add_argument('--lookups', type=int, default=2000)
+        parser.add_argument('--scan-lookups', type=int, default=20, help="indekssiz qidiruvlar soni")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        self.stdout.write(f"{'rows':>10} {'lookup':<22} {'p50 ms':>9} {'p99 ms':>9}")
+        try:
+            with transaction.atomic():
+                created = 0
+                for size in sorted(options['sizes']):
+                    Card.objects.bulk_create(
+                        (Card(card_number=f"9{i:015d}", expire="12/30", phone=f"+99890{i:07d}",
+                              status=CardStatus.ACTIVE, balance=1000) for i in range(created, size)),
+                        batch_size=5000,
+                    )
+                    created = size
+                    self._report(size, rng, options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _report(self, size, rng, options):
+        numbers = [rng.randrange(size) for _ in range(options['lookups'])]
+        cases = [
+            ("card_number", lambda i: Card.objects.get(card_number=f"9{i:015d}"), numbers),
+            ("card_number+expire", lambda i: Card.objects.get(card_number=f"9{i:015d}", expire="12/30"), numbers),
+            ("phone (no index)", lambda i: Card.objects.get(phone=f"+99890{i:07d}"),
+             numbers[:options['scan_lookups']]),
+        ]
+        for label, lookup, keys in cases:
+            stats = summarize(time_calls(lookup, [(i,) for i in keys]))
+            self.stdout.write(f"{size:>10} {label:<22} {stats['p50_ms']:>9.3f} {stats['p99_ms']:>9.3f}")
@@ -0,0 +1,70 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from excell.check_field import (
+    check_card, check_expire, check_phone, check_status, clean_balance_for_bigint, validate_columns,
+)
+
+CARD_FORMATS = ("{}", "{} {} {} {}", "{}-{}-{}-{}")
+EXPIRE_FORMATS = ("{m:02}/{y2:02}", "{m:02}-{y4}", "{y4}/{m:02}", "{d:02}.{m:02}.{y4}", "{m:02}.{y2:02}", "13/{y4}")
+PHONE_FORMATS = ("+998 {} {}", "{}{}", "998-{}-{}", "{}")
+STATUSES = ("active", "Active ", "EXPIRED", "in-active", "blocked", "")
+
+
+def make_rows(count, rng):
+    columns = {"card_number": [], "expire": [], "phone": [], "status": [], "balance": []}
+    for _ in range(count):
+        digits = f"{rng.randrange(10 ** 16):016d}"
+        if rng.random() < 0.05:
+            digits = digits[:-1]  # noto'g'ri karta raqami
+        card_format = rng.choice(CARD_FORMATS)
+        columns["card_number"].append(
+            card_format.format(digits) if card_format == "{}" else
+            card_format.format(digits[:4], digits[4:8], digits[8:12], digits[12:])
+        )
+        columns["expire"].append(rng.choice(EXPIRE_FORMATS).format(
+            d=rng.randint(1, 28), m=rng.randint(1, 12), y2=rng.randint(24, 35), y4=rng.randint(2024, 2035)
+        ))
+        columns["phone"].append(rng.choice(PHONE_FORMATS).format(f"{rng.randrange(100):02d}", f"{rng.randrange(10 ** 7):07d}"))
+        columns["status"].append(rng.choice(STATUSES))
+        columns["balance"].append(rng.choice((f"{rng.randrange(10 ** 9):,}", str(rng.randrange(10 ** 6)), "-5", "")))
+    return columns
+
+
+class Command(BaseCommand):
+    help = ("check_field ni qatorma-qator (check_*) va ustun bo'yicha (validate_columns) tekshirish vaqtini "
+            "solishtiradi va natijalar bir xilligini tekshiradi.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        columns = make_rows(options['rows'], random.Random(options['seed']))
+
+        start = time.perf_counter()
+        per_row = {
+            "card_number": [check_card(value) for value in columns["card_number"]],
+            "expire": [check_expire(value) for value in columns["expire"]],
+            "phone": [check_phone(value) for value in columns["phone"]],
+            "status": [check_status(value) for value in columns["status"]],
+            "balance": [clean_balance_for_bigint(value) for value in columns["balance"]],
+        }
+        row_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cleaned, errors = validate_columns(columns)
+        column_seconds = time.perf_counter() - start
+
+        for name, values in per_row.items():
+            if cleaned[name].tolist() != values:
+                raise CommandError(f"{name}: validate_columns natijasi check_* dan farq qiladi")
+
+        rows = options['rows']
+        self.stdout.write(f"{'mode':<10} {'seconds':>9} {'rows/s':>12}")
+        self.stdout.write(f"{'per-row':<10} {row_seconds:>9.3f} {rows / row_seconds:>12,.0f}")
+        self.stdout.write(f"{'columns':<10} {column_seconds:>9.3f} {rows / column_seconds:>12,.0f}")
+        self.stdout.write(f"speedup x{row_seconds / column_seconds:.1f}, "
+                          f"invalid rows: {int(errors.any(axis=1).sum())}")
@@ -0,0 +1,49 @@
+# Prepares Card rows for the unique card_number constraint in 0006.
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+STATUSES = ("active", "inactive", "expired")
+COMPARED_FIELDS = ("expire", "phone", "status", "balance")
+
+
+def dedupe_cards(apps, schema_editor):
+    Card = apps.get_model("excell", "Card")
+
+    # check_field "None" qaytargan qiymatlar haqiqiy NULL bo'ladi
+    Card.objects.filter(card_number__in=["", "None"]).update(card_number=None)
+    Card.objects.exclude(status__in=STATUSES).update(status=None)
+
+    duplicates = (
+        Card.objects.exclude(card_number=None)
+        .values("card_number")
+        .annotate(rows=Count("id"), keep_id=Min("id"))
+        .filter(rows__gt=1)
+    )
+    conflicts = []
+    for duplicate in duplicates.iterator():
+        rows = Card.objects.filter(card_number=duplicate["card_number"])
+        kept = rows.get(id=duplicate["keep_id"])
+        extra = rows.exclude(id=kept.id)
+        # Faqat to'liq bir xil nusxalar o'chiriladi, balansi farq qiladiganlar qo'lda ko'rib chiqiladi
+        if any(getattr(card, f) != getattr(kept, f) for card in extra for f in COMPARED_FIELDS):
+            conflicts.append(duplicate["card_number"])
+            continue
+        extra.delete()
+
+    if conflicts:
+        raise RuntimeError(
+            "Cards with the same number but different data must be merged manually "
+            f"before adding the unique constraint: {', '.join(conflicts[:50])}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excell', '0004_alter_card_balance'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_cards, migrations.RunPython.noop),
+    ]
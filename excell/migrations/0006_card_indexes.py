@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excell', '0005_dedupe_cards'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='card',
+            name='card_number',
+            field=models.CharField(blank=True, max_length=16, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='card',
+            name='status',
+            field=models.CharField(blank=True, choices=[('active', 'Active'), ('inactive', 'Inactive'), ('expired', 'Expired')], max_length=8, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['card_number', 'expire'], name='card_number_expire_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['card_number'], name='card_active_idx'),
+        ),
+    ]
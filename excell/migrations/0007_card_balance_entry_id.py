@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excell', '0006_card_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='balance_entry_id',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -1,23 +1,209 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+class CardStatus(models.TextChoices):
+    ACTIVE = "active", "Active"
+    INACTIVE = "inactive", "Inactive"
+    EXPIRED = "expired", "Expired"
+
+
+class CardQuerySet(models.QuerySet):
+    def with_current_balance(self):
+        """Annotates `ledger_balance` (what current_balance() returns) in the same query."""
+        ledger_entry = self.model._meta.get_field("ledger_entries").related_model
+        pending = (
+            ledger_entry.objects.filter(card=models.OuterRef("pk"), id__gt=models.OuterRef("balance_entry_id"))
+            .values("card")
+            .annotate(total=models.Sum("amount"))
+            .values("total")
+        )
+        return self.annotate(ledger_balance=models.F("balance") + Coalesce(
+            models.Subquery(pending), models.Value(Decimal(0)), output_field=models.DecimalField()
+        ))
 
 
 # Create your models here.
 class Card(models.Model):
-    card_number = models.CharField(max_length=16, blank=True, null=True)
+    card_number = models.CharField(max_length=16, unique=True, blank=True, null=True)
     expire = models.CharField(max_length=5, null=True, blank=True)
     phone = models.CharField(max_length=13, blank=True, null=True)
-    status = models.CharField(max_length=10, blank=True, null=True)  # ENUM bolishi kerak edi
+    status = models.CharField(max_length=8, choices=CardStatus.choices, blank=True, null=True)
     balance = models.DecimalField(default=0.00, max_digits=20, decimal_places=2)
+    # balance ichiga qo'shib bo'lingan oxirgi LedgerEntry id si (balans snapshoti)
+    balance_entry_id = models.BigIntegerField(default=0)
 
     # declined = models.BooleanField(default=False)
 
+    objects = CardQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # card.info karta raqami va amal qilish muddati bo'yicha qidiradi
+            models.Index(fields=["card_number", "expire"], name="card_number_expire_idx"),
+            # faqat aktiv kartalar (hisobotlar, status filtri)
+            models.Index(fields=["card_number"], name="card_active_idx",
+                         condition=models.Q(status=CardStatus.ACTIVE)),
+        ]
+
     def __str__(self):
         return f"{self.card_number}"
 
+    def current_balance(self):
+        """
+        Snapshot balance plus ledger entries written after it. Entries are
+        folded into `balance` by the compact_ledger task.
+        """
+        if hasattr(self, "ledger_balance"):  # with_current_balance() bilan o'qilgan
+            return self.ledger_balance
+        pending = self.ledger_entries.filter(id__gt=self.balance_entry_id).aggregate(
+            total=models.Sum("amount"))["total"]
+        return self.balance + (pending or 0)
+
     def card_result(self):
         return {
             "card_number": f"{self.card_number[:4]}****{self.card_number[-4:]}",
             "expire": self.expire,
-            "balance": float(self.balance),
+            "balance": float(self.current_balance()),
             "status": self.status
         }
+
+
+class ImportStatus(models.TextChoices):
+    PENDING = "pending", "Pending"
+    RUNNING = "running", "Running"
+    DONE = "done", "Done"
+    FAILED = "failed", "Failed"
+
+
+class ImportJob(models.Model):
+    """Card workbook uploaded from the admin and imported by Celery workers."""
+    file_name = models.CharField(max_length=255)  # CARD_IMPORT_DIR ichidagi nom
+    original_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=ImportStatus.choices, default=ImportStatus.PENDING)
+    total_rows = models.IntegerField(default=0)
+    processed_rows = models.IntegerField(default=0)
+    created_rows = models.IntegerField(default=0)
+    rejected_rows = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.pk}: {self.original_name}"
+
+    def progress(self):
+        return round(100 * self.processed_rows / self.total_rows, 1) if self.total_rows else 0.0
+
+    def throughput(self):
+        """Rows per second since the job started."""
+        if not self.started_at:
+            return 0.0
+        end = self.finished_at or timezone.now()
+        elapsed = (end - self.started_at).total_seconds()
+        return round(self.processed_rows / elapsed, 1) if elapsed > 0 else 0.0
+
+    def to_result(self):
+        return {
+            "job_id": self.pk,
+            "file": self.original_name,
+            "status": self.status,
+            "total_rows": self.total_rows,
+            "processed_rows": self.processed_rows,
+            "created_rows": self.created_rows,
+            "rejected_rows": self.rejected_rows,
+            "progress": self.progress(),
+            "rows_per_second": self.throughput(),
+            "error": self.error,
+        }
+
+
+class ImportChunk(models.Model):
+    """A row range of an ImportJob, spooled to its own CSV file and committed as a whole."""
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name="chunks")
+    start_row = models.IntegerField()
+    end_row = models.IntegerField()
+    file_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=ImportStatus.choices, default=ImportStatus.PENDING)
+    created_rows = models.IntegerField(default=0)
+    rejected_rows = models.IntegerField(default=0)
+    rejections = models.JSONField(default=list, blank=True)  # [[row_no, card_number, reason], ...]
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ("job", "start_row")
+        ordering = ("start_row",)
+
+    def __str__(self):
+        return f"{self.job_id}: {self.start_row}-{self.end_row}"
+
+
+class DeliveryStatus(models.TextChoices):
+    PENDING = "pending", "Pending"
+    SENDING = "sending", "Sending"
+    SENT = "sent", "Sent"
+    FAILED = "failed", "Failed"
+
+
+class SmsJob(models.Model):
+    """Balance SMS to the cards selected in the admin, sent in chunks by Celery workers."""
+    status = models.CharField(max_length=10, choices=ImportStatus.choices, default=ImportStatus.PENDING)
+    total = models.IntegerField(default=0)
+    sent = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"SMS #{self.pk}"
+
+    def processed(self):
+        return self.sent + self.failed
+
+    def progress(self):
+        return round(100 * self.processed() / self.total, 1) if self.total else 0.0
+
+    def throughput(self):
+        """Messages per second since the job started."""
+        if not self.started_at:
+            return 0.0
+        end = self.finished_at or timezone.now()
+        elapsed = (end - self.started_at).total_seconds()
+        return round(self.processed() / elapsed, 1) if elapsed > 0 else 0.0
+
+    def to_result(self):
+        return {
+            "job_id": self.pk,
+            "status": self.status,
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "progress": self.progress(),
+            "messages_per_second": self.throughput(),
+        }
+
+
+class SmsDelivery(models.Model):
+    """One recipient of an SmsJob and the result of sending to it."""
+    job = models.ForeignKey(SmsJob, on_delete=models.CASCADE, related_name="deliveries")
+    card = models.ForeignKey(Card, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    phone = models.CharField(max_length=13)
+    balance = models.DecimalField(max_digits=20, decimal_places=2)
+    status = models.CharField(max_length=10, choices=DeliveryStatus.choices, default=DeliveryStatus.PENDING)
+    error = models.TextField(blank=True, default="")
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # SENDING holatida: shu vaqtgacha uni olgan worker yuboradi, keyin boshqasi qayta olishi mumkin
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["job", "status"]),
+        ]
+
+    def __str__(self):
+        return f"{self.job_id}: {self.phone} ({self.status})"
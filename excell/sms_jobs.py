@@ -0,0 +1,138 @@
+"""
+Bulk balance SMS.
+
+The admin action only stores an SmsJob with one SmsDelivery per recipient.
+`split_job` cuts the pending deliveries into SMS_CHUNK_SIZE chunks which are
+sent by separate `send_sms_chunk` tasks. Inside a chunk up to SMS_CONCURRENCY
+messages are in flight at once; every send first takes a token from the
+"eskiz" bucket, so all workers together stay under SMS_RATE_LIMIT messages
+per second. A chunk first claims its deliveries (PENDING -> SENDING for
+SMS_CLAIM_TIMEOUT seconds), so a duplicate or restarted chunk task does not
+send the same SMS twice. Results are written back in small batches, so a
+restarted chunk only sends to recipients that are still pending.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from src.token_bucket import token_bucket
+from .models import DeliveryStatus, ImportStatus, SmsDelivery, SmsJob
+from .send_sms import deliver_sms
+
+RESULT_BATCH_SIZE = 50  # shuncha natijadan keyin bazaga yoziladi
+
+
+def create_job(queryset):
+    """Creates an SmsJob for the cards of the queryset that have a phone number."""
+    job = SmsJob.objects.create()
+    cards = (queryset.exclude(phone__isnull=True).exclude(phone__in=("", "None"))
+             .exclude(card_number__isnull=True).exclude(card_number="")
+             .with_current_balance().values_list("pk", "phone", "ledger_balance"))
+    deliveries = SmsDelivery.objects.bulk_create(
+        (SmsDelivery(job=job, card_id=card_id, phone=phone, balance=balance)
+         for card_id, phone, balance in cards.iterator(chunk_size=settings.SMS_CHUNK_SIZE)),
+        batch_size=settings.SMS_CHUNK_SIZE,
+    )
+    SmsJob.objects.filter(pk=job.pk).update(total=len(deliveries))
+    return job
+
+
+def _unsent(now=None):
+    """:return: filter of deliveries still to send: pending, or claimed by a worker that did not finish"""
+    return Q(status=DeliveryStatus.PENDING) | Q(status=DeliveryStatus.SENDING, locked_until__lt=now or timezone.now())
+
+
+def split_job(job_id):
+    """
+    Marks the job as running.
+    :return: lists of pending delivery ids, one per chunk task
+    """
+    SmsJob.objects.filter(pk=job_id).update(status=ImportStatus.RUNNING)
+    SmsJob.objects.filter(pk=job_id, started_at__isnull=True).update(started_at=timezone.now())
+    ids = list(SmsDelivery.objects.filter(_unsent(), job_id=job_id)
+               .order_by("pk").values_list("pk", flat=True))
+    if not ids:
+        finish_if_complete(job_id)
+    size = settings.SMS_CHUNK_SIZE
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+
+def _send(delivery, bucket):
+    bucket.acquire()
+    try:
+        delivered, error = deliver_sms(delivery.balance, delivery.phone)
+    except requests.RequestException as exc:
+        delivered, error = False, str(exc)[:500]
+    delivery.status = DeliveryStatus.SENT if delivered else DeliveryStatus.FAILED
+    delivery.error = error
+    delivery.sent_at = timezone.now() if delivered else None
+    delivery.locked_until = None
+    return delivery
+
+
+def _save_results(job_id, deliveries):
+    sent = sum(delivery.status == DeliveryStatus.SENT for delivery in deliveries)
+    with transaction.atomic():
+        SmsDelivery.objects.bulk_update(deliveries, ["status", "error", "sent_at", "locked_until"])
+        SmsJob.objects.filter(pk=job_id).update(
+            sent=F("sent") + sent, failed=F("failed") + (len(deliveries) - sent)
+        )
+
+
+def _claim(delivery_ids):
+    """Marks the unsent deliveries of the chunk as SENDING. :return: the deliveries this task must send"""
+    now = timezone.now()
+    with transaction.atomic():
+        # boshqa tranzaksiya olayotgan qatorlar o'tkazib yuboriladi
+        deliveries = list(SmsDelivery.objects.select_for_update(skip_locked=True)
+                          .filter(_unsent(now), pk__in=delivery_ids))
+        SmsDelivery.objects.filter(_unsent(now), pk__in=[delivery.pk for delivery in deliveries]).update(
+            status=DeliveryStatus.SENDING, locked_until=now + timedelta(seconds=settings.SMS_CLAIM_TIMEOUT)
+        )
+    return deliveries
+
+
+def process_chunk(job_id, delivery_ids):
+    deliveries = _claim(delivery_ids)
+    bucket = token_bucket("eskiz", settings.SMS_RATE_LIMIT, settings.SMS_RATE_BURST)
+    done = []
+    # oqimlar faqat HTTP so'rov yuboradi, bazaga asosiy oqim yozadi
+    with ThreadPoolExecutor(max_workers=settings.SMS_CONCURRENCY) as pool:
+        for future in as_completed([pool.submit(_send, delivery, bucket) for delivery in deliveries]):
+            done.append(future.result())
+            if len(done) >= RESULT_BATCH_SIZE:
+                _save_results(job_id, done)
+                done = []
+    if done:
+        _save_results(job_id, done)
+    finish_if_complete(job_id)
+    return len(deliveries)
+
+
+def finish_if_complete(job_id):
+    if SmsDelivery.objects.filter(job_id=job_id, status__in=[DeliveryStatus.PENDING, DeliveryStatus.SENDING]).exists():
+        return False
+    SmsJob.objects.filter(pk=job_id, status=ImportStatus.RUNNING).update(
+        status=ImportStatus.DONE, finished_at=timezone.now()
+    )
+    return True
+
+
+def retry_failed(job_id):
+    """
+    Moves failed deliveries of a job that is not running back to pending.
+    :return: number of deliveries to resend
+    """
+    with transaction.atomic():
+        if not SmsJob.objects.select_for_update().filter(pk=job_id).exclude(status=ImportStatus.RUNNING).exists():
+            return 0
+        count = SmsDelivery.objects.filter(job_id=job_id, status=DeliveryStatus.FAILED).update(
+            status=DeliveryStatus.PENDING, error=""
+        )
+        SmsJob.objects.filter(pk=job_id).update(failed=F("failed") - count, finished_at=None)
+    return count
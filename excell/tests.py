@@ -0,0 +1,227 @@
+import io
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from openpyxl import Workbook
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from excell import check_field, import_jobs, importer, sms_jobs
+from excell.models import Card, CardStatus, DeliveryStatus, ImportChunk, ImportJob, ImportStatus, SmsDelivery, SmsJob
+from notif_worker.tasks import import_chunk
+from transfer import balance
+from transfer.views import create_transfer
+
+
+class SmsJobTests(TestCase):
+    def setUp(self):
+        self.job = SmsJob.objects.create(status=ImportStatus.RUNNING, total=3)
+        self.ids = [SmsDelivery.objects.create(job=self.job, phone=f"+99890000000{i}", balance=100).pk
+                    for i in range(3)]
+
+    def process(self, result=(True, "")):
+        with mock.patch("excell.sms_jobs.deliver_sms", return_value=result) as send:
+            sms_jobs.process_chunk(self.job.pk, self.ids)
+        return send.call_count
+
+    def test_repeated_chunk_does_not_resend(self):
+        self.assertEqual(self.process(), 3)
+        self.assertEqual(self.process(), 0)
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.sent), (ImportStatus.DONE, 3))
+
+    def test_claimed_deliveries_are_skipped_until_the_claim_expires(self):
+        claimed = SmsDelivery.objects.filter(pk=self.ids[0])
+        claimed.update(status=DeliveryStatus.SENDING, locked_until=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(self.process(), 2)
+        self.assertEqual(SmsJob.objects.get(pk=self.job.pk).status, ImportStatus.RUNNING)
+
+        claimed.update(locked_until=timezone.now() - timedelta(seconds=1))  # worker o'lib qolgan
+        self.assertEqual(sms_jobs.split_job(self.job.pk), [[self.ids[0]]])
+        self.assertEqual(self.process(), 1)
+        self.assertEqual(SmsJob.objects.get(pk=self.job.pk).status, ImportStatus.DONE)
+
+    def test_retry_failed_skips_running_jobs(self):
+        self.process(result=(False, "rejected"))
+        SmsJob.objects.filter(pk=self.job.pk).update(status=ImportStatus.RUNNING)
+        self.assertEqual(sms_jobs.retry_failed(self.job.pk), 0)
+
+        SmsJob.objects.filter(pk=self.job.pk).update(status=ImportStatus.DONE)
+        self.assertEqual(sms_jobs.retry_failed(self.job.pk), 3)
+        self.assertEqual(SmsJob.objects.get(pk=self.job.pk).failed, 0)
+
+
+class CardAdminTests(TestCase):
+    def setUp(self):
+        allowed = mock.patch("src.middleware.permission_ip.ALLOWED_IPS", ["127.0.0.1"])
+        allowed.start()
+        self.addCleanup(allowed.stop)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+        self.sender = Card.objects.create(card_number="8600000000000001", expire="12/30", phone="+998901112233",
+                                          status=CardStatus.ACTIVE, balance=100000)
+        Card.objects.create(card_number="8600000000000002", expire="12/30", phone="+998901112244",
+                            status=CardStatus.ACTIVE, balance=0)
+        with mock.patch("transfer.views.otp_code", return_value=123456):
+            transfer = create_transfer("t1", "8600000000000001", "12/30", "+998901112233", "8600000000000002",
+                                       "+998901112244", 1000, "860")
+        balance.confirm(transfer)  # hali compact_ledger qilinmagan yozuvlar
+
+    def test_balance_is_read_only(self):
+        url = reverse("admin:excell_card_change", args=[self.sender.pk])
+        self.assertNotIn("balance", self.client.get(url).context["adminform"].form.fields)
+        response = self.client.post(url, {
+            "card_number": "8600000000000001", "expire": "12/30", "phone": "+998901112233",
+            "status": CardStatus.ACTIVE, "balance": "500", "balance_entry_id": "0",
+        })
+        self.assertEqual(response.status_code, 302)  # saqlandi, balance maydonlari e'tiborsiz qoldi
+        self.sender.refresh_from_db()
+        self.assertEqual((self.sender.balance, self.sender.balance_entry_id), (100000, 0))
+        self.assertEqual(self.sender.current_balance(), 99000)
+
+    def test_change_list_shows_current_balance(self):
+        response = self.client.get(reverse("admin:excell_card_changelist"))
+        balances = {card.card_number: card.ledger_balance for card in response.context["cl"].result_list}
+        self.assertEqual(balances, {"8600000000000001": 99000, "8600000000000002": 1000})
+
+
+class CheckFieldTests(SimpleTestCase):
+    """The column cleaners of validate_columns must give what the per-row check_* functions give."""
+    CASES = {
+        "card_number": (check_field.clean_card_numbers, check_field.check_card, [
+            "8600123412341234", "8600 1234 1234 1234", " 8600-1234-1234-1234 ", "860012341234123",
+            "86001234123412345", "", "abc", "8600123412341234.0", "٨٦٠٠١٢٣٤١٢٣٤١٢٣٤", 8600123412341234,
+        ]),
+        "phone": (check_field.clean_phones, check_field.check_phone, [
+            "+998901112233", "998901112233", "901112233", "90 111 22 33", "(90) 111-22-33", "+998 90 111 22 3",
+            "99890111223344", "", "None", "٩٠١١١٢٢٣٣", 998901112233,
+        ]),
+        "status": (check_field.clean_statuses, check_field.check_status, [
+            "active", "Active", "ACTIVE", " inactive ", "expired!", "in active", "blocked", "", "None", "actívé",
+        ]),
+        "expire": (check_field.clean_expires, check_field.check_expire, [
+            "12/30", "12.30", "12-2030", "2030-12", "2030/12", "31.12.2030", "01-12-30", "13/30", "00/30", "30/12",
+            "12/2030/1", "1/30", " 12/30 ", "12 30", "", "None", "١٢/٣٠", "12/300",
+        ]),
+        "balance": (check_field.clean_balances, check_field.clean_balance_for_bigint, [
+            "100", "1,000", "1 000 000", " 42 ", "-5", "1.5", "", "abc", "²", 7, "123456789012345678901",
+        ]),
+    }
+
+    def assert_same(self, cleaner, check, values):
+        self.assertEqual(list(cleaner(values)), [check(str(value)) for value in values])
+
+    def test_cleaners_match_per_row_checks(self):
+        for name, (cleaner, check, values) in self.CASES.items():
+            with self.subTest(name):
+                self.assert_same(cleaner, check, values)
+                # ajratuvchi belgili qiymat: ustun qatorma-qator tekshiriladi
+                self.assert_same(cleaner, check, values + ["1\x002"])
+
+    def test_validate_columns_error_mask(self):
+        values = {name: values[:8] for name, (_, _, values) in self.CASES.items()}
+        cleaned, errors = check_field.validate_columns(values)
+        for name, (_, check, column) in self.CASES.items():
+            expected = [check(str(value)) for value in column[:8]]
+            with self.subTest(name):
+                self.assertEqual(list(cleaned[name]), expected)
+                if name != "balance":
+                    self.assertEqual(list(errors[name]), [value in ("None", None) for value in expected])
+
+
+def workbook(rows):
+    """Small in-memory xlsx with the admin template's header row."""
+    wb = Workbook()
+    wb.active.append(["id", "expire", "phone", "status", "balance"])
+    for row in rows:
+        wb.active.append(row)
+    file = io.BytesIO()
+    wb.save(file)
+    file.seek(0)
+    return file
+
+
+IMPORT_ROWS = [
+    ["8600 0000 0000 0011", "12/30", "+998 90 111 22 33", "active", "1 000"],
+    ["8600000000000012", "12.30", "901112244", "Inactive", 500],
+    ["860000000000001", "12/30", "901112255", "active", 0],  # 15 xonali
+    ["8600000000000013", "13/30", "901112266", "active", 0],  # oy noto'g'ri
+    ["8600-0000-0000-0011", "12/30", "901112277", "active", 0],  # faylda takrorlangan
+    ["8600000000000001", "12/30", "901112288", "active", 0],  # bazada bor
+    [None, None, None, None, None],
+    ["8600000000000014", "01/31", "", "expired", ""],
+]
+
+
+class ImporterTests(TestCase):
+    def setUp(self):
+        Card.objects.create(card_number="8600000000000001", expire="12/30", phone="+998901112233",
+                            status=CardStatus.ACTIVE, balance=100)
+
+    def test_import_counts_and_rejections(self):
+        report = importer.import_cards(workbook(IMPORT_ROWS), batch_size=3)
+        self.assertEqual(report.created, 3)
+        self.assertEqual(report.rejected, [
+            (4, "860000000000001", "karta raqami noto'g'ri"),
+            (5, "8600000000000013", "amal qilish muddati noto'g'ri"),
+            (6, "8600000000000011", "faylda takrorlangan"),
+            (7, "8600000000000001", "allaqachon bazada mavjud"),
+        ])
+        cards = {card.card_number: (card.phone, card.status, card.balance) for card in Card.objects.all()}
+        self.assertEqual(cards, {
+            "8600000000000001": ("+998901112233", CardStatus.ACTIVE, 100),
+            "8600000000000011": ("+998901112233", CardStatus.ACTIVE, 1000),
+            "8600000000000012": ("+998901112244", CardStatus.INACTIVE, 500),
+            "8600000000000014": ("None", CardStatus.EXPIRED, 0),  # eski import kabi, SMS yuborishda o'tkaziladi
+        })
+
+    def test_reimport_rejects_every_card_as_existing(self):
+        importer.import_cards(workbook(IMPORT_ROWS))
+        report = importer.import_cards(workbook(IMPORT_ROWS))
+        self.assertEqual(report.created, 0)
+        self.assertEqual(Card.objects.count(), 4)
+        self.assertEqual([reason for *_, reason in report.rejected].count("allaqachon bazada mavjud"), 4)
+
+
+
+@override_settings(CARD_IMPORT_CHUNK_ROWS=3)
+class ImportJobTests(TestCase):
+    def setUp(self):
+        Card.objects.create(card_number="8600000000000001", expire="12/30", phone="+998901112233",
+                            status=CardStatus.ACTIVE, balance=100)
+        import_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(import_dir.cleanup)
+        overridden = override_settings(CARD_IMPORT_DIR=import_dir.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.job = import_jobs.spool_upload(SimpleUploadedFile("cards.xlsx", workbook(IMPORT_ROWS).read()))
+
+    def test_interrupted_job_resumes_from_unfinished_chunks(self):
+        chunk_ids = import_jobs.split_job(self.job.pk)
+        self.assertEqual([(chunk.start_row, chunk.end_row) for chunk in ImportChunk.objects.filter(job=self.job)],
+                         [(1, 3), (4, 6), (7, 9)])
+        import_chunk.apply(args=[chunk_ids[0]])
+        import_chunk.apply(args=[chunk_ids[1]])
+        # oxirgi bo'lak yozilayotganda worker yiqildi: bo'lak tranzaksiyasi bekor bo'ladi
+        with mock.patch("excell.importer.stats.cards_changed", side_effect=RuntimeError("worker lost")), \
+                self.assertLogs("celery.app.trace", "ERROR"):
+            import_chunk.apply(args=[chunk_ids[2]])
+        job = ImportJob.objects.get(pk=self.job.pk)
+        self.assertEqual((job.status, job.processed_rows, job.created_rows), (ImportStatus.FAILED, 6, 2))
+        self.assertEqual(Card.objects.count(), 3)
+
+        self.assertEqual(import_jobs.split_job(self.job.pk), [chunk_ids[2]])
+        for chunk_id in chunk_ids:  # tugagan bo'laklar qayta kelsa ham o'tkazib yuboriladi
+            import_chunk.apply(args=[chunk_id])
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportStatus.DONE)
+        self.assertEqual((job.total_rows, job.processed_rows, job.created_rows, job.rejected_rows), (9, 9, 3, 4))
+        self.assertEqual(Card.objects.count(), 4)
+        self.assertEqual(list(ImportChunk.objects.filter(job=job).values_list("created_rows", "rejected_rows")),
+                         [(2, 0), (0, 3), (1, 1)])
+        self.assertFalse(any(Path(import_jobs.import_dir()).iterdir()))  # fayl va bo'laklar o'chirildi
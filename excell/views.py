@@ -1,3 +1,20 @@
-from django.shortcuts import render
+from jsonrpcserver import Error, Success, method
 
-# Create your views here.
+from .models import ImportJob
+
+
+@method(name="import.status")
+def import_status(context, job_id):
+    """
+    ------------------------------------------------------------------------------------
+    Returns progress of a background card import started from the admin panel.
+    ------------------------------------------------------------------------------------
+    :param context: The request context or session object.
+    :param job_id: ImportJob id shown in the admin. job_id -> this is the type of variable int
+    :return: {"job_id", "status", "total_rows", "processed_rows", "created_rows",
+              "rejected_rows", "progress", "rows_per_second", ...}
+    """
+    try:
+        return Success(ImportJob.objects.get(pk=job_id).to_result())
+    except (ImportJob.DoesNotExist, ValueError):
+        return Error(message="import job not found!", code=404)
@@ -1,8 +1,32 @@
+"""
+JSON-RPC request logging.
+
+`log_request_response` only collects the raw call data (method, ip, params,
+result, duration) into a RequestLogEntry and hands the record to a
+QueueRotatingFileHandler. Masking, JSON encoding and the file write happen
+in the handler's QueueListener thread, so a logged call costs one queue put.
+Successful calls are sampled per method (REQUEST_LOG_SAMPLING); exceptions
+and JSON-RPC errors are always logged.
+"""
+import asyncio
+import atexit
 import functools
+import inspect
+import json
 import logging
+import os
+import queue
+import random
+import threading
 import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from jsonrpcserver import Error
+from oslash.either import Left
 
 
 class CustomFormatter(logging.Formatter):
@@ -14,81 +38,257 @@ class CustomFormatter(logging.Formatter):
         return super().format(record)
 
 
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; a RequestLogEntry in `record.rpc` is masked and merged in."""
+    _second = None
+    _second_text = ""
+
+    def timestamp(self, created):
+        # sekund qismi bir marta formatlanadi, har yozuvga faqat millisekund qo'shiladi
+        second = int(created)
+        if second != self._second:
+            self._second_text = datetime.fromtimestamp(second, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+            self._second = second
+        return f"{self._second_text}.{int((created - second) * 1000):03d}Z"
+
+    def format(self, record):
+        # RotatingFileHandler.shouldRollover ham format() ni chaqiradi: natija yozuvda saqlanadi
+        cached = record.__dict__.get("_json")
+        if cached is not None:
+            return cached
+        data = {
+            "ts": self.timestamp(record.created),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry = getattr(record, "rpc", None)
+        if entry is not None:
+            data.update(entry.to_dict())
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        record._json = json.dumps(data, default=str)
+        return record._json
+
+
+class JsonLinesFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler for the listener thread: counts written characters
+    itself instead of tell() and stat() on every record, and flushes only
+    when the queue it drains is empty, so a backlog is written in large writes.
+    """
+
+    def __init__(self, filename, pending=None, **kwargs):
+        self.pending = pending
+        self.size = 0
+        super().__init__(filename, **kwargs)
+
+    def _open(self):
+        stream = super()._open()
+        self.size = os.path.getsize(self.baseFilename)
+        return stream
+
+    def shouldRollover(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        return self.maxBytes > 0 and self.size > 0 and self.size + len(self.format(record)) + 1 > self.maxBytes
+
+    def emit(self, record):
+        super().emit(record)
+        self.size += len(self.format(record)) + 1  # ensure_ascii: belgilar soni = baytlar soni
+
+    def flush(self):
+        if self.pending is None or self.pending.empty():
+            super().flush()
+
+
+class QueueRotatingFileHandler(QueueHandler):
+    """
+    Puts records on a bounded in-memory queue; a QueueListener thread writes
+    them with a RotatingFileHandler. The listener is started on first use and
+    again after fork (celery prefork, gunicorn). When the queue is full the
+    record is dropped and counted in `dropped` instead of blocking the request.
+    """
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, encoding="utf-8", queue_size=10000):
+        super().__init__(queue.SimpleQueue())
+        self.filename = filename
+        self.max_bytes = maxBytes
+        self.backup_count = backupCount
+        self.encoding = encoding
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.stop)
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:  # fork: ota jarayonning oqimi bu yerda yo'q
+                self.queue = queue.SimpleQueue()
+            target = JsonLinesFileHandler(self.filename, pending=self.queue, maxBytes=self.max_bytes,
+                                          backupCount=self.backup_count, encoding=self.encoding, delay=True)
+            target.setFormatter(self.formatter or JsonFormatter())
+            self._listener = QueueListener(self.queue, target, respect_handler_level=False)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        """Writes out the queued records and stops the listener thread."""
+        with self._start_lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+                for handler in self._listener.handlers:
+                    handler.close()
+            self._listener, self._pid = None, None
+
+    def prepare(self, record):
+        # formatlash listener oqimida bajariladi
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        if self.queue.qsize() >= self.queue_size:
+            self.dropped += 1
+        else:
+            self.queue.put_nowait(record)
+
+    def close(self):
+        self.stop()
+        super().close()
+
+
+def mask_card(card_number):
+    card_number = str(card_number)
+    return card_number[:4] + '****' + card_number[-4:]
+
+
+def _masked(name, value):
+    if value is None:
+        return None
+    if "card_number" in name:
+        return mask_card(value)
+    if name == "otp":
+        return "******"
+    return value
+
+
+class RequestLogEntry:
+    """Raw data of one JSON-RPC call; masked and serialized only when the record is written."""
+    __slots__ = ("method", "ip", "arg_names", "args", "kwargs", "result", "duration")
+
+    def __init__(self, method, ip, arg_names, args, kwargs, result, duration):
+        self.method = method
+        self.ip = ip
+        self.arg_names = arg_names
+        self.args = args
+        self.kwargs = kwargs
+        self.result = result
+        self.duration = duration
+
+    def to_dict(self):
+        params = dict(zip(self.arg_names, self.args), **self.kwargs)
+        data = {
+            "method": self.method,
+            "ip": self.ip,
+            "ext_id": params.get("ext_id", "N/A"),
+            "params": {name: _masked(name, value) for name, value in params.items()},
+            "ms": round(self.duration * 1000, 3),
+        }
+        if isinstance(self.result, Left):
+            data["error"] = {"code": self.result._error.code, "message": self.result._error.message}
+        elif self.result is not None:
+            value = getattr(self.result, "_value", self.result)  # Success -> SuccessResult(result)
+            data["result"] = getattr(value, "result", value)
+        return data
+
+
 logging.basicConfig(
     level=logging.INFO,
 )
 logger = logging.getLogger('custom')
 
 
+def _client_ip(context):
+    meta = getattr(context, "META", None)
+    if not meta:
+        return 'unknown'
+    ip_address = meta.get('REMOTE_ADDR')
+    if not ip_address:
+        ip_address = meta.get('HTTP_X_FORWARDED_FOR', 'unknown').split(',')[0].strip()
+    return ip_address
+
+
+_sample_rates = {}
+
+
+@receiver(setting_changed)
+def _reset_sample_rates(setting, **kwargs):
+    if setting.startswith("REQUEST_LOG_"):
+        _sample_rates.clear()
+
+
+def _sampled(name):
+    rate = _sample_rates.get(name)
+    if rate is None:
+        rate = _sample_rates[name] = settings.REQUEST_LOG_SAMPLING.get(name, settings.REQUEST_LOG_SAMPLE_RATE)
+    return rate >= 1 or random.random() < rate
+
+
+def _log(name, arg_names, context, args, kwargs, result, start, exc=None):
+    level = logging.INFO if exc is None else logging.ERROR
+    if not logger.isEnabledFor(level):
+        return
+    entry = RequestLogEntry(name, _client_ip(context), arg_names, args, kwargs, result, time.perf_counter() - start)
+    # logger.info() dagi findCaller (stack bo'ylab qidirish) kerak emas: yozuv to'g'ridan-to'g'ri yaratiladi
+    record = logger.makeRecord(
+        logger.name, level, __file__, 0, "rpc %s failed: %s" if exc else "rpc %s", (name, exc) if exc else (name,),
+        (type(exc), exc, exc.__traceback__) if exc else None, func=name, extra={'rpc': entry, 'ip': entry.ip},
+    )
+    logger.handle(record)
+
+
 def log_request_response(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        start_time = time.time()
-
-        context = args[0] if args else None
-
-        ip_address = 'unknown'
-        if context:
-            ip_address = context.META.get('REMOTE_ADDR', 'unknown')
-            if not ip_address or ip_address == 'unknown':
-                ip_address = context.META.get('HTTP_X_FORWARDED_FOR', 'unknown')
-                if ip_address:
-                    ip_address = ip_address.split(',')[0].strip()
-
-        params = {}
-        if len(args) > 1:
-            params = args[1]
-            if len(args) > 2:
-                params = {
-                    'card_number': args[1],
-                    'expire': args[2]
-                }
-
-        ext_id = params.get('ext_id', 'N/A') if isinstance(params, dict) else 'N/A'
+    """
+    Logs a JSON-RPC method called with the request as context. Exceptions are
+    logged and returned as a 500 error, as before. Works for sync and async methods.
+    """
+    name = func.__name__
+    # context dan keyingi pozitsion argumentlar nomlari (params ro'yxat bo'lib kelganda)
+    arg_names = tuple(inspect.signature(func).parameters)[1:]
 
+    def finish(context, args, kwargs, start, result):
+        if isinstance(result, Left) or _sampled(name):
+            _log(name, arg_names, context, args, kwargs, result, start)
+        return result
+
+    def fail(context, args, kwargs, start, exc):
+        _log(name, arg_names, context, args, kwargs, None, start, exc=exc)
+        return Error(code=500, message=f"{str(exc)}")
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(context, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = await func(context, *args, **kwargs)
+            except Exception as exc:
+                return fail(context, args, kwargs, start, exc)
+            return finish(context, args, kwargs, start, result)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(context, *args, **kwargs):
+        start = time.perf_counter()
         try:
-            response = func(*args, **kwargs)
-            processing_time = time.time() - start_time
-            sender_card_number = kwargs.get('sender_card_number', '')
-            receiver_card_number = kwargs.get('receiver_card_number', '')
-            request = {}
-            if sender_card_number and receiver_card_number:
-                request = {
-                    "ext_id": kwargs.get('ext_id'),
-                    "sender_card_number": sender_card_number[:4] + '****' + sender_card_number[-4:],
-                    "sender_card_expiry": kwargs.get("sender_card_expiry"),
-                    "sender_phone": kwargs.get("sender_phone"),
-                    "receiver_card_number": receiver_card_number[:4] + '****' + receiver_card_number[-4:],
-                    "receiver_phone": kwargs.get("receiver_phone"),
-                    "sending_amount": kwargs.get("sending_amount"),
-                    "currency": kwargs.get("currency")
-                }
-            elif kwargs['ext_id'] and kwargs['otp']:
-                request = {
-                    "ext_id": kwargs.get('ext_id'),
-                    "otp": "******"
-                }
-            elif kwargs['ext_id']:
-                request = {
-                    "ext_id": kwargs.get('ext_id')
-                }
-
-            if hasattr(response, 'message') and hasattr(response, 'code'):
-                response_str = f"Xato: {response.message} (code: {response.code})"
-            else:
-                response_str = str(response)
-            logger.info(
-                f"Method: {func.__name__}, Request: {request}, "
-                f"Response: {response_str}, Time: {processing_time:.3f}s",
-                extra={'ip': ip_address, 'ext_id': ext_id}
-            )
-            return response
-        except Exception as e:
-            processing_time = time.time() - start_time
-            logger.error(
-                f"Method: {func.__name__}, Error: {str(e)}, Time: {processing_time:.3f}s",
-                extra={'ip': ip_address, 'ext_id': ext_id}
-            )
-            return Error(code=500, message=f"{str(e)}")
+            result = func(context, *args, **kwargs)
+        except Exception as exc:
+            return fail(context, args, kwargs, start, exc)
+        return finish(context, args, kwargs, start, result)
 
     return wrapper
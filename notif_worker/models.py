@@ -0,0 +1,37 @@
+from django.db import models
+
+
+class OutboxStatus(models.TextChoices):
+    PENDING = "pending", "Pending"
+    SENDING = "sending", "Sending"
+    SENT = "sent", "Sent"
+    FAILED = "failed", "Failed"
+
+
+class OutboxMessage(models.Model):
+    """
+    Telegram message waiting for delivery. Rows are written in the same
+    transaction as the business change and delivered by `deliver_message`.
+    `text` is Fernet-encrypted (it holds OTP codes) and is cleared once the
+    message is sent or failed for good.
+    """
+    chat_id = models.CharField(max_length=50)
+    text = models.TextField(blank=True, default="")
+    status = models.CharField(max_length=10,
+                              choices=OutboxStatus.choices,
+                              default=OutboxStatus.PENDING)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # shu vaqtgacha xabar vazifasi navbatda yoki yuborilmoqda; o'tib ketsa requeue_pending_messages qayta qo'yadi
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+            models.Index(fields=["status", "locked_until"]),
+        ]
+
+    def __str__(self):
+        return f"{self.pk} ({self.status})"
@@ -0,0 +1,41 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+
+from notif_worker.models import OutboxMessage
+from notif_worker.tasks import schedule_delivery
+from transfer.check_card.fernet import cipher
+from transfer.check_card.send_otp_telegram import DEFAULT_CHAT_ID, OTP_MESSAGE
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_message(text, chat_id=DEFAULT_CHAT_ID):
+    """
+    Stores the message in the outbox and schedules delivery once the current
+    transaction commits, so a rolled back transfer never sends its OTP.
+    """
+    message = OutboxMessage.objects.create(
+        chat_id=str(chat_id),
+        # OTP bazada ochiq saqlanmaydi; matnni faqat deliver_message ochadi
+        text=cipher.encrypt(text.encode()).decode(),
+        locked_until=timezone.now() + timedelta(seconds=settings.OUTBOX_REQUEUE_AFTER),
+    )
+    transaction.on_commit(lambda: _schedule(message.pk))
+    return message
+
+
+def enqueue_otp(otp):
+    return enqueue_message(OTP_MESSAGE.format(otp=otp))
+
+
+def _schedule(message_id):
+    try:
+        schedule_delivery(message_id)
+    except OperationalError:
+        # Broker ishlamayapti - xabar outbox'da qoladi, requeue_pending_messages qayta yuboradi
+        logger.exception("Could not schedule outbox message %s", message_id)
@@ -1,13 +1,182 @@
+import random
+from datetime import timedelta
+
+import requests
 from celery import shared_task
+from cryptography.fernet import InvalidToken
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F, Q
+from django.utils import timezone
 
-from excell.models import Card
+from excell import sms_jobs
+from excell.import_jobs import fail_job, process_chunk, split_job
+from excell.models import ImportChunk
+from notif_worker.models import OutboxMessage, OutboxStatus
+from transfer.check_card.fernet import cipher
+from transfer.check_card.rate_store import refresh_rates
 from transfer.check_card.send_otp_telegram import send_otp
-from transfer.models import Transfer
+from transfer import stats
+from transfer.ledger import compact_ledger
 
 
 @shared_task
 def send_daily_report():
-    total_cards = Card.objects.count()
-    total_transfers = Transfer.objects.count()
-    message = f"📊 Daily Report:\n\n🪪 Total Cards: {total_cards}\n💸 Total Transfers: {total_transfers}"
-    send_otp(message)
+    # COUNT(*) o'rniga transfer.stats hisoblagichlari o'qiladi
+    totals = stats.totals()
+    lines = [
+        "📊 Daily Report:\n",
+        f"🪪 Total Cards: {totals['cards']}",
+        f"✅ Active Cards: {totals['active_cards']}",
+        f"💸 Total Transfers: {totals['transfers']}",
+        *(f"  • {state}: {count}" for state, count in totals['transfers_by_state'].items()),
+    ]
+    if totals['volume_by_currency']:
+        lines.append("💰 Confirmed volume:")
+        lines.extend(f"  • {currency}: {amount}" for currency, amount in sorted(totals['volume_by_currency'].items()))
+    send_otp("\n".join(lines))
+
+
+@shared_task
+def reconcile_stats():
+    return stats.reconcile(days=settings.STATS_RECONCILE_DAYS)
+
+
+@shared_task
+def refresh_currency_rates():
+    return refresh_rates()
+
+
+@shared_task
+def compact_ledger_entries():
+    return compact_ledger()
+
+
+def _backoff(retries):
+    # Exponential backoff with full jitter: 0..min(cap, base * 2^n)
+    ceiling = min(settings.OUTBOX_RETRY_BACKOFF_MAX, settings.OUTBOX_RETRY_BACKOFF * 2 ** retries)
+    return random.uniform(0, ceiling)
+
+
+def schedule_delivery(message_id):
+    deliver_message.apply_async(
+        args=[message_id],
+        queue=settings.OTP_QUEUE,
+        priority=settings.OTP_QUEUE_PRIORITY,
+    )
+
+
+@shared_task(bind=True, acks_late=True, max_retries=None)
+def deliver_message(self, message_id):
+    """
+    Delivers one outbox message to Telegram. Failures are retried with
+    backoff; after OUTBOX_MAX_RETRIES the message is marked as failed.
+    The row is claimed (PENDING -> SENDING with a lease) before sending, so a
+    duplicate task of the same message does nothing.
+    """
+    now = timezone.now()
+    claimable = Q(status=OutboxStatus.PENDING) | Q(status=OutboxStatus.SENDING, locked_until__lt=now)
+    claimed = OutboxMessage.objects.filter(claimable, pk=message_id).update(
+        status=OutboxStatus.SENDING, locked_until=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS))
+    if not claimed:
+        # Allaqachon yuborilgan, boshqa worker yubormoqda yoki o'chirilgan
+        return
+    message = OutboxMessage.objects.get(pk=message_id)
+
+    try:
+        delivered = send_otp(_text(message), chat_id=message.chat_id)
+        error = "" if delivered else "telegram rejected the message"
+    except requests.RequestException as exc:
+        delivered, error = False, str(exc)
+
+    sending = OutboxMessage.objects.filter(pk=message.pk, status=OutboxStatus.SENDING)
+    if delivered:
+        sending.update(status=OutboxStatus.SENT, sent_at=timezone.now(), text="", locked_until=None,
+                       attempts=F("attempts") + 1, last_error="")
+        return
+
+    # send_otp returns None for messages that are too long, retrying will not help
+    if delivered is None or self.request.retries >= settings.OUTBOX_MAX_RETRIES:
+        sending.update(status=OutboxStatus.FAILED, text="", locked_until=None, attempts=F("attempts") + 1,
+                       last_error=error or "message too long")
+        return
+
+    countdown = _backoff(self.request.retries)
+    # qayta urinish kutilayotganda requeue_pending_messages uni qayta qo'ymasin
+    sending.update(status=OutboxStatus.PENDING, attempts=F("attempts") + 1, last_error=error,
+                   locked_until=timezone.now() + timedelta(seconds=countdown + settings.OUTBOX_REQUEUE_AFTER))
+    raise self.retry(countdown=countdown)
+
+
+def _text(message):
+    try:
+        return cipher.decrypt(message.text.encode()).decode()
+    except InvalidToken:
+        return message.text  # shifrlashdan oldin yozilgan qator
+
+
+@shared_task
+def requeue_pending_messages():
+    """
+    Re-schedules messages whose lease has expired: the delivery task never
+    ran (e.g. the broker was unavailable when the transfer was committed) or
+    the worker sending it died. The lease is renewed first, so the next run
+    does not schedule them again.
+    """
+    now = timezone.now()
+    expired = Q(status__in=[OutboxStatus.PENDING, OutboxStatus.SENDING]) & (
+        Q(locked_until__lt=now)
+        # locked_until maydonidan oldin yaratilgan qatorlar
+        | Q(locked_until__isnull=True, created_at__lt=now - timedelta(seconds=settings.OUTBOX_REQUEUE_AFTER))
+    )
+    message_ids = list(OutboxMessage.objects.filter(expired).values_list("pk", flat=True)[:1000])
+    lease = now + timedelta(seconds=settings.OUTBOX_REQUEUE_AFTER)
+    requeued = 0
+    for message_id in message_ids:
+        # parallel ishga tushgan requeue bilan bir xabar ikki marta qo'yilmasin
+        if OutboxMessage.objects.filter(expired, pk=message_id).update(locked_until=lease):
+            schedule_delivery(message_id)
+            requeued += 1
+    return requeued
+
+
+@shared_task
+def start_import_job(job_id):
+    """
+    Splits an uploaded workbook into chunks and fans them out to workers.
+    Running it again for an interrupted job only re-enqueues unfinished chunks.
+    """
+    try:
+        chunk_ids = split_job(job_id)
+    except Exception as exc:
+        fail_job(job_id, exc)
+        raise
+    for chunk_id in chunk_ids:
+        import_chunk.delay(chunk_id)
+    return len(chunk_ids)
+
+
+@shared_task(bind=True, max_retries=5)
+def import_chunk(self, chunk_id):
+    try:
+        process_chunk(chunk_id)
+    except IntegrityError as exc:
+        # Boshqa bo'lak shu karta raqamini parallel yozdi; qayta urinishda u "mavjud" deb rad etiladi
+        raise self.retry(exc=exc, countdown=_backoff(self.request.retries))
+    except Exception as exc:
+        fail_job(ImportChunk.objects.values_list("job_id", flat=True).get(pk=chunk_id), exc)
+        raise
+
+
+@shared_task
+def start_sms_job(job_id):
+    """Fans the pending deliveries of an SmsJob out to `send_sms_chunk` tasks."""
+    chunks = sms_jobs.split_job(job_id)
+    for delivery_ids in chunks:
+        send_sms_chunk.delay(job_id, delivery_ids)
+    return len(chunks)
+
+
+@shared_task(acks_late=True)
+def send_sms_chunk(job_id, delivery_ids):
+    return sms_jobs.process_chunk(job_id, delivery_ids)
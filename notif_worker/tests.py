@@ -0,0 +1,61 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from notif_worker.models import OutboxMessage, OutboxStatus
+from notif_worker.outbox import enqueue_otp
+from notif_worker.tasks import deliver_message, requeue_pending_messages
+
+
+class OutboxTests(TestCase):
+    def enqueue(self):
+        with mock.patch("notif_worker.outbox.schedule_delivery"):
+            return enqueue_otp(123456)
+
+    def deliver(self, message, result=True):
+        with mock.patch("notif_worker.tasks.send_otp", return_value=result) as send:
+            deliver_message.apply(args=[message.pk])
+        return send
+
+    def test_otp_is_not_stored_in_plain_text(self):
+        message = self.enqueue()
+        self.assertNotIn("123456", OutboxMessage.objects.get(pk=message.pk).text)
+
+        send = self.deliver(message)
+        self.assertIn("123456", send.call_args.args[0])
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxStatus.SENT)
+        self.assertEqual(message.text, "")
+
+    def test_failed_message_text_is_cleared(self):
+        message = self.enqueue()
+        self.deliver(message, result=None)
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxStatus.FAILED)
+        self.assertEqual(message.text, "")
+
+    def test_claimed_message_is_not_sent_twice(self):
+        message = self.enqueue()
+        # boshqa worker xabarni olgan va hali yubormoqda
+        OutboxMessage.objects.filter(pk=message.pk).update(
+            status=OutboxStatus.SENDING, locked_until=timezone.now() + timedelta(minutes=1))
+        self.assertFalse(self.deliver(message).called)
+
+    def test_expired_lease_is_claimed_again(self):
+        message = self.enqueue()
+        OutboxMessage.objects.filter(pk=message.pk).update(
+            status=OutboxStatus.SENDING, locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(self.deliver(message).called)
+        self.assertEqual(OutboxMessage.objects.get(pk=message.pk).status, OutboxStatus.SENT)
+
+    def test_requeue_only_expired_leases(self):
+        waiting, expired = self.enqueue(), self.enqueue()
+        OutboxMessage.objects.filter(pk=expired.pk).update(
+            status=OutboxStatus.SENDING, locked_until=timezone.now() - timedelta(seconds=1))
+        with mock.patch("notif_worker.tasks.schedule_delivery") as schedule:
+            self.assertEqual(requeue_pending_messages(), 1)
+            schedule.assert_called_once_with(expired.pk)
+            # lease yangilandi, keyingi ishga tushishda qayta qo'yilmaydi
+            self.assertEqual(requeue_pending_messages(), 0)
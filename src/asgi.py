@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'src.settings')
 
 application = get_asgi_application()
+
+# /async/ alohida jarayonda ishlaydi: keshlar WSGI bilan umumiy bo'lmasa ogohlantiramiz
+from transfer.checks import warn_local_caches  # noqa: E402
+
+warn_local_caches("ASGI")
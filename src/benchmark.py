@@ -0,0 +1,120 @@
+"""Small helpers shared by the bench_* management commands."""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import BaseAdapter
+
+from src import http_client
+
+
+class Rollback(Exception):
+    """Raised inside transaction.atomic() to discard benchmark data."""
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies):
+    """
+    :param latencies: list of durations in seconds
+    :return: {"count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"}
+    """
+    values = sorted(latencies)
+    count = len(values)
+    return {
+        "count": count,
+        "mean_ms": sum(values) / count * 1000 if count else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": values[-1] * 1000 if count else 0.0,
+    }
+
+
+def time_calls(func, args_list):
+    """Calls func(*args) for every item and returns the list of durations."""
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+class FakeService(BaseAdapter):
+    """
+    requests transport adapter standing in for an outbound provider: answers
+    every request with `respond(request)` -> (status, json body) after
+    `latency` seconds, without touching the network.
+    """
+
+    def __init__(self, name, latency, respond):
+        super().__init__()
+        self.name = name
+        self.latency = latency
+        self.respond = respond
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        status, body = self.respond(request)
+        with self._lock:
+            self.requests.append(request)
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(body).encode()
+        response.headers["Content-Type"] = "application/json"
+        response.url = request.url
+        response.request = request
+        response.encoding = "utf-8"
+        return response
+
+    def close(self):
+        pass
+
+
+def _cbu_rates(request):
+    from transfer.check_card.rate_store import fake_feed
+    return 200, fake_feed()
+
+
+def _telegram(request):
+    return 200, {"ok": True, "result": {"message_id": 1}}
+
+
+def _eskiz(request):
+    return 200, {"id": "fake", "status": "waiting", "message": "Waiting for SMS provider"}
+
+
+FAKE_RESPONSES = {"cbu": _cbu_rates, "telegram": _telegram, "eskiz": _eskiz}
+
+
+@contextmanager
+def fake_services(latencies):
+    """
+    Routes the http_client providers (CBU, Telegram, Eskiz) of this process to FakeService adapters.
+    :param latencies: {provider: seconds}
+    :return: {provider: FakeService}, e.g. to count the requests that reached a fake
+    """
+    fakes, saved = {}, {}
+    for name, respond in FAKE_RESPONSES.items():
+        session = http_client.provider(name).session
+        saved[name] = (session, dict(session.adapters))
+        fakes[name] = FakeService(name, latencies.get(name, 0), respond)
+        session.mount("https://", fakes[name])
+        session.mount("http://", fakes[name])
+    try:
+        yield fakes
+    finally:
+        for session, adapters in saved.values():
+            session.adapters.clear()
+            session.adapters.update(adapters)
@@ -0,0 +1,233 @@
+"""
+Shared client for outbound HTTP calls (CBU, Telegram, Eskiz).
+
+Every provider configured in settings.OUTBOUND_HTTP gets:
+
+* one keep-alive requests.Session per process, so repeated calls reuse the
+  TCP/TLS connection;
+* (connect, read) timeouts on every request;
+* retries with exponential backoff and full jitter. GET requests are retried
+  on connection errors, timeouts, 429 and 5xx. Other methods are retried only
+  when the connection could not be opened (connect timeout, refused
+  connection, DNS failure), so a message is never sent twice;
+* a circuit breaker: after `failure_threshold` failures in a row the provider
+  is rejected immediately with CircuitOpen for `reset_after` seconds, then one
+  probe request decides whether it is closed again;
+* latency and error counters, returned by stats() and exported by src.metrics.
+"""
+import os
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from src import metrics
+
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # sekund
+
+
+class CircuitOpen(requests.exceptions.ConnectionError):
+    """The provider failed too often recently; the request was not sent."""
+
+
+def not_connected(exc):
+    """:return: True when the request never reached the server, so it is safe to send it again"""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    if not isinstance(exc, requests.ConnectionError):
+        return False
+    # requests ConnectionError(MaxRetryError(reason=NewConnectionError)): rad etilgan ulanish, DNS xatosi
+    reason = exc.args[0] if exc.args else None
+    return isinstance(getattr(reason, "reason", reason), NewConnectionError)
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold, reset_after):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_after:
+                # bitta sinov so'rovi o'tkaziladi, qolganlari u tugaguncha rad etiladi
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class ProviderStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0  # circuit ochiq bo'lgani uchun yuborilmagan
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self._lock = threading.Lock()
+
+    def record(self, seconds, ok):
+        with self._lock:
+            self.requests += 1
+            self.errors += not ok
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.buckets[next((i for i, le in enumerate(LATENCY_BUCKETS) if seconds <= le), -1)] += 1
+
+    def count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "retries": self.retries,
+                "rejected": self.rejected,
+                "mean_ms": self.total_seconds / self.requests * 1000 if self.requests else 0.0,
+                "max_ms": self.max_seconds * 1000,
+                "total_seconds": self.total_seconds,
+                "buckets": dict(zip((*LATENCY_BUCKETS, float("inf")), self.buckets)),
+            }
+
+
+class Provider:
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+        self.breaker = CircuitBreaker(config["failure_threshold"], config["reset_after"])
+        self.stats = ProviderStats()
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # celery prefork: fork dan keyin ota jarayonning soketlari ishlatilmaydi
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.config["pool_size"])
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session, self._pid = session, os.getpid()
+        return self._session
+
+    def _record(self, seconds, ok):
+        self.stats.record(seconds, ok)
+        metrics.observe("outbound_request_duration_seconds", seconds, LATENCY_BUCKETS,
+                        provider=self.name, outcome="ok" if ok else "error")
+
+    def _count(self, field):
+        self.stats.count(field)
+        metrics.inc(f"outbound_{field}_total", provider=self.name)
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.config["backoff_max"], self.config["backoff"] * 2 ** attempt))
+
+    def request(self, method, url, **kwargs):
+        """
+        Same arguments as requests.Session.request.
+        :raises CircuitOpen: the provider is failing, nothing was sent
+        :raises requests.RequestException: the last attempt failed
+        :return: requests.Response (also for 4xx/5xx, after retries)
+        """
+        method = method.upper()
+        kwargs.setdefault("timeout", (self.config["connect_timeout"], self.config["read_timeout"]))
+        safe = method in SAFE_METHODS
+        attempts = self.config["retries"] + 1
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                self._count("rejected")
+                raise CircuitOpen(f"{self.name}: circuit open")
+            last = attempt == attempts - 1
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException as exc:
+                self._record(time.perf_counter() - start, ok=False)
+                self.breaker.failure()
+                # POST: faqat ulanish ochilmagan bo'lsa qayta yuboriladi
+                retryable = safe and isinstance(exc, (requests.ConnectionError, requests.Timeout)) or \
+                    not_connected(exc)
+                if last or not retryable:
+                    raise
+            else:
+                failed = response.status_code in RETRY_STATUSES
+                self._record(time.perf_counter() - start, ok=not failed)
+                if not failed:
+                    self.breaker.success()
+                    return response
+                self.breaker.failure()
+                if last or not safe:
+                    return response
+                response.close()
+            self._count("retries")
+            time.sleep(self._backoff(attempt))
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def provider(name):
+    if name not in _providers:
+        with _providers_lock:
+            if name not in _providers:
+                config = {**settings.OUTBOUND_HTTP_DEFAULTS, **settings.OUTBOUND_HTTP.get(name, {})}
+                _providers[name] = Provider(name, config)
+    return _providers[name]
+
+
+def request(name, method, url, **kwargs):
+    return provider(name).request(method, url, **kwargs)
+
+
+def get(name, url, **kwargs):
+    return request(name, "GET", url, **kwargs)
+
+
+def post(name, url, **kwargs):
+    return request(name, "POST", url, **kwargs)
+
+
+def stats():
+    """:return: {provider: {"requests", "errors", "retries", "rejected", "mean_ms", "max_ms", "state", ...}}"""
+    return {
+        name: {**p.stats.snapshot(), "state": p.breaker.state}
+        for name, p in list(_providers.items())
+    }
+
+
+def reset():
+    """Forgets providers, sessions and counters (settings changes, tests, benchmarks)."""
+    with _providers_lock:
+        _providers.clear()
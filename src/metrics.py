@@ -0,0 +1,306 @@
+"""
+Service metrics in the Prometheus text format.
+
+Counters and histograms are kept in memory per process. When METRICS_DIR is
+set, a background thread of every process writes its values to
+METRICS_DIR/<pid>.json every METRICS_FLUSH_SECONDS (and at exit), and
+`render` adds up the files of all processes, so the web workers and the
+celery workers of one host are scraped as one service at /metrics. Files of
+exited processes are kept, because counters must not go back; clear the
+directory when the service is deployed. Without METRICS_DIR only the
+process serving /metrics is shown.
+
+Recorded:
+
+* jsonrpc_calls_total{method, code} and jsonrpc_call_duration_seconds{method}
+  by `instrument`, around the methods given to the dispatcher;
+* db_query_duration_seconds{method, operation} by a cursor wrapper installed
+  on every database connection (method is the JSON-RPC method running the
+  query, "-" outside of one);
+* outbound_request_duration_seconds{provider, outcome},
+  outbound_retries_total{provider} and outbound_rejected_total{provider}
+  by src.http_client;
+* card_cache_requests_total{result} by transfer.card_cache and
+  idempotent_replays_total{source} by transfer.idempotency.
+
+p99 of a method over 5 minutes:
+histogram_quantile(0.99, sum by (le) (rate(jsonrpc_call_duration_seconds_bucket{method="transfer_create"}[5m])))
+"""
+import atexit
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from oslash.either import Left
+
+RPC_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # sekund
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+HELP = {
+    "jsonrpc_calls_total": "JSON-RPC method calls by error code (ok - success).",
+    "jsonrpc_call_duration_seconds": "Time spent in a JSON-RPC method.",
+    "db_query_duration_seconds": "Database query time by JSON-RPC method and SQL operation.",
+    "outbound_request_duration_seconds": "Outbound HTTP attempts by provider and outcome.",
+    "outbound_retries_total": "Outbound HTTP attempts that were retried.",
+    "outbound_rejected_total": "Outbound HTTP requests rejected by an open circuit breaker.",
+    "card_cache_requests_total": "card.info cache lookups by result (l1, l2, waited, coalesced, miss).",
+    "idempotent_replays_total": "Repeated transfer_create calls answered with the original result.",
+}
+
+# hozir bajarilayotgan JSON-RPC metodi (sync_to_async va asyncio.gather vazifalariga ham o'tadi)
+current_method = contextvars.ContextVar("current_method", default="-")
+
+
+class Registry:
+    """Metrics of one process. Values recorded before a fork are not carried into the child."""
+
+    def __init__(self):
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [buckets, counts (le bo'yicha, +Inf oxirida), sum]
+        self.dirty = False
+        self._pid = os.getpid()
+        self._flusher = None
+        self._directory = None  # settings.METRICS_DIR, har chaqiruvda settings o'qilmaydi
+        self._lock = threading.Lock()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self.counters, self.histograms = {}, {}
+                    self._pid, self._flusher = os.getpid(), None
+        if self._flusher is None:
+            if self._directory is None:
+                self._directory = settings.METRICS_DIR
+            if self._directory:
+                self._start_flusher()
+
+    def inc(self, name, value=1, **labels):
+        self._check_pid()
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            self.dirty = True
+
+    def observe(self, name, seconds, buckets, **labels):
+        self._check_pid()
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [buckets, [0] * (len(buckets) + 1), 0.0]
+            histogram[1][bisect_left(buckets, seconds)] += 1
+            histogram[2] += seconds
+            self.dirty = True
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": [[name, labels, value] for (name, labels), value in self.counters.items()],
+                "histograms": [[name, labels, list(buckets), list(counts), total]
+                               for (name, labels), (buckets, counts, total) in self.histograms.items()],
+            }
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(settings.METRICS_FLUSH_SECONDS)
+            self.flush()
+
+    def flush(self):
+        """Writes the values of this process to METRICS_DIR/<pid>.json."""
+        if not settings.METRICS_DIR or not self.dirty or self._pid != os.getpid():
+            return
+        self.dirty = False
+        directory = Path(settings.METRICS_DIR)
+        path = directory / f"{self._pid}.json"
+        temporary = path.with_suffix(".tmp")
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            temporary.write_text(json.dumps(self.snapshot()))
+            os.replace(temporary, path)  # o'quvchi hech qachon yarim yozilgan faylni ko'rmaydi
+        except OSError:
+            self.dirty = True  # keyingi safar qayta urinadi
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+@receiver(setting_changed)
+def _reset_directory(setting, **kwargs):
+    if setting == "METRICS_DIR":
+        registry._directory = None
+
+
+def inc(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+
+
+def observe(name, seconds, buckets, **labels):
+    registry.observe(name, seconds, buckets, **labels)
+
+
+def _snapshots():
+    yield registry.snapshot()
+    if not settings.METRICS_DIR:
+        return
+    own = f"{os.getpid()}.json"
+    for path in Path(settings.METRICS_DIR).glob("*.json"):
+        if path.name == own:
+            continue  # bu jarayon xotiradagi qiymatlardan olinadi
+        try:
+            yield json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+
+
+def collect():
+    """:return: (counters, histograms) added up over all processes, keyed by (name, labels)"""
+    counters, histograms = {}, {}
+    for snapshot in _snapshots():
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, counts, total in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            buckets = tuple(buckets)
+            merged = histograms.setdefault(key, [buckets, [0] * len(counts), 0.0])
+            if merged[0] != buckets:
+                continue  # bucket chegaralari o'zgargan (eski versiya fayli)
+            merged[1] = [a + b for a, b in zip(merged[1], counts)]
+            merged[2] += total
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def render():
+    """:return: all metrics in the Prometheus text exposition format"""
+    counters, histograms = collect()
+    lines = []
+    described = set()
+
+    def describe(name, kind):
+        if name not in described:
+            described.add(name)
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in sorted(counters.items()):
+        describe(name, "counter")
+        lines.append(f"{name}{_labels(labels)} {value}")
+    for (name, labels), (buckets, counts, total) in sorted(histograms.items()):
+        describe(name, "histogram")
+        cumulative = 0
+        for le, count in zip((*buckets, "+Inf"), counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels((*labels, ('le', le)))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {total}")
+        lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def _record_call(name, start, code):
+    inc("jsonrpc_calls_total", method=name, code=code)
+    observe("jsonrpc_call_duration_seconds", time.perf_counter() - start, RPC_BUCKETS, method=name)
+
+
+def _code(result):
+    return str(result._error.code) if isinstance(result, Left) else "ok"
+
+
+def _instrumented(name, func):
+    if iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            token = current_method.set(name)
+            start = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception:
+                _record_call(name, start, "exception")
+                raise
+            finally:
+                current_method.reset(token)
+            _record_call(name, start, _code(result))
+            return result
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = current_method.set(name)
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            _record_call(name, start, "exception")
+            raise
+        finally:
+            current_method.reset(token)
+        _record_call(name, start, _code(result))
+        return result
+
+    return wrapper
+
+
+_wrapped = {}
+
+
+def instrument(methods):
+    """
+    :param methods: {name: function} as given to jsonrpcserver's dispatch
+    :return: the same methods, counted and timed
+    """
+    result = {}
+    for name, func in methods.items():
+        wrapped = _wrapped.get((name, func))
+        if wrapped is None:
+            wrapped = _wrapped[(name, func)] = _instrumented(name, func)
+        result[name] = wrapped
+    return result
+
+
+_OPERATIONS = frozenset({"SELECT", "INSERT", "UPDATE", "DELETE"})
+
+
+def time_query(execute, sql, params, many, context):
+    """Database execute wrapper (connection.execute_wrappers)."""
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        operation = sql.lstrip()[:6].upper()
+        observe("db_query_duration_seconds", time.perf_counter() - start, DB_BUCKETS,
+                method=current_method.get(), operation=operation if operation in _OPERATIONS else "OTHER")
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created receiver."""
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
@@ -1,18 +1,33 @@
 import os
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import HttpResponseForbidden
 
 ALLOWED_IPS = os.getenv('ALLOWED_IPS', '').split(',')
 
 
 class PermissionIpMiddleware:
+    # sync va async: ASGI da async view lar oqimga o'tkazilmasdan chaqiriladi
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.forbidden(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.forbidden(request) or await self.get_response(request)
+
+    def forbidden(self, request):
 
-        if request.path.startswith('/admin/'):
+        if request.path.startswith(('/admin/', '/metrics')):
             ip = request.META.get("REMOTE_ADDR")
             if ip not in ALLOWED_IPS:
                 return HttpResponseForbidden("Admin panelga kirishga ruxsat yo'q!")
-        return self.get_response(request)
+        return None
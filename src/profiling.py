@@ -0,0 +1,144 @@
+"""
+Opt-in cProfile hook for JSON-RPC methods.
+
+A call is profiled when
+
+* PROFILE_SAMPLE_RATE > 0 and the call is picked by sampling (only methods
+  listed in PROFILE_METHODS, all methods when it is empty), or
+* the request carries an "X-Profile-Token" header equal to PROFILE_TOKEN.
+
+The profile is written to PROFILE_DIR as
+<method>__<ext_id>__<duration>ms__<time>-<pid>.prof, unless the call was
+faster than PROFILE_MIN_MS. `py manage.py profile_report` adds the files up
+into a top-N report.
+
+cProfile sees only the thread it runs in and one profiler runs per thread at
+a time. For async methods this means the profile contains the event loop
+side only (ORM work runs in sync_to_async threads) plus whatever other calls
+of the same batch did meanwhile; profile the sync endpoint for details.
+"""
+import cProfile
+import functools
+import hmac
+import inspect
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+SEPARATOR = "__"
+
+_active = threading.local()
+
+
+def _ext_id(arg_names, args, kwargs):
+    ext_id = kwargs.get("ext_id")
+    if ext_id is None and "ext_id" in arg_names[:len(args)]:
+        ext_id = args[arg_names.index("ext_id")]
+    # fayl nomida faqat xavfsiz belgilar; "_" ajratuvchi bilan adashmasligi uchun "-" ga almashtiriladi
+    return re.sub(r"[^A-Za-z0-9.-]", "-", str(ext_id or "none"))[:64]
+
+
+def _wanted(name, context):
+    token = settings.PROFILE_TOKEN
+    if token:
+        header = getattr(context, "META", {}).get("HTTP_X_PROFILE_TOKEN")
+        if header and hmac.compare_digest(header, token):
+            return True
+    rate = settings.PROFILE_SAMPLE_RATE
+    if not rate or (settings.PROFILE_METHODS and name not in settings.PROFILE_METHODS):
+        return False
+    return random.random() < rate
+
+
+def _start():
+    if getattr(_active, "profiler", None) is not None:
+        return None  # bu oqimda profiler allaqachon ishlayapti (batch, async)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # boshqa profiler yoki debugger ulangan
+        return None
+    _active.profiler = profiler
+    return profiler
+
+
+def _save(profiler, name, ext_id, seconds):
+    profiler.disable()
+    _active.profiler = None
+    if seconds * 1000 < settings.PROFILE_MIN_MS:
+        return None
+    directory = Path(settings.PROFILE_DIR)
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S.%f")
+    path = directory / SEPARATOR.join((name, ext_id, f"{seconds * 1000:.3f}ms", f"{stamp}-{os.getpid()}.prof"))
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(path)
+    except OSError:
+        return None  # profil yozilmagani so'rovni buzmasligi kerak
+    return path
+
+
+def parse_filename(path):
+    """:return: (method, ext_id, duration in ms) of a profile written by this module, None for other files"""
+    parts = Path(path).name.split(SEPARATOR)
+    if len(parts) != 4 or not parts[2].endswith("ms"):
+        return None
+    try:
+        return parts[0], parts[1], float(parts[2][:-2])
+    except ValueError:
+        return None
+
+
+def _profiled(name, func):
+    arg_names = tuple(inspect.signature(func).parameters)[1:]
+
+    if iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(context, *args, **kwargs):
+            profiler = _start() if _wanted(name, context) else None
+            if profiler is None:
+                return await func(context, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await func(context, *args, **kwargs)
+            finally:
+                _save(profiler, name, _ext_id(arg_names, args, kwargs), time.perf_counter() - start)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(context, *args, **kwargs):
+        profiler = _start() if _wanted(name, context) else None
+        if profiler is None:
+            return func(context, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(context, *args, **kwargs)
+        finally:
+            _save(profiler, name, _ext_id(arg_names, args, kwargs), time.perf_counter() - start)
+
+    return wrapper
+
+
+_wrapped = {}
+
+
+def profile_methods(methods):
+    """
+    :param methods: {name: function} as given to jsonrpcserver's dispatch
+    :return: the same methods with the profiling hook
+    """
+    result = {}
+    for name, func in methods.items():
+        wrapped = _wrapped.get((name, func))
+        if wrapped is None:
+            wrapped = _wrapped[(name, func)] = _profiled(name, func)
+        result[name] = wrapped
+    return result
@@ -0,0 +1,117 @@
+import io
+
+import requests
+from django.test import SimpleTestCase
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from src import http_client
+from src.http_client import CircuitBreaker, CircuitOpen, Provider
+
+CONFIG = {
+    "connect_timeout": 1, "read_timeout": 1, "retries": 2, "backoff": 0, "backoff_max": 0, "pool_size": 1,
+    "failure_threshold": 2, "reset_after": 30,
+}
+
+
+def response(status):
+    result = requests.Response()
+    result.status_code = status
+    result.raw = io.BytesIO(b"")
+    return result
+
+
+def refused():
+    reason = NewConnectionError(None, "Connection refused")
+    return requests.ConnectionError(MaxRetryError(None, "/", reason=reason))
+
+
+class StubSession:
+    """Answers requests with the given outcomes: a status code or an exception."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append(method)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome() if callable(outcome) else response(outcome)
+
+
+class ProviderTests(SimpleTestCase):
+    def provider(self, *outcomes, **config):
+        provider = Provider("test", {**CONFIG, **config})
+        provider._session, provider._pid = StubSession(*outcomes), http_client.os.getpid()
+        return provider
+
+    def expire(self, provider):
+        provider.breaker.opened_at -= CONFIG["reset_after"]  # reset_after o'tdi
+
+    def test_open_half_open_closed(self):
+        provider = self.provider(500, 500, 200, retries=0)
+        provider.request("GET", "/")
+        provider.request("GET", "/")
+        self.assertEqual(provider.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpen):
+            provider.request("GET", "/")
+        self.assertEqual(len(provider._session.calls), 2)  # ochiq circuit so'rov yubormaydi
+
+        self.expire(provider)
+        self.assertEqual(provider.request("GET", "/").status_code, 200)
+        self.assertEqual((provider.breaker.state, provider.breaker.failures), (CircuitBreaker.CLOSED, 0))
+
+    def test_failed_probe_opens_again(self):
+        provider = self.provider(500, 500, 500, retries=0)
+        provider.request("GET", "/")
+        provider.request("GET", "/")
+        self.expire(provider)
+        provider.request("GET", "/")
+        self.assertEqual(provider.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpen):
+            provider.request("GET", "/")
+
+    def test_requests_are_rejected_while_the_probe_is_in_flight(self):
+        provider = self.provider(500, 500, retries=0)
+        provider.request("GET", "/")
+        provider.request("GET", "/")
+        self.expire(provider)
+
+        def probe():
+            self.assertEqual(provider.breaker.state, CircuitBreaker.HALF_OPEN)
+            with self.assertRaises(CircuitOpen):
+                provider.request("GET", "/")  # sinov so'rovi hali tugamagan
+            return response(200)
+
+        provider._session.outcomes.append(probe)
+        self.assertEqual(provider.request("GET", "/").status_code, 200)
+        self.assertEqual(provider.stats.snapshot()["rejected"], 1)
+        self.assertEqual(provider.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_get_is_retried(self):
+        provider = self.provider(503, requests.ReadTimeout(), 200, failure_threshold=5)
+        self.assertEqual(provider.request("GET", "/").status_code, 200)
+        self.assertEqual(len(provider._session.calls), 3)
+
+    def test_post_is_not_retried_after_read_timeout(self):
+        provider = self.provider(requests.ReadTimeout(), 200, failure_threshold=5)
+        with self.assertRaises(requests.ReadTimeout):
+            provider.request("POST", "/")
+        self.assertEqual(len(provider._session.calls), 1)
+
+    def test_post_is_not_retried_after_5xx(self):
+        provider = self.provider(503, 200, failure_threshold=5)
+        self.assertEqual(provider.request("POST", "/").status_code, 503)
+        self.assertEqual(len(provider._session.calls), 1)
+
+    def test_post_is_retried_when_not_connected(self):
+        provider = self.provider(refused(), requests.ConnectTimeout(), 200, failure_threshold=5)
+        self.assertEqual(provider.request("POST", "/").status_code, 200)
+        self.assertEqual(len(provider._session.calls), 3)
+
+    def test_post_is_not_retried_after_connection_reset(self):
+        provider = self.provider(requests.ConnectionError("Connection aborted."), 200, failure_threshold=5)
+        with self.assertRaises(requests.ConnectionError):
+            provider.request("POST", "/")
+        self.assertEqual(len(provider._session.calls), 1)
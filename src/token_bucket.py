@@ -0,0 +1,93 @@
+"""
+Token buckets for outbound rate limits.
+
+`token_bucket(name, rate, burst)` returns a bucket shared by every worker
+through Redis when REDIS_URL is set (the refill runs inside a Lua script on
+the Redis clock), otherwise a bucket local to the process.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+# KEYS[1] - bucket; ARGV - rate (token/s), burst, tokens. Qaytaradi: kutish kerak bo'lgan sekund (0 - olindi)
+_ACQUIRE_SCRIPT = """
+local rate, burst, wanted = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= wanted then
+    tokens = tokens - wanted
+else
+    wait = (wanted - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class TokenBucket:
+    """Thread-safe bucket of one process."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self, tokens):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """Blocks until `tokens` are available. :return: seconds spent waiting"""
+        waited = 0.0
+        while True:
+            wait = self._take(tokens)
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+
+class RedisTokenBucket(TokenBucket):
+    """Bucket stored in Redis and shared by all processes using the same key."""
+
+    def __init__(self, client, key, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.key = key
+        self._script = client.register_script(_ACQUIRE_SCRIPT)
+
+    def _take(self, tokens):
+        return float(self._script(keys=[self.key], args=[self.rate, self.burst, tokens]))
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def token_bucket(name, rate, burst):
+    key = (name, rate, burst)
+    if key not in _buckets:
+        with _buckets_lock:
+            if key not in _buckets:
+                if settings.REDIS_URL:
+                    import redis
+                    client = redis.Redis.from_url(settings.REDIS_URL)
+                    _buckets[key] = RedisTokenBucket(client, f"token_bucket:{name}", rate, burst)
+                else:
+                    _buckets[key] = TokenBucket(rate, burst)
+    return _buckets[key]
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class TransferConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'transfer'
+
+    def ready(self):
+        from src.database import tune_sqlite
+        from src.metrics import install_query_timer
+        from transfer import checks  # noqa: F401  (umumiy keshlar tekshiruvi, manage.py check --deploy)
+        # har bir yangi baza ulanishida so'rovlar vaqti o'lchanadi
+        connection_created.connect(install_query_timer, dispatch_uid="metrics.install_query_timer")
+        # SQLite: WAL, busy_timeout, synchronous=NORMAL
+        connection_created.connect(tune_sqlite, dispatch_uid="database.tune_sqlite")
@@ -0,0 +1,202 @@
+"""
+Async JSON-RPC endpoint (`/async/`) for ASGI servers.
+
+The methods mirror transfer.views and share its validation helpers, but read
+with the async ORM, so one process can keep many requests waiting on the
+database. jsonrpcserver's async dispatcher runs the calls of a batch
+concurrently. Writes that need transaction.atomic() (creating, confirming and
+cancelling a transfer) run in sync_to_async, because Django transactions are
+sync only.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.db.models import F
+from django.http import HttpResponse
+from jsonrpcserver import Error, Success, async_dispatch
+from jsonrpcserver.result import Result
+
+from excell.views import import_status
+from logger.logger import log_request_response
+from src import metrics, profiling
+from transfer import balance, card_cache, idempotency
+from transfer.balance import TransferError
+from transfer.check_card.otp_hasher import averify_otp
+from transfer.loader import Loader, get_loader
+from transfer.models import Transfer, TransferState
+from transfer.pagination import InvalidCursor, apaginate
+from transfer.views import (
+    FILTER_FIELDS, MAX_OTP_ATTEMPTS, check_cards, create_or_replay, failed_attempt, filter_fields, filter_result,
+    forget_moved, replay_existing, transfer_cards,
+)
+
+
+@log_request_response
+async def card_info(context, card_number, expire):
+    """
+    ------------------------------------------------------------------------------------
+    Async variant of card.info (see transfer.views.card_info).
+    ------------------------------------------------------------------------------------
+    """
+    async def fetch():
+        loader = get_loader(context)
+        card = await loader.aget("card", card_number)
+        return (None if card is None else card.card_result()), loader.version("card", card_number)
+
+    result = await card_cache.aget(card_number, fetch)
+    if result is None or result["expire"] != expire:
+        return Error(message="card not found", code=404)
+    return Success(result)
+
+
+@log_request_response
+async def transfer_create(context,
+                          ext_id,
+                          sender_card_number,
+                          sender_card_expiry,
+                          sender_phone,
+                          receiver_card_number,
+                          receiver_phone,
+                          sending_amount,
+                          currency
+                          ) -> Result:
+    """
+    ------------------------------------------------------------------------------------
+    Async variant of transfer_create (see transfer.views.transfer_create).
+    ------------------------------------------------------------------------------------
+    """
+    fingerprint = idempotency.fingerprint(sender_card_number, sender_card_expiry, sender_phone,
+                                          receiver_card_number, receiver_phone, sending_amount, currency)
+    replay = await idempotency.areplay(ext_id, fingerprint)
+    if replay is not None:
+        return replay
+    cards = [card async for card in transfer_cards(ext_id, sender_card_number, receiver_card_number)]
+    if not cards or cards[0].ext_id_taken:
+        replay = await sync_to_async(replay_existing)(ext_id, fingerprint)
+        if replay is not None:
+            return replay
+    error = check_cards(cards, sender_card_number, sender_card_expiry, sender_phone,
+                        receiver_card_number, sending_amount)
+    if error:
+        return error
+    result = await sync_to_async(create_or_replay)(
+        ext_id, fingerprint, sender_card_number, sender_card_expiry, sender_phone,
+        receiver_card_number, receiver_phone, sending_amount, currency,
+    )
+    get_loader(context).forget("transfer", ext_id)
+    return result
+
+
+@log_request_response
+async def confirm_transfer(context, ext_id, otp) -> Result:
+    """
+    ------------------------------------------------------------------------------------
+    Async variant of confirm_transfer (see transfer.views.confirm_transfer).
+    ------------------------------------------------------------------------------------
+    """
+    transfer = await Transfer.objects.filter(ext_id=ext_id).afirst()
+    if transfer is None:
+        return Error(message="not found transfer!", code=404)
+
+    if transfer.try_count >= MAX_OTP_ATTEMPTS:
+        return Error(message="Attempt limit exceeded.", code=429)
+
+    if not await averify_otp(otp, transfer.otp, salt=transfer.ext_id):
+        if not await failed_attempt(transfer).aupdate(try_count=F("try_count") + 1):
+            return Error(message="Attempt limit exceeded.", code=429)
+        return Error(message="Invalid code!", code=400)
+
+    if transfer.state != TransferState.CREATED:
+        return Error(message="Transfer is in an invalid state!", code=400)
+    try:
+        await sync_to_async(balance.confirm)(transfer)
+    except TransferError as e:
+        return Error(message=e.message, code=e.code)
+    forget_moved(context, ext_id)
+    return Success(transfer.to_result())
+
+
+@log_request_response
+async def transfer_cancel(context, ext_id) -> Result:
+    """
+    ------------------------------------------------------------------------------------
+    Async variant of transfer_cancel (see transfer.views.transfer_cancel).
+    ------------------------------------------------------------------------------------
+    """
+    transfer = await Transfer.objects.filter(ext_id=ext_id).afirst()
+    if transfer is None:
+        return Error(message="transfer not found!", code=404)
+    if transfer.state == TransferState.CANCELLED:
+        return Error(message="The transfer has already been canceled!", code=123)
+    if transfer.state == TransferState.CREATED:
+        return Error(message="The transfer has already been created!", code=400)
+
+    try:
+        await sync_to_async(balance.cancel)(transfer)
+    except TransferError as e:
+        return Error(message=e.message, code=e.code)
+    forget_moved(context, ext_id)
+    return Success(transfer.to_result())
+
+
+@log_request_response
+async def transfer_state(context, ext_id):
+    """
+    ------------------------------------------------------------------------------------
+    Async variant of transfer_state (see transfer.views.transfer_state).
+    ------------------------------------------------------------------------------------
+    """
+    transfer = await get_loader(context).aget("transfer", ext_id)
+    if transfer is None:
+        return Error(message="transfer not found!", code=404)
+    return Success({"message": transfer.state})
+
+
+@log_request_response
+async def transfer_filter(context, card_number, start_date=None, end_date=None, status=None, cursor=None,
+                          limit=None):
+    """
+    ------------------------------------------------------------------------------------
+    Async variant of transfer_filter (see transfer.views.transfer_filter).
+    ------------------------------------------------------------------------------------
+    """
+    queryset = Transfer.objects.filter(**filter_fields(card_number, start_date, end_date, status))
+    try:
+        rows, next_cursor = await apaginate(queryset, FILTER_FIELDS, cursor=cursor, limit=limit)
+    except InvalidCursor:
+        return Error(message="invalid cursor!", code=400)
+    except (TypeError, ValueError):
+        return Error(message="invalid limit!", code=400)
+    return Success(filter_result(rows, next_cursor))
+
+
+# jsonrpcserver ning global @method registriga qo'shilmaydi: sync endpoint o'zgarishsiz qoladi
+METHODS = metrics.instrument(profiling.profile_methods({
+    "card.info": card_info,
+    "transfer_create": transfer_create,
+    "confirm_transfer": confirm_transfer,
+    "transfer_cancel": transfer_cancel,
+    "transfer_state": transfer_state,
+    "transfer_filter": transfer_filter,
+    "import.status": sync_to_async(import_status),
+}))
+
+
+async def async_jsonrpc(request):
+    body = request.body.decode()
+    request.loader = Loader()
+    try:
+        calls = json.loads(body)
+    except ValueError:
+        # noto'g'ri JSON: xato javobini jsonrpcserver o'zi qaytaradi
+        return HttpResponse(await async_dispatch(body, methods=METHODS, context=request),
+                            content_type="application/json")
+    request.loader.prime(calls)
+    return HttpResponse(
+        await async_dispatch(body, methods=METHODS, deserializer=lambda _: calls, context=request),
+        content_type="application/json"
+    )
+
+
+# csrf_exempt dekoratori Django 4.2 da async view ni sync funksiyaga o'rab qo'yadi
+async_jsonrpc.csrf_exempt = True
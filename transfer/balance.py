@@ -0,0 +1,76 @@
+"""
+Balance mutations for confirm_transfer and transfer_cancel.
+
+A movement appends a debit and a credit LedgerEntry and changes the Transfer
+state in one transaction. Only the debited card row is locked (to check its
+balance), the credited card just gets a new ledger row, so a popular
+receiver is never a contended row. The Transfer row moves state only if it
+is still in the expected one.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from excell.models import Card
+from transfer import card_cache, stats
+from transfer.check_card.fernet import decrypt_card
+from transfer.models import LedgerEntry, LedgerKind, Transfer, TransferState
+
+
+class TransferError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+def _move(transfer, from_state, to_state, timestamp_field,
+          debit_card_number, debit_amount, credit_card_number, credit_amount, insufficient_message):
+    now = timezone.now()
+    with transaction.atomic():
+        debit_card = Card.objects.select_for_update().filter(card_number=debit_card_number).first()
+        credit_card_id = Card.objects.filter(card_number=credit_card_number).values_list("pk", flat=True).first()
+        if debit_card is None or credit_card_id is None:
+            raise TransferError("card not found!", 404)
+
+        moved = Transfer.objects.filter(pk=transfer.pk, state=from_state).update(
+            state=to_state, updated_at=now, **{timestamp_field: now}
+        )
+        if not moved:
+            raise TransferError("Transfer is in an invalid state!", 400)
+
+        if debit_card.current_balance() < debit_amount:
+            raise TransferError(insufficient_message, 400)
+        LedgerEntry.objects.bulk_create([
+            LedgerEntry(card=debit_card, transfer=transfer, kind=LedgerKind.DEBIT, amount=-debit_amount),
+            LedgerEntry(card_id=credit_card_id, transfer=transfer, kind=LedgerKind.CREDIT, amount=credit_amount),
+        ])
+        stats.transfer_moved(transfer, from_state, to_state)
+        card_cache.invalidate([debit_card_number, credit_card_number])
+
+    transfer.state = to_state
+    setattr(transfer, timestamp_field, now)
+    return transfer
+
+
+def confirm(transfer):
+    """Moves sending_amount from the sender and receiving_amount to the receiver."""
+    return _move(
+        transfer, TransferState.CREATED, TransferState.CONFIRMED, "confirmed_at",
+        debit_card_number=decrypt_card(transfer.sender_card_number),
+        debit_amount=transfer.sending_amount,
+        credit_card_number=decrypt_card(transfer.receiver_card_number),
+        credit_amount=transfer.receiving_amount,
+        insufficient_message="your balance is not enough!",
+    )
+
+
+def cancel(transfer):
+    """Reverts a confirmed transfer: the receiver gives back receiving_amount."""
+    return _move(
+        transfer, TransferState.CONFIRMED, TransferState.CANCELLED, "cancelled_at",
+        debit_card_number=decrypt_card(transfer.receiver_card_number),
+        debit_amount=transfer.receiving_amount,
+        credit_card_number=decrypt_card(transfer.sender_card_number),
+        credit_amount=transfer.sending_amount,
+        insufficient_message="Insufficient funds to be refunded!",
+    )
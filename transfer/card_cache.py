@@ -0,0 +1,273 @@
+"""
+Two-tier cache of card.info results.
+
+L1 is a dict in the process, kept for CARD_CACHE_LOCAL_TTL seconds. L2 is the
+CARD_CACHE cache (Redis when REDIS_URL is set), shared by all workers and kept
+for CARD_CACHE_TTL seconds. Keys are the card_index HMAC of the number, so
+card numbers are not stored in the cache.
+
+Every card has a version token in L2. An entry is stored with the token read
+(`versions`) before the database was queried and is served only while the
+token is the same. The batch Loader queries all cards of a batch at once, so
+a later call of the batch may find a newer token than the one read before
+that query; its row is then returned but not cached. `invalidate` writes a new token when the transaction that changed the
+card commits (a confirmed or cancelled transfer, an import, an admin edit),
+so L2 never serves a balance older than the last write; L1 of other processes
+lags by at most CARD_CACHE_LOCAL_TTL. compact_ledger does not change
+current_balance() and does not invalidate.
+
+Unknown numbers are cached too, for CARD_CACHE_NEGATIVE_TTL seconds, so
+guessing numbers does not reach the database.
+
+Misses are single-flight: in a process the first caller of a card reads the
+database and the others wait for its result; across processes a lock in L2
+lets one worker read while the others poll L2 for up to CARD_CACHE_LOCK_WAIT
+seconds before reading themselves.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from src import metrics
+from transfer.check_card.fernet import card_index
+
+MISSING = object()
+POLL_SECONDS = 0.01
+LOCK_SECONDS = 5  # qulfni olgan worker o'lib qolsa, shundan keyin bo'shaydi
+
+_local = {}          # kalit -> (amal qilish muddati, natija)
+_flights = {}        # kalit -> Future: bazadan o'qiyotgan birinchi chaqiruv natijasi
+_async_flights = {}  # (event loop, kalit) -> asyncio.Task
+_generation = 0      # invalidatsiyadan oldin boshlangan o'qish L1 ga yozilmaydi
+_lock = threading.Lock()
+
+
+def _keys(key):
+    """:return: (entry, version, lock) keys of a card in L2"""
+    return f"card:{key}", f"card:{key}:v", f"card:{key}:lock"
+
+
+def _count(result):
+    metrics.inc("card_cache_requests_total", result=result)
+
+
+def _local_get(key):
+    entry = _local.get(key)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    return MISSING
+
+
+def _local_set(key, generation, result):
+    with _lock:
+        if generation != _generation:
+            return  # o'qish paytida karta o'zgargan bo'lishi mumkin
+        if key not in _local and len(_local) >= settings.CARD_CACHE_LOCAL_SIZE:
+            _local.pop(next(iter(_local)))  # eng eski yozuv
+        _local[key] = (time.monotonic() + settings.CARD_CACHE_LOCAL_TTL, result)
+
+
+def _version_timeout():
+    # versiya yozuvlardan uzoqroq yashaydi; yo'qolsa yangi token olinadi va eski yozuvlar mos kelmaydi
+    return max(settings.CARD_CACHE_TTL, settings.CARD_CACHE_NEGATIVE_TTL) * 4
+
+
+def _new_version(key):
+    cache = caches[settings.CARD_CACHE]
+    version = uuid.uuid4().hex
+    if not cache.add(_keys(key)[1], version, timeout=_version_timeout()):
+        version = cache.get(_keys(key)[1], version)  # boshqa worker ulgurdi
+    return version
+
+
+def _shared_get(key):
+    """:return: (current version, cached result or MISSING)"""
+    entry_key, version_key, _ = _keys(key)
+    values = caches[settings.CARD_CACHE].get_many([entry_key, version_key])
+    version = values.get(version_key)
+    if version is None:
+        return _new_version(key), MISSING
+    entry = values.get(entry_key)
+    if entry is not None and entry[0] == version:
+        return version, entry[1]
+    return version, MISSING
+
+
+def _shared_set(key, version, result):
+    timeout = settings.CARD_CACHE_TTL if result is not None else settings.CARD_CACHE_NEGATIVE_TTL
+    caches[settings.CARD_CACHE].set(_keys(key)[0], (version, result), timeout=timeout)
+
+
+def _acquire(key):
+    return caches[settings.CARD_CACHE].add(_keys(key)[2], 1, timeout=LOCK_SECONDS)
+
+
+def _release(key):
+    caches[settings.CARD_CACHE].delete(_keys(key)[2])
+
+
+def versions(card_numbers):
+    """:return: {card_number: current version token}; read it before querying the cards"""
+    keys = {number: card_index(number) for number in card_numbers}
+    found = caches[settings.CARD_CACHE].get_many([_keys(key)[1] for key in keys.values()])
+    return {number: found.get(_keys(key)[1]) or _new_version(key) for number, key in keys.items()}
+
+
+def _fetch(key, version, fetch):
+    _count("miss")
+    result, fetched = fetch()
+    if fetched == version:
+        _shared_set(key, version, result)
+    else:
+        _count("stale")  # qator oxirgi invalidatsiyadan oldin o'qilgan
+    return result, fetched == version
+
+
+def _load(key, fetch):
+    generation = _generation
+    version, result = _shared_get(key)
+    current = True
+    if result is not MISSING:
+        _count("l2")
+    elif _acquire(key):
+        try:
+            result, current = _fetch(key, version, fetch)
+        finally:
+            _release(key)
+    else:
+        deadline = time.monotonic() + settings.CARD_CACHE_LOCK_WAIT
+        while result is MISSING and time.monotonic() < deadline:
+            time.sleep(POLL_SECONDS)
+            version, result = _shared_get(key)
+        if result is MISSING:
+            result, current = _fetch(key, version, fetch)
+        else:
+            _count("waited")
+    if current:
+        _local_set(key, generation, result)
+    return result
+
+
+def get(card_number, fetch):
+    """
+    :param fetch: fetch() -> (card.card_result() or None for an unknown card, the card's token from
+                  `versions` read before the row was queried); called on a miss
+    :return: the card.info result of the card, None when it does not exist
+    """
+    key = card_index(card_number)
+    result = _local_get(key)
+    if result is not MISSING:
+        _count("l1")
+        return result
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Future()
+    if not leader:
+        _count("coalesced")
+        return flight.result()
+    try:
+        result = _load(key, fetch)
+    except BaseException as exc:
+        flight.set_exception(exc)
+        raise
+    finally:
+        with _lock:
+            _flights.pop(key, None)
+    flight.set_result(result)
+    return result
+
+
+def _in_thread(func, *args):
+    # kesh (Redis) chaqiruvlari event loop ni to'smasin
+    return sync_to_async(func, thread_sensitive=False)(*args)
+
+
+async def aversions(card_numbers):
+    return await _in_thread(versions, card_numbers)
+
+
+async def _afetch(key, version, fetch):
+    _count("miss")
+    result, fetched = await fetch()
+    if fetched == version:
+        await _in_thread(_shared_set, key, version, result)
+    else:
+        _count("stale")
+    return result, fetched == version
+
+
+async def _aload(key, fetch):
+    generation = _generation
+    version, result = await _in_thread(_shared_get, key)
+    current = True
+    if result is not MISSING:
+        _count("l2")
+    elif await _in_thread(_acquire, key):
+        try:
+            result, current = await _afetch(key, version, fetch)
+        finally:
+            await _in_thread(_release, key)
+    else:
+        deadline = time.monotonic() + settings.CARD_CACHE_LOCK_WAIT
+        while result is MISSING and time.monotonic() < deadline:
+            await asyncio.sleep(POLL_SECONDS)
+            version, result = await _in_thread(_shared_get, key)
+        if result is MISSING:
+            result, current = await _afetch(key, version, fetch)
+        else:
+            _count("waited")
+    if current:
+        _local_set(key, generation, result)
+    return result
+
+
+async def aget(card_number, fetch):
+    """get() for async methods; fetch is a coroutine function."""
+    key = card_index(card_number)
+    result = _local_get(key)
+    if result is not MISSING:
+        _count("l1")
+        return result
+    flight_key = (asyncio.get_running_loop(), key)
+    task = _async_flights.get(flight_key)
+    if task is None:
+        task = _async_flights[flight_key] = asyncio.ensure_future(_aload(key, fetch))
+        task.add_done_callback(lambda done: _async_flights.pop(flight_key, None))
+    else:
+        _count("coalesced")
+    # kutayotganlardan biri bekor qilinsa ham o'qish boshqalar uchun davom etadi
+    return await asyncio.shield(task)
+
+
+def forget(card_numbers):
+    """Makes the cached results of the cards stale at once."""
+    global _generation
+    keys = {card_index(number) for number in card_numbers if number}
+    if not keys:
+        return
+    # avval L2: L1 dan chiqarilgan karta eski L2 yozuvidan qayta to'ldirilmasin
+    caches[settings.CARD_CACHE].set_many({_keys(key)[1]: uuid.uuid4().hex for key in keys},
+                                         timeout=_version_timeout())
+    with _lock:
+        _generation += 1
+        for key in keys:
+            _local.pop(key, None)
+
+
+def invalidate(card_numbers):
+    """
+    Makes the cached results of the cards stale when the current transaction
+    commits (at once outside of a transaction). Call it wherever
+    current_balance(), status, expire or the existence of a card changes.
+    """
+    card_numbers = list(card_numbers)
+    transaction.on_commit(lambda: forget(card_numbers))
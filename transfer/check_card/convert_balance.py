@@ -1,26 +1,18 @@
-import requests
+from transfer.check_card.rate_store import get_rate
+
+UZS_CODE = "860"
+RUB_CODE = "643"
 
 
 def valyuta(amount, currency_code):
-    if currency_code == 860:
+    """:raises RateUnavailable: if there is no usable rate for the currency"""
+    if str(currency_code) == UZS_CODE:
         return amount
-    valyuta_list = requests.get("https://cbu.uz/oz/arkhiv-kursov-valyut/json/").json()
-    valyuta_obj = next((v for v in valyuta_list if v['Code'] == str(currency_code)), None)
-
-    if not valyuta_obj:
-        return "Valyuta topilmadi."
-
-    rate = float(valyuta_obj['Rate'])
-    converted = amount / rate
+    converted = amount / get_rate(currency_code)
     return converted
 
 
 def convert_rub_to_uzs(amount):
-    valyuta_list = requests.get("https://cbu.uz/oz/arkhiv-kursov-valyut/json/").json()
-    valyuta_obj = next((v for v in valyuta_list if v['Code'] == str(643)), None)
-    if not valyuta_obj:
-        return "Valyuta topilmadi."
-
-    rate = (valyuta_obj['Rate'])
-    converted = float(amount) * float(rate)
+    """:raises RateUnavailable: if there is no usable RUB rate"""
+    converted = float(amount) * get_rate(RUB_CODE)
     return converted
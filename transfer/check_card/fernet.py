@@ -1,3 +1,5 @@
+import hashlib
+import hmac
 import os
 
 from cryptography.fernet import Fernet
@@ -5,6 +7,9 @@ from dotenv import load_dotenv
 
 load_dotenv()
 cipher = Fernet(os.getenv("ENCRYPTION_KEY").encode())
+# Blind index kaliti berilmasa, ENCRYPTION_KEY dan alohida kalit hosil qilinadi
+blind_index_key = (os.getenv("BLIND_INDEX_KEY") or "").encode() or \
+                  hashlib.sha256(b"blind-index:" + os.getenv("ENCRYPTION_KEY").encode()).digest()
 
 
 def encrypt_card(card_number) -> str:
@@ -13,3 +18,11 @@ def encrypt_card(card_number) -> str:
 
 def decrypt_card(encrypted_card: str) -> str:
     return cipher.decrypt(encrypted_card.encode()).decode()
+
+
+def card_index(card_number) -> str:
+    """
+    Deterministic HMAC-SHA256 of the card number. Fernet ciphertext is
+    randomized, so Transfer rows are searched by this value instead.
+    """
+    return hmac.new(blind_index_key, str(card_number).encode(), hashlib.sha256).hexdigest()
@@ -0,0 +1,52 @@
+"""
+OTP hashing for Transfer.otp.
+
+'hmac' (default) stores HMAC-SHA256(pepper, ext_id:otp) and verifies in
+microseconds; 'bcrypt' keeps the slow salted hash with a configurable cost.
+Verification picks the algorithm from the stored value, so rows written
+before a mode switch still verify.
+"""
+import hashlib
+import hmac
+
+import bcrypt
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+HMAC_PREFIX = "hmac$"
+
+
+def _hmac_digest(otp, salt):
+    message = f"{salt}:{otp}".encode()
+    return hmac.new(settings.OTP_HMAC_PEPPER.encode(), message, hashlib.sha256).hexdigest()
+
+
+def hash_otp(otp, salt="", mode=None):
+    """
+    :param otp: the plain one-time code
+    :param salt: per-transfer value mixed into the HMAC (ext_id)
+    :param mode: 'hmac' or 'bcrypt', settings.OTP_HASHER by default
+    :return: the encoded hash to store in Transfer.otp
+    """
+    mode = mode or settings.OTP_HASHER
+    if mode == "hmac":
+        return HMAC_PREFIX + _hmac_digest(otp, salt)
+    if mode == "bcrypt":
+        salt_bytes = bcrypt.gensalt(rounds=settings.OTP_BCRYPT_ROUNDS)
+        return bcrypt.hashpw(str(otp).encode(), salt_bytes).decode()
+    raise ValueError(f"unknown OTP hasher: {mode}")
+
+
+def verify_otp(otp, encoded, salt=""):
+    """Constant-time check of a submitted code against a stored hash."""
+    if encoded.startswith(HMAC_PREFIX):
+        return hmac.compare_digest(encoded[len(HMAC_PREFIX):], _hmac_digest(otp, salt))
+    # bcrypt.checkpw o'zi ham konstant vaqtda solishtiradi
+    return bcrypt.checkpw(str(otp).encode(), encoded.encode())
+
+
+async def averify_otp(otp, encoded, salt=""):
+    """verify_otp() for async views: a bcrypt check (~250 ms of CPU) runs in a thread, not on the event loop."""
+    if encoded.startswith(HMAC_PREFIX):
+        return verify_otp(otp, encoded, salt=salt)
+    return await sync_to_async(verify_otp, thread_sensitive=False)(otp, encoded, salt=salt)
@@ -0,0 +1,165 @@
+"""
+Local store of CBU exchange rates.
+
+Rates are pulled by the `refresh_currency_rates` beat task, persisted in the
+`CurrencyRate` table and published to the `FX_RATE_CACHE` cache (Redis in
+production). Request handlers only read a process-local copy of that table,
+so a lookup is a dict access and never touches the network. Without
+REDIS_URL the cache is local to every process, so the table a process loads
+from the database expires after FX_RATE_LOCAL_TTL and is read again.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from src import http_client
+from transfer.models import CurrencyRate
+
+logger = logging.getLogger(__name__)
+
+CBU_RATES_URL = "https://cbu.uz/oz/arkhiv-kursov-valyut/json/"
+RATES_CACHE_KEY = "fx_rates"
+
+
+class RateUnavailable(Exception):
+    pass
+
+
+def cbu_feed():
+    """Downloads the full rate list from cbu.uz."""
+    response = http_client.get("cbu", CBU_RATES_URL)
+    response.raise_for_status()
+    return response.json()
+
+
+class FakeRateFeed:
+    """
+    Offline feed returning CBU-shaped rows, for tests and local development.
+    :param rates: {"643": ("RUB", 150.5), ...}
+    """
+    DEFAULT_RATES = {
+        "840": ("USD", "12850.00"),
+        "978": ("EUR", "13900.00"),
+        "643": ("RUB", "155.00"),
+    }
+
+    def __init__(self, rates=None):
+        self.rates = rates or self.DEFAULT_RATES
+
+    def __call__(self):
+        today = timezone.now().strftime("%d.%m.%Y")
+        return [
+            {"Code": code, "Ccy": ccy, "Rate": str(rate), "Nominal": "1", "Date": today}
+            for code, (ccy, rate) in self.rates.items()
+        ]
+
+
+fake_feed = FakeRateFeed()
+
+# code -> (rate, fetched_at timestamp)
+_table = {}
+_table_expires_at = 0.0
+_table_lock = threading.Lock()
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, "%d.%m.%Y").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_table(rates):
+    # CBU kursi `nominal` birlik uchun (masalan 10 ta JPY), jadvalda bitta birlik kursi saqlanadi
+    return {r.code: (float(r.rate) / (r.nominal or 1), r.fetched_at.timestamp()) for r in rates}
+
+
+def _publish(table):
+    global _table, _table_expires_at
+    caches[settings.FX_RATE_CACHE].set(RATES_CACHE_KEY, table, timeout=None)
+    with _table_lock:
+        _table = table
+        _table_expires_at = time.monotonic() + settings.FX_RATE_LOCAL_TTL
+
+
+def refresh_rates(feed=None):
+    """
+    Pulls rates from the feed (settings.FX_RATE_FEED by default), upserts them
+    into CurrencyRate and publishes the new table to the shared cache.
+    :return: number of rates stored
+    """
+    feed = feed or import_string(settings.FX_RATE_FEED)
+    fetched_at = timezone.now()
+    rates = [
+        CurrencyRate(
+            code=str(row["Code"]),
+            ccy=row["Ccy"],
+            rate=Decimal(str(row["Rate"])),
+            nominal=int(row.get("Nominal") or 1),
+            rate_date=_parse_date(row.get("Date")),
+            fetched_at=fetched_at,
+        )
+        for row in feed()
+    ]
+    CurrencyRate.objects.bulk_create(
+        rates,
+        update_conflicts=True,
+        unique_fields=["code"],
+        update_fields=["ccy", "rate", "nominal", "rate_date", "fetched_at"],
+    )
+    _publish(_to_table(rates))
+    return len(rates)
+
+
+def _rates():
+    global _table, _table_expires_at
+    if time.monotonic() < _table_expires_at:
+        return _table
+    with _table_lock:
+        if time.monotonic() < _table_expires_at:
+            return _table
+        rates_cache = caches[settings.FX_RATE_CACHE]
+        table = rates_cache.get(RATES_CACHE_KEY)
+        if table is None:
+            # Kesh bo'sh (Redis qayta ishga tushgan yoki REDIS_URL siz lokal kesh) - oxirgi ma'lum kurslarni
+            # bazadan olamiz. Muddat bilan: lokal keshga beat yangilagan kurslar kelmaydi, baza qayta o'qiladi
+            table = _to_table(CurrencyRate.objects.all())
+            if table:
+                rates_cache.set(RATES_CACHE_KEY, table, timeout=settings.FX_RATE_LOCAL_TTL)
+        _table = table
+        _table_expires_at = time.monotonic() + settings.FX_RATE_LOCAL_TTL
+    return _table
+
+
+def get_rate(currency_code):
+    """
+    Returns the UZS rate of one unit of a numeric currency code ('643', 840 ...).
+    Rates older than FX_RATE_MAX_AGE are served as last known values unless
+    FX_RATE_STALE_POLICY is 'reject'.
+    :raises RateUnavailable: if there is no usable rate
+    """
+    entry = _rates().get(str(currency_code))
+    if entry is None:
+        raise RateUnavailable(f"no rate for currency {currency_code}")
+    rate, fetched_at = entry
+    age = time.time() - fetched_at
+    if age > settings.FX_RATE_MAX_AGE:
+        if settings.FX_RATE_STALE_POLICY == "reject":
+            raise RateUnavailable(f"rate for currency {currency_code} is stale ({age:.0f}s)")
+        logger.warning("Serving stale rate for currency %s (%.0fs old)", currency_code, age)
+    return rate
+
+
+def clear_local_rates():
+    """Drops the process-local copy so the next lookup reloads it."""
+    global _table, _table_expires_at
+    with _table_lock:
+        _table = {}
+        _table_expires_at = 0.0
@@ -1,14 +1,17 @@
 import os
 
-import requests
+from src import http_client
+
+DEFAULT_CHAT_ID = 6656413541
+OTP_MESSAGE = "sizning otp kodingiz : {otp}"
 
 
 def send_otp_telegram(otp):
-    message = f"sizning otp kodingiz : {otp}"
+    message = OTP_MESSAGE.format(otp=otp)
     send_otp(message)
 
 
-def send_otp(message, chat_id=6656413541):
+def send_otp(message, chat_id=DEFAULT_CHAT_ID):
     """
     :param message:
     :param otp:  Message max length 120 latin chars recommended
@@ -26,5 +29,5 @@ def send_otp(message, chat_id=6656413541):
             "text": message
         }
 
-        response = requests.post(url, data=data)
+        response = http_client.post("telegram", url, data=data)
         return response.status_code == 200
@@ -0,0 +1,44 @@
+"""
+System checks of the cache setup.
+
+card.info results, exchange rates and transfer_create answers are cached in
+caches that every process must share: the WSGI and the ASGI (/async/)
+processes and the Celery workers. Without REDIS_URL they fall back to a
+LocMemCache in each process, so an invalidation or a refreshed rate is seen
+only by the process that made it.
+"""
+import logging
+
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHES = ("CARD_CACHE", "FX_RATE_CACHE", "IDEMPOTENCY_CACHE")
+LOCAL_BACKEND = "django.core.cache.backends.locmem.LocMemCache"
+
+
+def local_caches():
+    """:return: aliases of the shared caches that are local to every process"""
+    aliases = dict.fromkeys(getattr(settings, name) for name in SHARED_CACHES)
+    return [alias for alias in aliases if settings.CACHES[alias]["BACKEND"] == LOCAL_BACKEND]
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_caches(app_configs, **kwargs):
+    return [
+        Warning(
+            f"CACHES[{alias!r}] is local to every process.",
+            hint="Set REDIS_URL for every service that serves JSON-RPC or runs Celery (see docker-compose.yml).",
+            id="transfer.W001",
+        )
+        for alias in local_caches()
+    ]
+
+
+def warn_local_caches(process):
+    """Logs at startup of a second process type (e.g. the ASGI server) when the shared caches are local."""
+    aliases = local_caches()
+    if aliases:
+        logger.warning("%s: caches %s are local to this process; card.info of other processes keeps serving "
+                       "balances changed here for up to CARD_CACHE_TTL. Set REDIS_URL.", process, ", ".join(aliases))
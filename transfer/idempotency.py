@@ -0,0 +1,87 @@
+"""
+ext_id idempotency of transfer_create.
+
+A client that did not get an answer retries with the same ext_id. The first
+successful call stores its result under the ext_id for IDEMPOTENCY_TTL
+seconds in the IDEMPOTENCY_CACHE cache, and a retry with the same parameters
+gets that result without a database query, validation or OTP. After the TTL,
+and when two calls race, the unique ext_id column decides and the existing
+transfer is answered the same way. Reusing an ext_id with other parameters
+still gets 409 "ext_id exists!".
+
+Parameters are compared by a fingerprint, which contains the card_index of
+the card numbers instead of the numbers.
+"""
+import hashlib
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import caches
+from jsonrpcserver import Error, Success
+
+from src import metrics
+from transfer.check_card.fernet import card_index
+
+
+def _amount(value):
+    # 100, 100.0 va "100.00" bir xil summa
+    try:
+        return str(Decimal(str(value)).quantize(Decimal("0.01")))
+    except InvalidOperation:
+        return str(value)
+
+
+def _digest(*values):
+    return hashlib.sha256("\x1f".join(map(str, values)).encode()).hexdigest()
+
+
+def fingerprint(sender_card_number, sender_card_expiry, sender_phone,
+                receiver_card_number, receiver_phone, sending_amount, currency):
+    """:return: fingerprint of transfer_create parameters"""
+    return _digest(card_index(sender_card_number), sender_card_expiry, sender_phone,
+                   card_index(receiver_card_number), receiver_phone, _amount(sending_amount), currency)
+
+
+def transfer_fingerprint(transfer):
+    """:return: fingerprint of the parameters a Transfer was created with"""
+    return _digest(transfer.sender_card_index, transfer.sender_card_expiry, transfer.sender_phone,
+                   transfer.receiver_card_index, transfer.receiver_phone, _amount(transfer.sending_amount),
+                   transfer.currency)
+
+
+def _key(ext_id):
+    return "transfer_create:" + hashlib.sha256(str(ext_id).encode()).hexdigest()
+
+
+def _answer(original, result, fingerprint, source):
+    if original != fingerprint:
+        return Error(message="ext_id exists!", code=409)
+    metrics.inc("idempotent_replays_total", source=source)
+    return Success(result)
+
+
+def remember(ext_id, fingerprint, result):
+    """Stores the result of a created transfer. :return: Success(result)"""
+    caches[settings.IDEMPOTENCY_CACHE].set(_key(ext_id), (fingerprint, result), timeout=settings.IDEMPOTENCY_TTL)
+    return Success(result)
+
+
+def replay(ext_id, fingerprint):
+    """:return: the stored answer for a repeated call, None when the ext_id is not in the cache"""
+    cached = caches[settings.IDEMPOTENCY_CACHE].get(_key(ext_id))
+    return None if cached is None else _answer(*cached, fingerprint, "cache")
+
+
+async def areplay(ext_id, fingerprint):
+    cached = await caches[settings.IDEMPOTENCY_CACHE].aget(_key(ext_id))
+    return None if cached is None else _answer(*cached, fingerprint, "cache")
+
+
+def replay_transfer(transfer, fingerprint):
+    """:return: the answer for a call whose ext_id already has a Transfer row"""
+    original = transfer_fingerprint(transfer)
+    result = transfer.to_result()
+    # keyingi takrorlar bazaga bormasin
+    caches[settings.IDEMPOTENCY_CACHE].set(_key(transfer.ext_id), (original, result),
+                                           timeout=settings.IDEMPOTENCY_TTL)
+    return _answer(original, result, fingerprint, "database")
@@ -0,0 +1,47 @@
+"""
+Folding of LedgerEntry rows into Card.balance snapshots.
+
+Transfers only insert ledger rows; the compact_ledger task periodically adds
+them to Card.balance and moves Card.balance_entry_id forward, so the number
+of entries summed on every balance read stays small.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+from excell.models import Card
+from transfer.models import LedgerEntry
+
+
+def compact_card(card_id, up_to_entry_id):
+    with transaction.atomic():
+        card = Card.objects.select_for_update().get(pk=card_id)
+        if card.balance_entry_id >= up_to_entry_id:
+            return False
+        delta = LedgerEntry.objects.filter(
+            card_id=card_id, id__gt=card.balance_entry_id, id__lte=up_to_entry_id
+        ).aggregate(total=Sum("amount"))["total"] or 0
+        Card.objects.filter(pk=card_id).update(balance=F("balance") + delta, balance_entry_id=up_to_entry_id)
+    return True
+
+
+def compact_ledger():
+    """
+    Rolls every card snapshot forward to the newest entry older than
+    LEDGER_COMPACTION_LAG. The lag keeps ids reserved by transactions that
+    have not committed yet out of the folded range.
+    :return: number of compacted cards
+    """
+    horizon = timezone.now() - timedelta(seconds=settings.LEDGER_COMPACTION_LAG)
+    up_to = LedgerEntry.objects.filter(created_at__lt=horizon).aggregate(last=Max("id"))["last"]
+    if up_to is None:
+        return 0
+    card_ids = (
+        LedgerEntry.objects.filter(id__lte=up_to, id__gt=F("card__balance_entry_id"))
+        .values_list("card_id", flat=True)
+        .distinct()
+    )
+    return sum(compact_card(card_id, up_to) for card_id in list(card_ids))
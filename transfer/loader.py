@@ -0,0 +1,126 @@
+"""
+Request-scoped batch loader for JSON-RPC batches.
+
+The jsonrpc view creates one Loader per HTTP request and primes it with the
+keys of every call in the batch before dispatching. The first call that
+needs a row resolves all pending keys of that model with one IN query; the
+other calls of the batch are answered from the loader's cache. The async
+endpoint runs the calls of a batch concurrently, so there the first query
+is shared by every call waiting on the same source. Methods that
+change a row drop it from the cache so later calls of the batch re-read it.
+Before the cards are queried their card_cache version tokens are read
+(`version`), so a row is cached under the token that was current before it
+was read, not under a newer one.
+"""
+import asyncio
+from collections import defaultdict
+
+from excell.models import Card
+from transfer import card_cache
+from transfer.models import Transfer
+
+# manba -> (queryset, kalit maydon); kartalar balansi bilan bitta so'rovda o'qiladi
+SOURCES = {
+    "card": (lambda: Card.objects.with_current_balance(), "card_number"),
+    "transfer": (lambda: Transfer.objects.all(), "ext_id"),
+}
+# manba -> so'rovdan oldin kalitlarning kesh versiyalarini o'qiydigan funksiyalar (sync, async)
+VERSIONS = {
+    "card": (card_cache.versions, card_cache.aversions),
+}
+# JSON-RPC method -> (manba, parametr nomi, pozitsion parametr indeksi)
+METHOD_KEYS = {
+    "card.info": ("card", "card_number", 0),
+    "transfer_state": ("transfer", "ext_id", 0),
+}
+
+
+class Loader:
+    def __init__(self):
+        self._pending = defaultdict(set)
+        self._cache = {}
+        self._inflight = {}  # async: manba -> bajarilayotgan so'rov
+        self._versions = {}
+        self.queries = 0
+
+    def want(self, source, key):
+        key = str(key)
+        if (source, key) not in self._cache:
+            self._pending[source].add(key)
+
+    def get(self, source, key):
+        """:return: the model instance or None when it does not exist"""
+        self.want(source, key)
+        if self._pending[source]:
+            self._resolve(source)
+        return self._cache[(source, str(key))]
+
+    async def aget(self, source, key):
+        """get() for async methods; concurrent calls of a batch share one query per source."""
+        self.want(source, key)
+        while (source, str(key)) not in self._cache:
+            if source not in self._inflight:
+                self._inflight[source] = asyncio.ensure_future(self._aresolve(source))
+            await self._inflight[source]
+        return self._cache[(source, str(key))]
+
+    def version(self, source, key):
+        """:return: the cache version of the key read before its row was queried (VERSIONS sources)"""
+        return self._versions.get((source, str(key)))
+
+    def forget(self, source, key):
+        self._cache.pop((source, str(key)), None)
+
+    def clear(self, source):
+        self._cache = {cached: obj for cached, obj in self._cache.items() if cached[0] != source}
+
+    def _resolve(self, source):
+        queryset, field = SOURCES[source]
+        keys = self._pending.pop(source)
+        if source in VERSIONS:
+            self._remember_versions(source, VERSIONS[source][0](keys))
+        self.queries += 1
+        for obj in queryset().filter(**{f"{field}__in": keys}):
+            self._cache[(source, getattr(obj, field))] = obj
+        for key in keys:
+            self._cache.setdefault((source, key), None)
+
+    async def _aresolve(self, source):
+        queryset, field = SOURCES[source]
+        keys = self._pending.pop(source, set())
+        try:
+            if keys:
+                if source in VERSIONS:
+                    self._remember_versions(source, await VERSIONS[source][1](keys))
+                self.queries += 1
+                async for obj in queryset().filter(**{f"{field}__in": keys}):
+                    self._cache[(source, getattr(obj, field))] = obj
+                for key in keys:
+                    self._cache.setdefault((source, key), None)
+        finally:
+            del self._inflight[source]
+
+    def _remember_versions(self, source, versions):
+        self._versions.update(((source, key), version) for key, version in versions.items())
+
+    def prime(self, calls):
+        """Registers the keys of a parsed JSON-RPC request or batch."""
+        for call in calls if isinstance(calls, list) else [calls]:
+            if not isinstance(call, dict) or call.get("method") not in METHOD_KEYS:
+                continue
+            source, name, position = METHOD_KEYS[call["method"]]
+            params = call.get("params")
+            if isinstance(params, dict):
+                key = params.get(name)
+            elif isinstance(params, list) and len(params) > position:
+                key = params[position]
+            else:
+                continue
+            if isinstance(key, (str, int)):
+                self.want(source, key)
+
+
+def get_loader(context):
+    """The request's loader; a fresh one when the method is called outside the jsonrpc view."""
+    loader = getattr(context, "loader", None)
+    return loader if loader is not None else Loader()
@@ -0,0 +1,46 @@
+from cryptography.fernet import InvalidToken
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from transfer.check_card.fernet import card_index, decrypt_card
+from transfer.models import Transfer
+
+
+def _plain_card(value):
+    try:
+        return decrypt_card(value)
+    except InvalidToken:
+        # Shifrlashdan oldin yozilgan eski qatorlarda karta raqami ochiq saqlangan
+        return value
+
+
+class Command(BaseCommand):
+    help = "Mavjud Transfer qatorlari uchun sender/receiver_card_index ustunlarini bo'laklab to'ldiradi."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        missing = Q(sender_card_index="") | Q(receiver_card_index="")
+        last_pk = 0
+        updated = 0
+        while True:
+            chunk = list(
+                Transfer.objects.filter(missing, pk__gt=last_pk)
+                .order_by('pk')
+                .only('pk', 'sender_card_number', 'receiver_card_number')[:chunk_size]
+            )
+            if not chunk:
+                break
+            for transfer in chunk:
+                transfer.sender_card_index = card_index(_plain_card(transfer.sender_card_number))
+                transfer.receiver_card_index = card_index(_plain_card(transfer.receiver_card_number))
+            with transaction.atomic():
+                Transfer.objects.bulk_update(chunk, ['sender_card_index', 'receiver_card_index'])
+            last_pk = chunk[-1].pk
+            updated += len(chunk)
+            self.stdout.write(f"{updated} ta qator yangilandi (oxirgi id={last_pk})")
+
+        self.stdout.write(self.style.SUCCESS(f"Tayyor: {updated} ta transfer indekslandi."))
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+
+from src.benchmark import summarize
+from transfer.check_card.fernet import card_index, encrypt_card
+from transfer.models import Transfer, TransferState
+
+CARD_NUMBER = "7777000000000001"
+EXT_ID_PREFIX = "bench-async-"
+
+
+class Command(BaseCommand):
+    help = ("Bir xil JSON-RPC so'rovlarni sync (/, WSGI, oqimlar) va async (/async/, ASGI, bitta event loop) "
+            "endpointlariga parallel yuborib RPS va kechikishni solishtiradi. Sinov transferlari oxirida o'chiriladi.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--transfers', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self._cleanup()
+        card = encrypt_card(CARD_NUMBER)
+        Transfer.objects.bulk_create(
+            Transfer(ext_id=f"{EXT_ID_PREFIX}{i}", sender_card_number=card, sender_card_index=card_index(CARD_NUMBER),
+                     sender_card_expiry="12/30", sender_phone="+998900000000", receiver_card_number=card,
+                     receiver_phone="+998900000000", sending_amount=10, currency="860", receiving_amount=10,
+                     state=TransferState.CONFIRMED, otp="")
+            for i in range(options['transfers'])
+        )
+        try:
+            bodies = self._bodies(options)
+            self.stdout.write(f"{'endpoint':<10} {'rps':>8} {'p50 ms':>9} {'p99 ms':>9}")
+            self._report("wsgi", *self._run_sync(bodies, options['concurrency']))
+            self._report("asgi", *asyncio.run(self._run_async(bodies, options['concurrency'])))
+        finally:
+            self._cleanup()
+
+    def _cleanup(self):
+        Transfer.objects.filter(ext_id__startswith=EXT_ID_PREFIX).delete()
+
+    def _bodies(self, options):
+        rng = random.Random(options['seed'])
+        bodies = []
+        for i in range(options['requests']):
+            if i % 4 == 0:
+                call = {"method": "transfer_filter", "params": {"card_number": CARD_NUMBER, "limit": 20}}
+            else:
+                call = {"method": "transfer_state",
+                        "params": {"ext_id": f"{EXT_ID_PREFIX}{rng.randrange(options['transfers'])}"}}
+            bodies.append(json.dumps({"jsonrpc": "2.0", "id": i, **call}))
+        return bodies
+
+    def _report(self, label, elapsed, latencies):
+        stats = summarize(latencies)
+        self.stdout.write(f"{label:<10} {len(latencies) / elapsed:>8.0f} {stats['p50_ms']:>9.2f} {stats['p99_ms']:>9.2f}")
+
+    def _run_sync(self, bodies, concurrency):
+        local = threading.local()
+
+        def call(body):
+            if not hasattr(local, "client"):
+                local.client = Client()
+            start = time.perf_counter()
+            response = local.client.post("/", body, content_type="application/json")
+            assert b'"error"' not in response.content, response.content
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(call, bodies))
+        return time.perf_counter() - start, latencies
+
+    async def _run_async(self, bodies, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(body):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/async/", body, content_type="application/json")
+                assert b'"error"' not in response.content, response.content
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(call(body) for body in bodies))
+        return time.perf_counter() - start, latencies
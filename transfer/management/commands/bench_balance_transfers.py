@@ -0,0 +1,131 @@
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.test.utils import override_settings
+
+from excell.models import Card, CardStatus
+from src.benchmark import summarize
+from transfer import balance
+from transfer.balance import TransferError
+from transfer.check_card.fernet import card_index, encrypt_card
+from transfer.ledger import compact_ledger
+from transfer.models import LedgerEntry, Transfer, TransferState
+
+CARD_PREFIX = "7777"
+EXT_ID_PREFIX = "bench-balance-"
+
+
+class Command(BaseCommand):
+    help = ("balance.confirm ni bir nechta oqimda parallel ishga tushirib o'tkazuvchanlikni o'lchaydi va "
+            "umumiy balans saqlanganini tekshiradi. Sinov kartalari va transferlari oxirida o'chiriladi.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--cards', type=int, default=10, help="kam karta = ko'proq raqobat")
+        parser.add_argument('--transfers', type=int, default=200, help="har bir oqim uchun")
+        parser.add_argument('--start-balance', type=int, default=1000)
+        parser.add_argument('--amount', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        numbers = [f"{CARD_PREFIX}{i:012d}" for i in range(options['cards'])]
+        self._cleanup()
+        Card.objects.bulk_create(
+            Card(card_number=n, expire="12/30", phone="+998900000000", status=CardStatus.ACTIVE,
+                 balance=options['start_balance'])
+            for n in numbers
+        )
+        try:
+            self._run(numbers, options)
+        finally:
+            self._cleanup()
+
+    def _cleanup(self):
+        LedgerEntry.objects.filter(transfer__ext_id__startswith=EXT_ID_PREFIX).delete()
+        Transfer.objects.filter(ext_id__startswith=EXT_ID_PREFIX).delete()
+        Card.objects.filter(card_number__startswith=CARD_PREFIX).delete()
+
+    def _run(self, numbers, options):
+        encrypted = {n: (encrypt_card(n), card_index(n)) for n in numbers}
+        amount = Decimal(options['amount'])
+        outcomes = Counter()
+        latencies = []
+        lock = threading.Lock()
+
+        def worker(thread_no):
+            rng = random.Random(options['seed'] + thread_no)
+            local_outcomes, local_latencies = Counter(), []
+            try:
+                for i in range(options['transfers']):
+                    sender, receiver = rng.sample(numbers, 2)
+                    start = time.perf_counter()
+                    try:
+                        transfer = Transfer.objects.create(
+                            ext_id=f"{EXT_ID_PREFIX}{thread_no}-{i}",
+                            sender_card_number=encrypted[sender][0], sender_card_index=encrypted[sender][1],
+                            sender_card_expiry="12/30", sender_phone="+998900000000",
+                            receiver_card_number=encrypted[receiver][0], receiver_card_index=encrypted[receiver][1],
+                            receiver_phone="+998900000000",
+                            sending_amount=amount, currency="860", receiving_amount=amount, otp="-",
+                        )
+                        balance.confirm(transfer)
+                        local_outcomes["confirmed"] += 1
+                    except TransferError:
+                        local_outcomes["rejected"] += 1
+                    except OperationalError:
+                        local_outcomes["db_locked"] += 1
+                    local_latencies.append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+            with lock:
+                outcomes.update(local_outcomes)
+                latencies.extend(local_latencies)
+
+        total_before = self._total(numbers)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            list(pool.map(worker, range(options['threads'])))
+        elapsed = time.perf_counter() - started
+
+        stats = summarize(latencies)
+        self.stdout.write(
+            f"threads={options['threads']} cards={len(numbers)} calls={stats['count']} "
+            f"elapsed={elapsed:.2f}s throughput={stats['count'] / elapsed:.1f} calls/s\n"
+            f"confirmed={outcomes['confirmed']} rejected={outcomes['rejected']} db_locked={outcomes['db_locked']}\n"
+            f"latency p50={stats['p50_ms']:.2f}ms p95={stats['p95_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms"
+        )
+        self._verify(numbers, total_before, options['start_balance'])
+
+    def _balances(self, numbers):
+        return {card.card_number: card.current_balance() for card in Card.objects.filter(card_number__in=numbers)}
+
+    def _total(self, numbers):
+        return sum(self._balances(numbers).values())
+
+    def _verify(self, numbers, total_before, start_balance):
+        total_after = self._total(numbers)
+        if total_after != total_before:
+            raise CommandError(f"Balance not conserved: before={total_before} after={total_after}")
+        if any(value < 0 for value in self._balances(numbers).values()):
+            raise CommandError("Negative balance detected")
+
+        # Har bir karta balansi tasdiqlangan transferlar yig'indisiga mos kelishi kerak
+        expected = {card_index(n): Decimal(start_balance) for n in numbers}
+        confirmed = Transfer.objects.filter(ext_id__startswith=EXT_ID_PREFIX, state=TransferState.CONFIRMED)
+        for sender, receiver, sent, received in confirmed.values_list(
+                "sender_card_index", "receiver_card_index", "sending_amount", "receiving_amount"):
+            expected[sender] -= sent
+            expected[receiver] += received
+        with override_settings(LEDGER_COMPACTION_LAG=0):
+            compact_ledger()
+        # Snapshotga yig'ilgandan keyin ham balanslar o'zgarmasligi kerak
+        for number, actual in self._balances(numbers).items():
+            if expected[card_index(number)] != actual:
+                raise CommandError(f"Card {number}: expected {expected[card_index(number)]}, got {actual}")
+        self.stdout.write(self.style.SUCCESS(f"Balances conserved: total={total_after}"))
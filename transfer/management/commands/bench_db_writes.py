@@ -0,0 +1,148 @@
+import random
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from excell.models import Card, CardStatus
+from notif_worker.models import OutboxMessage
+from src.benchmark import summarize
+from transfer import balance, stats
+from transfer.balance import TransferError
+from transfer.models import LedgerEntry, Transfer
+from transfer.views import create_transfer
+
+CARD_PREFIX = "7799"
+EXT_ID_PREFIX = "bench-db-"
+PHONE = "+998900000000"
+EXPIRE = "12/30"
+
+
+def _levels(value):
+    try:
+        levels = [int(item) for item in value.split(",")]
+    except ValueError:
+        levels = []
+    if not levels or min(levels) < 1:
+        raise CommandError("--concurrency: masalan 1,4,8")
+    return levels
+
+
+class Command(BaseCommand):
+    help = ("Parallel transferlar (transfer_create dagi yozuv + confirm: ledger, statistika, outbox) bilan bazaning "
+            "yozish tezligini o'lchaydi: har bir parallellik darajasi uchun transfer/s, p50/p99 va \"database is "
+            "locked\" xatolari. Fonda --readers oqim kartalarni o'qiydi. Sozlamalarni solishtirish uchun bir xil "
+            "buyruqni SQLITE_TUNING=0 bilan, standart holda va DATABASE_URL (PostgreSQL) bilan ishga tushiring.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transfers', type=int, default=400, help="har bir daraja uchun transferlar soni")
+        parser.add_argument('--concurrency', default="1,4,8", help="parallel yozuvchi oqimlar, vergul bilan")
+        parser.add_argument('--readers', type=int, default=2, help="fonda kartalarni o'qiydigan oqimlar")
+        parser.add_argument('--cards', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        levels = _levels(options['concurrency'])
+        self._describe()
+        numbers = [f"{CARD_PREFIX}{i:012d}" for i in range(options['cards'])]
+        Card.objects.bulk_create(
+            Card(card_number=n, expire=EXPIRE, phone=PHONE, status=CardStatus.ACTIVE, balance=10 ** 9)
+            for n in numbers
+        )
+        message_ids = []
+        try:
+            self.stdout.write(f"{'writers':>7} {'transfers/s':>11} {'p50 ms':>8} {'p99 ms':>8} "
+                              f"{'locked':>6} {'failed':>6} {'reads/s':>8}")
+            # OTP Celery ga yuborilmaydi, outbox qatori baribir yoziladi
+            with mock.patch("notif_worker.outbox.schedule_delivery", side_effect=message_ids.append):
+                for level in levels:
+                    self._report(level, self._run(numbers, level, options))
+        finally:
+            self._cleanup(numbers, message_ids)
+
+    def _describe(self):
+        db = settings.DATABASES['default']
+        line = f"{connection.vendor}: CONN_MAX_AGE={db.get('CONN_MAX_AGE', 0)}"
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                pragmas = {name: cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                           for name in ("journal_mode", "synchronous", "busy_timeout")}
+            line += " " + " ".join(f"{name}={value}" for name, value in pragmas.items())
+            line += f" transaction_mode={db.get('OPTIONS', {}).get('transaction_mode', 'DEFERRED')}"
+        self.stdout.write(line)
+
+    def _run(self, numbers, writers, options):
+        latencies, errors, reads = [], {"locked": 0, "failed": 0}, [0]
+        lock = threading.Lock()
+        done = threading.Event()
+        indexes = iter(range(options['transfers']))
+
+        def write():
+            rng = random.Random(f"{options['seed']}-{writers}-{threading.get_ident()}")
+            try:
+                while True:
+                    with lock:
+                        number = next(indexes, None)
+                    if number is None:
+                        return
+                    sender, receiver = rng.sample(numbers, 2)
+                    start = time.perf_counter()
+                    try:
+                        transfer = create_transfer(f"{EXT_ID_PREFIX}{writers}-{number}", sender, EXPIRE, PHONE,
+                                                   receiver, PHONE, rng.randint(1000, 100_000), "860")
+                        balance.confirm(transfer)
+                    except OperationalError as exc:
+                        with lock:
+                            errors["locked" if "locked" in str(exc) else "failed"] += 1
+                        continue
+                    except TransferError:
+                        with lock:
+                            errors["failed"] += 1
+                        continue
+                    with lock:
+                        latencies.append(time.perf_counter() - start)
+            finally:
+                connection.close()
+
+        def read():
+            try:
+                while not done.is_set():
+                    list(Card.objects.with_current_balance().filter(card_number__in=random.sample(numbers, 5)))
+                    reads[0] += 1
+            except OperationalError:
+                pass  # o'quvchi xatosi yozuvchilar natijasiga ta'sir qilmasin
+            finally:
+                connection.close()
+
+        readers = [threading.Thread(target=read) for _ in range(options['readers'])]
+        threads = [threading.Thread(target=write) for _ in range(writers)]
+        for thread in readers:
+            thread.start()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        done.set()
+        for thread in readers:
+            thread.join()
+        return {"elapsed": elapsed, "latencies": latencies, "errors": errors, "reads": reads[0]}
+
+    def _report(self, writers, result):
+        latency = summarize(result["latencies"]) if result["latencies"] else {"p50_ms": 0.0, "p99_ms": 0.0}
+        self.stdout.write(
+            f"{writers:>7} {len(result['latencies']) / result['elapsed']:>11.1f} {latency['p50_ms']:>8.2f} "
+            f"{latency['p99_ms']:>8.2f} {result['errors']['locked']:>6} {result['errors']['failed']:>6} "
+            f"{result['reads'] / result['elapsed']:>8.1f}")
+
+    def _cleanup(self, numbers, message_ids):
+        LedgerEntry.objects.filter(transfer__ext_id__startswith=EXT_ID_PREFIX).delete()
+        Transfer.objects.filter(ext_id__startswith=EXT_ID_PREFIX).delete()
+        OutboxMessage.objects.filter(pk__in=message_ids).delete()
+        Card.objects.filter(card_number__in=numbers).delete()
+        # sinov transferlari hisoblagichlarga ham yozilgan edi
+        stats.reconcile(days=1)
@@ -0,0 +1,89 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from src import http_client
+from src.benchmark import summarize
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        time.sleep(self.latency)
+        status = 503 if self.path.startswith("/down") else 200
+        body = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = ("Lokal HTTP serverga har chaqiruvda yangi ulanish (requests.post) va src.http_client pooli orqali "
+            "so'rovlarni solishtiradi, so'ng ishlamayotgan provayderda circuit breaker qancha vaqt tejashini o'lchaydi.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--latency-ms', type=float, default=0.0, help="server javobidan oldingi kechikish")
+        parser.add_argument('--down-calls', type=int, default=50)
+        parser.add_argument('--down-latency-ms', type=float, default=200.0)
+
+    def handle(self, *args, **options):
+        _Handler.latency = options['latency_ms'] / 1000
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+        try:
+            self.stdout.write(f"{'mode':<22} {'p50 ms':>9} {'p99 ms':>9} {'total s':>9}")
+            count = options['requests']
+            self._report("new connection", self._time(lambda: requests.post(f"{base}/ok", data={"n": 1}, timeout=10), count))
+            pooled = self._provider("bench")
+            self._report("pooled", self._time(lambda: pooled.request("POST", f"{base}/ok", data={"n": 1}), count))
+
+            _Handler.latency = options['down_latency_ms'] / 1000
+            calls = options['down_calls']
+            no_breaker = self._provider("bench_down", failure_threshold=calls + 1)
+            self._report("down, no breaker", self._time(lambda: no_breaker.request("POST", f"{base}/down"), calls))
+            breaker = self._provider("bench_down")
+            self._report("down, breaker", self._time(lambda: self._call_down(breaker, f"{base}/down"), calls))
+            self.stdout.write(f"breaker: {breaker.stats.snapshot()['rejected']} of {calls} calls rejected without "
+                              f"a request, state={breaker.breaker.state}")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def _provider(self, name, **config):
+        return http_client.Provider(name, {**settings.OUTBOUND_HTTP_DEFAULTS, "retries": 0, **config})
+
+    def _call_down(self, provider, url):
+        try:
+            provider.request("POST", url)
+        except http_client.CircuitOpen:
+            pass
+
+    def _time(self, call, count):
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    def _report(self, label, latencies):
+        stats = summarize(latencies)
+        self.stdout.write(f"{label:<22} {stats['p50_ms']:>9.2f} {stats['p99_ms']:>9.2f} {sum(latencies):>9.2f}")
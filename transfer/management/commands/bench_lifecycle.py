@@ -0,0 +1,271 @@
+import json
+import queue
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+
+from excell.models import Card, CardStatus
+from notif_worker.models import OutboxMessage
+from notif_worker.tasks import deliver_message
+from src.benchmark import fake_services, summarize
+from transfer import stats
+from transfer.check_card.fernet import card_index, encrypt_card
+from transfer.check_card.rate_store import cbu_feed, refresh_rates
+from transfer.models import LedgerEntry, Transfer, TransferState
+
+CARD_PREFIX = "7788"
+EXT_ID_PREFIX = "bench-e2e-"
+OTP = 123456
+PHONE = "+998900000000"
+EXPIRE = "12/30"
+METHODS = ("card.info", "transfer_create", "confirm_transfer", "transfer_state", "transfer_filter", "transfer_cancel")
+
+
+def _latencies(values, default_ms):
+    """"telegram=80,cbu=20" -> {provider: seconds}"""
+    latencies = dict.fromkeys(("cbu", "telegram", "eskiz"), default_ms / 1000)
+    for item in values:
+        name, _, ms = item.partition("=")
+        if name not in latencies or not ms:
+            raise CommandError(f"--latency: {item!r}, kutilgan format: telegram=80")
+        latencies[name] = float(ms) / 1000
+    return latencies
+
+
+class Command(BaseCommand):
+    help = ("Transfer hayot siklini (card.info -> transfer_create -> confirm_transfer -> transfer_state -> "
+            "transfer_filter -> ba'zan transfer_cancel) haqiqiy jsonrpc view orqali parallel o'tkazadi. CBU, Telegram "
+            "va Eskiz kechikishi sozlanadigan lokal soxta servislar bilan almashtiriladi; OTP lar fon oqimlarida "
+            "worker kabi yuboriladi. Metodlar bo'yicha RPS, p50/p95/p99 va so'rovlar sonini chiqaradi, --save-baseline "
+            "bilan natijani saqlaydi va keyingi ishga tushirishda yomonlashuv bo'lsa xato bilan tugaydi.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=300, help="bitta o'lchovdagi to'liq sikllar soni")
+        parser.add_argument('--repeat', type=int, default=3, help="o'lchovlar soni, natija - ularning medianasi")
+        parser.add_argument('--warmup', type=int, default=30, help="hisobga olinmaydigan dastlabki sikllar")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--cards', type=int, default=20)
+        parser.add_argument('--history', type=int, default=50,
+                            help="har bir karta uchun oldindan yaratilgan transferlar")
+        parser.add_argument('--cancel-ratio', type=float, default=0.2)
+        parser.add_argument('--latency-ms', type=float, default=50, help="soxta servislar kechikishi")
+        parser.add_argument('--latency', action='append', default=[], help="provayder bo'yicha, masalan telegram=120")
+        parser.add_argument('--otp-workers', type=int, default=2, help="OTP yuboruvchi fon oqimlari")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--baseline', default=str(Path(settings.BASE_DIR) / "bench_baselines" / "lifecycle.json"))
+        parser.add_argument('--save-baseline', action='store_true')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="p95 va RPS uchun ruxsat etilgan farq (0.25 = 25%%)")
+        parser.add_argument('--tolerance-ms', type=float, default=1.0, help="p95 uchun minimal mutlaq farq")
+        parser.add_argument('--tolerance-queries', type=float, default=0.5,
+                            help="bitta chaqiruvdagi so'rovlar soni uchun (statistika shardlari birinchi marta "
+                                 "yaratilganda bir oz o'zgaradi)")
+
+    def handle(self, *args, **options):
+        latencies = _latencies(options['latency'], options['latency_ms'])
+        numbers = [f"{CARD_PREFIX}{i:012d}" for i in range(options['cards'])]
+        self._cleanup(numbers, ())
+        message_ids = []
+        try:
+            with fake_services(latencies) as fakes:
+                refresh_rates(cbu_feed)  # kurslar soxta CBU dan olinadi
+                self._seed(numbers, options)
+                if options['warmup']:
+                    self._run(numbers, options, message_ids, "warmup", options['warmup'])
+                summary = _median([
+                    self._summary(self._run(numbers, options, message_ids, f"r{i}", options['sessions']))
+                    for i in range(options['repeat'])
+                ])
+            self._report(summary, fakes, len(message_ids), options['repeat'])
+        finally:
+            self._cleanup(numbers, message_ids)
+        self._compare(summary, options)
+
+    def _seed(self, numbers, options):
+        Card.objects.bulk_create(
+            Card(card_number=n, expire=EXPIRE, phone=PHONE, status=CardStatus.ACTIVE, balance=10 ** 9)
+            for n in numbers
+        )
+        encrypted = {n: (encrypt_card(n), card_index(n)) for n in numbers}
+        rng = random.Random(options['seed'])
+        Transfer.objects.bulk_create(
+            (Transfer(ext_id=f"{EXT_ID_PREFIX}history-{n}-{i}",
+                      sender_card_number=encrypted[n][0], sender_card_index=encrypted[n][1], sender_card_expiry=EXPIRE,
+                      sender_phone=PHONE, receiver_card_number=encrypted[numbers[0]][0],
+                      receiver_card_index=encrypted[numbers[0]][1], receiver_phone=PHONE,
+                      sending_amount=rng.randint(1, 1000), currency="860", receiving_amount=1,
+                      state=TransferState.CONFIRMED, otp="")
+             for n in numbers for i in range(options['history'])),
+            batch_size=1000,
+        )
+
+    def _cleanup(self, numbers, message_ids):
+        LedgerEntry.objects.filter(transfer__ext_id__startswith=EXT_ID_PREFIX).delete()
+        Transfer.objects.filter(ext_id__startswith=EXT_ID_PREFIX).delete()
+        Card.objects.filter(card_number__in=numbers).delete()
+        OutboxMessage.objects.filter(pk__in=message_ids).delete()
+        # sinov transferlari hisoblagichlarga ham yozilgan edi
+        stats.reconcile(days=1)
+
+    def _run(self, numbers, options, message_ids, label, sessions):
+        calls = defaultdict(list)  # method -> [(seconds, queries, ok)]
+        lock = threading.Lock()
+        outbox = queue.SimpleQueue()
+
+        def deliver():
+            # celery worker o'rnida: OTP xabarlarini soxta Telegram orqali yuboradi
+            try:
+                while (message_id := outbox.get()) is not None:
+                    deliver_message.apply(args=[message_id])
+            finally:
+                connections.close_all()
+
+        def schedule(message_id):
+            message_ids.append(message_id)
+            outbox.put(message_id)
+
+        def session(number):
+            rng = random.Random(f"{options['seed']}-{label}-{number}")
+            if not hasattr(local, "client"):
+                local.client, local.queries = Client(), _QueryCounter()
+                connection.execute_wrappers.append(local.queries)  # shu oqimning ulanishi
+            client, queries = local.client, local.queries
+            sender, receiver = rng.sample(numbers, 2)
+            ext_id = f"{EXT_ID_PREFIX}{label}-{number}"
+
+            def rpc(method, **params):
+                before = queries.count
+                start = time.perf_counter()
+                response = client.post("/", json.dumps({"jsonrpc": "2.0", "id": 1, "method": method, "params": params}),
+                                       content_type="application/json")
+                elapsed = time.perf_counter() - start
+                ok = b'"error"' not in response.content
+                with lock:
+                    calls[method].append((elapsed, queries.count - before, ok))
+                return ok
+
+            rpc("card.info", card_number=sender, expire=EXPIRE)
+            created = rpc("transfer_create", ext_id=ext_id, sender_card_number=sender, sender_card_expiry=EXPIRE,
+                          sender_phone=PHONE, receiver_card_number=receiver, receiver_phone=PHONE,
+                          sending_amount=rng.randint(1000, 100_000), currency=643)
+            confirmed = created and rpc("confirm_transfer", ext_id=ext_id, otp=str(OTP))
+            rpc("transfer_state", ext_id=ext_id)
+            rpc("transfer_filter", card_number=sender, limit=20)
+            if confirmed and rng.random() < options['cancel_ratio']:
+                rpc("transfer_cancel", ext_id=ext_id)
+
+        local = threading.local()
+        workers = [threading.Thread(target=deliver) for _ in range(options['otp_workers'])]
+        for worker in workers:
+            worker.start()
+        try:
+            with mock.patch("transfer.views.otp_code", return_value=OTP), \
+                    mock.patch("notif_worker.outbox.schedule_delivery", side_effect=schedule):
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                    list(pool.map(session, range(sessions)))
+                elapsed = time.perf_counter() - started
+        finally:
+            for _ in workers:
+                outbox.put(None)
+            for worker in workers:
+                worker.join()
+        return {"elapsed": elapsed, "calls": calls}
+
+    def _summary(self, result):
+        summary = {}
+        for method in METHODS:
+            rows = result["calls"].get(method)
+            if not rows:
+                continue
+            latency = summarize([seconds for seconds, _, _ in rows])
+            summary[method] = {
+                "calls": len(rows),
+                "rps": len(rows) / result["elapsed"],
+                "p50_ms": latency["p50_ms"],
+                "p95_ms": latency["p95_ms"],
+                "p99_ms": latency["p99_ms"],
+                "queries": sum(count for _, count, _ in rows) / len(rows),
+                "errors": sum(not ok for _, _, ok in rows),
+            }
+        total = sum(len(rows) for rows in result["calls"].values())
+        summary["total"] = {"calls": total, "rps": total / result["elapsed"]}
+        return summary
+
+    def _report(self, summary, fakes, messages, repeat):
+        self.stdout.write(f"median of {repeat} runs (calls and errors: all runs)")
+        self.stdout.write(f"{'method':<18} {'calls':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                          f"{'queries':>8} {'errors':>6}")
+        for method in METHODS:
+            row = summary.get(method)
+            if row:
+                self.stdout.write(f"{method:<18} {row['calls']:>6} {row['rps']:>8.1f} {row['p50_ms']:>8.2f} "
+                                  f"{row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['queries']:>8.1f} "
+                                  f"{row['errors']:>6}")
+        self.stdout.write(f"total {summary['total']['calls']} calls, {summary['total']['rps']:.1f} calls/s")
+        self.stdout.write("fake services: " + ", ".join(f"{name}={len(fake.requests)} requests"
+                                                        for name, fake in fakes.items())
+                          + f"; OTP messages queued: {messages}")
+
+    def _compare(self, summary, options):
+        path = Path(options['baseline'])
+        if options['save_baseline']:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            keys = ('sessions', 'repeat', 'concurrency', 'cards', 'history', 'cancel_ratio', 'latency_ms', 'latency')
+            path.write_text(json.dumps({"options": {key: options[key] for key in keys}, "summary": summary}, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"baseline saved: {path}"))
+            return
+        if not path.exists():
+            self.stdout.write(f"baseline {path} yo'q, solishtirilmadi (--save-baseline bilan yarating)")
+            return
+        baseline = json.loads(path.read_text())["summary"]
+        tolerance, floor = options['tolerance'], options['tolerance_ms']
+        regressions = []
+        for method, old in baseline.items():
+            new = summary.get(method)
+            if new is None or method == "total":
+                continue
+            if new["p95_ms"] > old["p95_ms"] * (1 + tolerance) and new["p95_ms"] - old["p95_ms"] > floor:
+                regressions.append(f"{method}: p95 {old['p95_ms']:.2f} -> {new['p95_ms']:.2f} ms")
+            if new["queries"] > old["queries"] + options['tolerance_queries']:
+                regressions.append(f"{method}: queries per call {old['queries']:.2f} -> {new['queries']:.2f}")
+            if new["errors"] / new["calls"] > old["errors"] / old["calls"] + 0.01:
+                regressions.append(f"{method}: errors {old['errors']}/{old['calls']} -> {new['errors']}/{new['calls']}")
+        old_rps = baseline.get("total", {}).get("rps")
+        if old_rps and summary["total"]["rps"] < old_rps * (1 - tolerance):
+            regressions.append(f"total: rps {old_rps:.1f} -> {summary['total']['rps']:.1f}")
+        if regressions:
+            raise CommandError("regression against baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"no regression against {path}"))
+
+
+def _median(summaries):
+    """Per method median of the latency, rps and query columns; calls and errors are added up."""
+    merged = {}
+    for method in {method for summary in summaries for method in summary}:
+        rows = [summary[method] for summary in summaries if method in summary]
+        merged[method] = {
+            field: sum(row[field] for row in rows) if field in ("calls", "errors")
+            else statistics.median(row[field] for row in rows)
+            for field in rows[0]
+        }
+    return merged
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
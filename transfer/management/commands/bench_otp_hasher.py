@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from transfer.check_card.otp_hasher import hash_otp, verify_otp
+
+
+class Command(BaseCommand):
+    help = "OTP hash rejimlarini (hmac / bcrypt) hash va verify tezligi bo'yicha solishtiradi."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000, help="hmac uchun takrorlar soni")
+        parser.add_argument('--bcrypt-iterations', type=int, default=10)
+        parser.add_argument('--bcrypt-rounds', type=int, nargs='+', default=[4, 8, 12])
+
+    def _measure(self, label, iterations, mode, rounds=None):
+        with override_settings(**({'OTP_BCRYPT_ROUNDS': rounds} if rounds else {})):
+            encoded = hash_otp(123456, salt="bench", mode=mode)
+            start = time.perf_counter()
+            for _ in range(iterations):
+                hash_otp(123456, salt="bench", mode=mode)
+            hash_time = (time.perf_counter() - start) / iterations
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                verify_otp("123456", encoded, salt="bench")
+            verify_time = (time.perf_counter() - start) / iterations
+
+        self.stdout.write(
+            f"{label:<12} hash {hash_time * 1e6:>12.1f} us   verify {verify_time * 1e6:>12.1f} us   "
+            f"verify/s per core {1 / verify_time:>12.0f}"
+        )
+
+    def handle(self, *args, **options):
+        self._measure("hmac", options['iterations'], "hmac")
+        for rounds in options['bcrypt_rounds']:
+            self._measure(f"bcrypt({rounds})", options['bcrypt_iterations'], "bcrypt", rounds)
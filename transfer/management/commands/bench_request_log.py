@@ -0,0 +1,192 @@
+import json
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from jsonrpcserver import Success
+
+from logger import logger as request_log
+from src.benchmark import summarize
+from transfer.check_card.fernet import encrypt_card
+from transfer.models import Transfer
+
+EXT_ID = "bench-request-log"
+
+PARAMS = {
+    "ext_id": "bench-1",
+    "sender_card_number": "8600000000000001",
+    "sender_card_expiry": "12/30",
+    "sender_phone": "+998901112233",
+    "receiver_card_number": "8600000000000002",
+    "receiver_phone": "+998901112244",
+    "sending_amount": 15500,
+    "currency": 643,
+}
+
+
+class _Context:
+    META = {"REMOTE_ADDR": "127.0.0.1"}
+
+    def __init__(self, io_seconds):
+        self.io_seconds = io_seconds
+
+
+def transfer_create(context, **params):
+    if context.io_seconds:
+        time.sleep(context.io_seconds)  # bazaga so'rov kutilishi (GIL bo'shaydi)
+    return Success({"ext_id": params["ext_id"], "state": "Created"})
+
+
+def legacy_log_request_response(func, logger):
+    """The previous decorator: f-string formatting and a synchronous FileHandler write on every call."""
+
+    def wrapper(context, **kwargs):
+        start_time = time.time()
+        response = func(context, **kwargs)
+        processing_time = time.time() - start_time
+        sender, receiver = kwargs["sender_card_number"], kwargs["receiver_card_number"]
+        request = {
+            "ext_id": kwargs.get('ext_id'),
+            "sender_card_number": sender[:4] + '****' + sender[-4:],
+            "sender_card_expiry": kwargs.get("sender_card_expiry"),
+            "sender_phone": kwargs.get("sender_phone"),
+            "receiver_card_number": receiver[:4] + '****' + receiver[-4:],
+            "receiver_phone": kwargs.get("receiver_phone"),
+            "sending_amount": kwargs.get("sending_amount"),
+            "currency": kwargs.get("currency")
+        }
+        logger.info(
+            f"Method: {func.__name__}, Request: {request}, "
+            f"Response: {str(response)}, Time: {processing_time:.3f}s",
+            extra={'ip': context.META['REMOTE_ADDR'], 'ext_id': kwargs['ext_id']}
+        )
+        return response
+
+    return wrapper
+
+
+class Command(BaseCommand):
+    help = ("log_request_response narxini o'lchaydi. 1) bitta chaqiruv (CPU): dekoratorsiz, eski (sinxron "
+            "FileHandler + f-string), yangi (navbat + JSON) va sampling bilan. 2) haqiqiy JSON-RPC so'rovlari "
+            "(transfer_state, baza bilan): logsiz, sinxron fayl, navbat va sampling bilan.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=100_000)
+        parser.add_argument('--requests', type=int, default=3000, help="JSON-RPC so'rovlari soni (0 - o'tkazib yuborish)")
+        parser.add_argument('--sample-rate', type=float, default=0.1)
+        parser.add_argument('--io-us', type=float, default=0,
+                            help="metod ichida kutish (mikrosekund); 0 - faqat logging narxi, CPU bo'yicha")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            old_handlers = request_log.logger.handlers
+            try:
+                self._per_call(directory, options)
+                if options['requests']:
+                    self._requests(directory, options)
+            finally:
+                request_log.logger.handlers = old_handlers
+
+    def _queue_handler(self, path, queue_size):
+        handler = request_log.QueueRotatingFileHandler(path, maxBytes=50 * 1024 * 1024, backupCount=2,
+                                                       queue_size=queue_size)
+        handler.setFormatter(request_log.JsonFormatter())
+        return handler
+
+    def _run(self, modes, call, count, block=None):
+        """
+        Runs every mode `count` times. With `block` the modes take turns in
+        blocks of that many calls, so drift of the machine hits them equally.
+        The first mode is the baseline of the overhead column.
+        """
+        block = block or count
+        latencies = {label: [] for label, *_ in modes}
+        for done in range(0, count, block):
+            for label, func, handler, rate in modes:
+                request_log.logger.handlers = [handler] if handler else []
+                with override_settings(REQUEST_LOG_SAMPLE_RATE=rate, REQUEST_LOG_SAMPLING={}):
+                    if not done:
+                        call(func, min(count, 200))  # qizdirish
+                    latencies[label] += call(func, min(block, count - done))
+                if isinstance(handler, request_log.QueueRotatingFileHandler):
+                    handler.stop()  # navbatda qolganlari keyingi rejim vaqtiga qo'shilmasin
+        self.stdout.write(f"{'mode':<18} {'p50 us':>9} {'mean us':>9} {'p99 us':>9} {'overhead p50 us':>16}")
+        baseline = None
+        for label, _, handler, _ in modes:
+            stats = summarize(latencies[label])
+            p50_us = stats['p50_ms'] * 1000
+            baseline = p50_us if baseline is None else baseline
+            self.stdout.write(f"{label:<18} {p50_us:>9.2f} {stats['mean_ms'] * 1000:>9.2f} "
+                              f"{stats['p99_ms'] * 1000:>9.2f} {p50_us - baseline:>16.2f}")
+            if getattr(handler, "dropped", 0):
+                self.stdout.write(f"  dropped records: {handler.dropped}")
+
+    def _per_call(self, directory, options):
+        calls, rate = options['calls'], options['sample_rate']
+        context = _Context(options['io_us'] / 1_000_000)
+        legacy_logger = logging.getLogger("bench_request_log.legacy")
+        legacy_logger.propagate = False
+        legacy_handler = logging.FileHandler(directory / "legacy.log")
+        legacy_handler.setFormatter(request_log.CustomFormatter('%(asctime)s [%(levelname)s] IP:%(ip)s %(message)s'))
+        legacy_logger.addHandler(legacy_handler)
+        queue_handler = self._queue_handler(directory / "calls.log", calls + 200)
+        decorated = request_log.log_request_response(transfer_create)
+        try:
+            self.stdout.write("per call (CPU only, the listener thread shares the GIL with the caller):")
+            self._run([
+                ("no logging", transfer_create, None, 1.0),
+                ("legacy file", legacy_log_request_response(transfer_create, legacy_logger), None, 1.0),
+                ("queue json", decorated, queue_handler, 1.0),
+                (f"queue json {rate:g}", decorated, queue_handler, rate),
+            ], lambda func, count: self._time_calls(func, context, count), calls)
+        finally:
+            legacy_logger.removeHandler(legacy_handler)
+            legacy_handler.close()
+            queue_handler.close()
+
+    def _time_calls(self, func, context, count):
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            func(context, **PARAMS)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    def _requests(self, directory, options):
+        count, rate = options['requests'], options['sample_rate']
+        Transfer.objects.filter(ext_id=EXT_ID).delete()
+        card = encrypt_card(PARAMS["sender_card_number"])
+        Transfer.objects.create(ext_id=EXT_ID, sender_card_number=card, sender_card_expiry="12/30",
+                                sender_phone="+998901112233", receiver_card_number=card, receiver_phone="+998901112244",
+                                sending_amount=10, currency="860", receiving_amount=10, otp="")
+        body = json.dumps({"jsonrpc": "2.0", "id": 1, "method": "transfer_state", "params": {"ext_id": EXT_ID}})
+        client = Client()
+
+        def call(_, n):
+            latencies = []
+            for _ in range(n):
+                start = time.perf_counter()
+                client.post("/", body, content_type="application/json")
+                latencies.append(time.perf_counter() - start)
+            return latencies
+
+        sync_handler = logging.FileHandler(directory / "sync.log")
+        sync_handler.setFormatter(request_log.JsonFormatter())
+        queue_handler = self._queue_handler(directory / "requests.log", count + 200)
+        try:
+            self.stdout.write("JSON-RPC transfer_state requests:")
+            self._run([
+                ("no logging", None, None, 0.0),
+                ("sync file", None, sync_handler, 1.0),
+                ("queue json", None, queue_handler, 1.0),
+                (f"queue json {rate:g}", None, queue_handler, rate),
+            ], call, count, block=100)
+        finally:
+            sync_handler.close()
+            queue_handler.close()
+            Transfer.objects.filter(ext_id=EXT_ID).delete()
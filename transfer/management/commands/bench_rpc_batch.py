@@ -0,0 +1,57 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from excell.models import Card, CardStatus
+from src.benchmark import Rollback
+from transfer import card_cache
+from transfer.views import jsonrpc
+
+CARD_PREFIX = "7777"
+
+
+class Command(BaseCommand):
+    help = ("JSON-RPC batch (card.info) ni bitta so'rov va alohida so'rovlar sifatida yuborib, SQL so'rovlar soni "
+            "va vaqtini solishtiradi. Sinov kartalari oxirida o'chiriladi.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                numbers = [f"{CARD_PREFIX}{i:012d}" for i in range(options['batch'])]
+                Card.objects.bulk_create(
+                    Card(card_number=n, expire="12/30", phone="+998900000000", status=CardStatus.ACTIVE, balance=100)
+                    for n in numbers
+                )
+                calls = [
+                    {"jsonrpc": "2.0", "id": i, "method": "card.info", "params": {"card_number": n, "expire": "12/30"}}
+                    for i, n in enumerate(numbers)
+                ]
+                self.stdout.write(f"{'mode':<10} {'queries':>8} {'ms per batch':>13}")
+                self._run("batch", [calls], numbers, options['repeat'])
+                self._run("single", calls, numbers, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _run(self, label, bodies, numbers, repeat):
+        factory = RequestFactory()
+        requests = [json.dumps(body) for body in bodies]
+        elapsed, queries = 0.0, 0
+        for _ in range(repeat):
+            # card.info keshlanadi: har safar bazadan o'qilishi uchun kartalar keshdan chiqariladi
+            card_cache.forget(numbers)
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                for body in requests:
+                    jsonrpc(factory.post("/", body, content_type="application/json"))
+                elapsed += time.perf_counter() - start
+            queries = len(captured)
+        self.stdout.write(f"{label:<10} {queries:>8} {elapsed / repeat * 1000:>13.2f}")
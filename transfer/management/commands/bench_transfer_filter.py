@@ -0,0 +1,86 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from src.benchmark import summarize
+from transfer.check_card.fernet import card_index, encrypt_card
+from transfer.models import Transfer, TransferState
+from transfer.pagination import paginate
+
+CARD_NUMBER = "7777000000000001"
+EXT_ID_PREFIX = "bench-filter-"
+FIELDS = ("ext_id", "sending_amount", "currency", "receiver_card_number", "state")
+
+
+class Command(BaseCommand):
+    help = ("transfer_filter sahifalarini bitta karta bo'yicha oxirigacha o'qiydi va birinchi hamda oxirgi "
+            "sahifalar vaqtini keyset va OFFSET usullarida solishtiradi. Sinov transferlari oxirida o'chiriladi.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transfers', type=int, default=50_000)
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--sample', type=int, default=20, help="solishtiriladigan boshidagi/oxiridagi sahifalar")
+
+    def handle(self, *args, **options):
+        self._cleanup()
+        receiver = encrypt_card("7777000000000002")
+        index = card_index(CARD_NUMBER)
+        start = timezone.now() - timedelta(minutes=options['transfers'])
+        # created_at ni o'zimiz beramiz: har bir transfer bir daqiqa keyin
+        created_at = Transfer._meta.get_field("created_at")
+        created_at.auto_now_add = False
+        try:
+            Transfer.objects.bulk_create(
+                (Transfer(ext_id=f"{EXT_ID_PREFIX}{i}", sender_card_number=receiver, sender_card_index=index,
+                          sender_card_expiry="12/30", sender_phone="+998900000000", receiver_card_number=receiver,
+                          receiver_phone="+998900000000", sending_amount=10, currency="860", receiving_amount=10,
+                          state=TransferState.CONFIRMED, otp="", created_at=start + timedelta(minutes=i))
+                 for i in range(options['transfers'])),
+                batch_size=5000,
+            )
+        finally:
+            created_at.auto_now_add = True
+        try:
+            self._run(index, options)
+        finally:
+            self._cleanup()
+
+    def _cleanup(self):
+        Transfer.objects.filter(ext_id__startswith=EXT_ID_PREFIX).delete()
+
+    def _run(self, index, options):
+        queryset = Transfer.objects.filter(sender_card_index=index)
+        limit, sample = options['limit'], options['sample']
+
+        keyset, cursor, seen = [], None, 0
+        while True:
+            start = time.perf_counter()
+            rows, cursor = paginate(queryset, FIELDS, cursor=cursor, limit=limit)
+            keyset.append(time.perf_counter() - start)
+            seen += len(rows)
+            if cursor is None:
+                break
+
+        pages = len(keyset)
+        offset = {}
+        for where, page_numbers in (("first", range(min(sample, pages))), ("last", range(max(pages - sample, 0), pages))):
+            offset[where] = []
+            for page in page_numbers:
+                start = time.perf_counter()
+                list(queryset.order_by("-created_at", "-id").values(*FIELDS)[page * limit:(page + 1) * limit])
+                offset[where].append(time.perf_counter() - start)
+
+        with CaptureQueriesContext(connection) as queries:
+            paginate(queryset, FIELDS, limit=limit)
+        self.stdout.write(f"transfers: {seen}, pages: {pages}, limit: {limit}")
+        self.stdout.write(f"query plan: {queryset.order_by('-created_at', '-id').explain()}")
+        self.stdout.write(f"queries per page: {len(queries)}")
+        self.stdout.write(f"{'mode':<8} {'pages':<6} {'p50 ms':>9} {'p99 ms':>9}")
+        for label, where, latencies in (("keyset", "first", keyset[:sample]), ("keyset", "last", keyset[-sample:]),
+                                        ("offset", "first", offset["first"]), ("offset", "last", offset["last"])):
+            stats = summarize(latencies)
+            self.stdout.write(f"{label:<8} {where:<6} {stats['p50_ms']:>9.3f} {stats['p99_ms']:>9.3f}")
@@ -0,0 +1,264 @@
+import csv
+import functools
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+from openpyxl import Workbook
+
+from excell.models import Card, CardStatus
+from transfer import stats
+from transfer.check_card.fernet import card_index, encrypt_card
+from transfer.check_card.otp_hasher import hash_otp
+from transfer.check_card.rate_store import RateUnavailable, get_rate
+from transfer.models import Transfer, TransferState
+
+UZS_CODE = "860"
+CURRENCIES = (("860", 50), ("643", 30), ("840", 15), ("978", 5))
+STATES = ((TransferState.CONFIRMED, 85), (TransferState.CANCELLED, 10), (TransferState.CREATED, 5))
+CARD_STATUSES = ((CardStatus.ACTIVE, 90), (CardStatus.INACTIVE, 7), (CardStatus.EXPIRED, 3))
+
+
+def _choices(weighted):
+    values, weights = zip(*weighted)
+    return values, weights
+
+
+def card_number(options, i):
+    return f"{options['card_prefix']}{i:012d}"
+
+
+def card_phone(i):
+    # karta bo'yicha doimiy: transferning sender_phone kartadagi bilan bir xil bo'ladi
+    return f"+9989{i * 2654435761 % 10 ** 8:08d}"
+
+
+def card_expire(i):
+    return f"{i % 12 + 1:02d}/{27 + i % 5}"
+
+
+@functools.lru_cache(maxsize=200_000)
+def _card_fields(number):
+    # shifrlash qimmat: bir karta uchun bir marta (issiq kartalar ko'p takrorlanadi)
+    return encrypt_card(number), card_index(number)
+
+
+@contextmanager
+def _keep_timestamps():
+    """bulk_create should store the generated created_at / updated_at instead of now()."""
+    fields = [Transfer._meta.get_field(name) for name in ("created_at", "updated_at")]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def card_rows(options, batch_no, start, end):
+    """:return: [(card_number, expire, phone, status, balance)] of cards start..end-1, the same for the same seed"""
+    rng = random.Random(f"{options['seed']}-cards-{batch_no}")
+    statuses, weights = _choices(CARD_STATUSES)
+    picked = rng.choices(statuses, weights, k=end - start)
+    return [
+        (card_number(options, i), card_expire(i), card_phone(i), status, rng.randint(0, 50_000_000))
+        for i, status in zip(range(start, end), picked)
+    ]
+
+
+def _sender(rng, options):
+    # "issiq" kartalar: transferlarning hot_share qismi birinchi hot_cards kartadan yuboriladi
+    if options['hot_cards'] and rng.random() < options['hot_share']:
+        return rng.randrange(options['hot_cards'])
+    return rng.randrange(options['cards'])
+
+
+def transfer_objects(options, batch_no, start, end, rates, now):
+    rng = random.Random(f"{options['seed']}-transfers-{batch_no}")
+    currencies, currency_weights = _choices(CURRENCIES)
+    states, state_weights = _choices(STATES)
+    transfers = []
+    for i in range(start, end):
+        sender = _sender(rng, options)
+        receiver = rng.randrange(options['cards'])
+        sender_number, receiver_number = card_number(options, sender), card_number(options, receiver)
+        currency = rng.choices(currencies, currency_weights)[0]
+        state = rng.choices(states, state_weights)[0]
+        amount = rng.randint(1_000, 5_000_000)
+        created_at = now - timedelta(seconds=rng.random() * options['days'] * 86400)
+        finished_at = created_at + timedelta(seconds=rng.randint(5, 300))
+        ext_id = f"{options['ext_id_prefix']}{i}"
+        sender_encrypted, sender_index = _card_fields(sender_number)
+        receiver_encrypted, receiver_index = _card_fields(receiver_number)
+        transfers.append(Transfer(
+            ext_id=ext_id,
+            sender_card_number=sender_encrypted,
+            sender_card_index=sender_index,
+            sender_card_expiry=card_expire(sender),
+            sender_phone=card_phone(sender),
+            receiver_card_number=receiver_encrypted,
+            receiver_card_index=receiver_index,
+            receiver_phone=card_phone(receiver),
+            sending_amount=amount,
+            currency=currency,
+            # transfer_create dagi valyuta() bilan bir xil: UZS o'zgarmaydi, boshqalari kursga bo'linadi
+            receiving_amount=amount if currency == UZS_CODE else round(amount / rates[currency], 2),
+            state=state,
+            try_count=0,
+            otp=hash_otp(rng.randint(100000, 999999), salt=ext_id, mode="hmac"),
+            created_at=created_at,
+            updated_at=finished_at if state != TransferState.CREATED else created_at,
+            confirmed_at=finished_at if state != TransferState.CREATED else None,
+            cancelled_at=finished_at + timedelta(hours=1) if state == TransferState.CANCELLED else None,
+        ))
+    return transfers
+
+
+def _rates():
+    try:
+        return {code: get_rate(code) for code, _ in CURRENCIES if code != UZS_CODE}
+    except RateUnavailable as exc:
+        raise CommandError(f"{exc}: avval kurslarni yuklang (py manage.py refresh_rates --fake)")
+
+
+def create_batch(kind, options, batch_no, start, end, now):
+    """Runs in the worker processes. :return: (kind, number of rows)"""
+    if kind == "cards":
+        cards = [Card(card_number=number, expire=expire, phone=phone, status=status, balance=balance)
+                 for number, expire, phone, status, balance in card_rows(options, batch_no, start, end)]
+        Card.objects.bulk_create(cards, batch_size=options['batch_size'], ignore_conflicts=True)
+    else:
+        with _keep_timestamps():
+            transfers = transfer_objects(options, batch_no, start, end, _rates(), now)
+            Transfer.objects.bulk_create(transfers, batch_size=options['batch_size'], ignore_conflicts=True)
+    return kind, end - start
+
+
+def _close_connections():
+    # fork dan keyin ota jarayonning ulanishi ishlatilmasin
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ("Masshtab sinovlari uchun sintetik Card va Transfer qatorlarini yaratadi: issiq kartalar, aralash valyuta "
+            "va holatlar, --days kunga yoyilgan created_at. Transfer karta maydonlari transfer_create dagidek Fernet "
+            "bilan shifrlanadi va card_index yoziladi (bir karta uchun shifrlangan qiymat qayta ishlatiladi). Bir xil "
+            "--seed bir xil ma'lumot beradi, qayta ishga tushirish mavjud qatorlarni o'tkazib yuboradi. --cards-file "
+            "bilan kartalar CardAdmin.import_excel uchun xlsx/csv faylga ham yoziladi.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=100_000)
+        parser.add_argument('--transfers', type=int, default=1_000_000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--processes', type=int, default=1, help="parallel jarayonlar (SQLite da 1)")
+        parser.add_argument('--hot-cards', type=int, default=100, help="issiq kartalar soni")
+        parser.add_argument('--hot-share', type=float, default=0.3,
+                            help="issiq kartalardan yuborilgan transferlar ulushi")
+        parser.add_argument('--days', type=int, default=365, help="created_at shu kunlar oralig'ida")
+        parser.add_argument('--card-prefix', default="9860", help="karta raqamining 4 ta boshlang'ich raqami")
+        parser.add_argument('--ext-id-prefix', default="syn-")
+        parser.add_argument('--cards-file', default=None, help="kartalarni shu .xlsx yoki .csv faylga ham yozish")
+        parser.add_argument('--dirty-ratio', type=float, default=0.01,
+                            help="faylda validatsiyadan o'tmaydigan qatorlar ulushi")
+        parser.add_argument('--no-db-cards', action='store_true',
+                            help="kartalarni bazaga yozmaslik (faqat fayl, admin orqali import qilish uchun)")
+        parser.add_argument('--no-reconcile', action='store_true',
+                            help="oxirida statistika hisoblagichlarini tuzatmaslik")
+
+    def handle(self, *args, **options):
+        if len(options['card_prefix']) != 4 or not options['card_prefix'].isdigit():
+            raise CommandError("--card-prefix 4 ta raqam bo'lishi kerak")
+        if options['cards'] < 2 or options['hot_cards'] > options['cards']:
+            raise CommandError("--cards kamida 2 va --hot-cards dan katta bo'lishi kerak")
+        if connection.vendor == "sqlite" and options['processes'] > 1:
+            self.stdout.write("SQLite bir vaqtda bitta yozuvchiga ruxsat beradi: --processes 1 ishlatiladi")
+            options['processes'] = 1
+        if options['transfers']:
+            _rates()
+
+        if options['cards_file']:
+            self._write_file(Path(options['cards_file']), options)
+        tasks = []
+        if not options['no_db_cards']:
+            tasks += self._batches("cards", options['cards'], options)
+        tasks += self._batches("transfers", options['transfers'], options)
+        self._run(tasks, options)
+        if not options['no_reconcile']:
+            started = time.perf_counter()
+            fixed = stats.reconcile()
+            self.stdout.write(f"statistika: {fixed} ta hisoblagich tuzatildi ({time.perf_counter() - started:.1f}s)")
+
+    def _batches(self, kind, total, options):
+        size = options['batch_size']
+        return [(kind, batch_no, start, min(start + size, total))
+                for batch_no, start in enumerate(range(0, total, size))]
+
+    def _run(self, tasks, options):
+        now = timezone.now()
+        done = {"cards": 0, "transfers": 0}
+        started = time.perf_counter()
+
+        def progress(kind, count):
+            done[kind] += count
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"cards={done['cards']} transfers={done['transfers']} "
+                              f"({sum(done.values()) / elapsed:.0f} rows/s)")
+
+        if options['processes'] == 1:
+            for kind, batch_no, start, end in tasks:
+                progress(*create_batch(kind, options, batch_no, start, end, now))
+        else:
+            _close_connections()
+            # kartalar transferlardan oldin: ular bir-biriga bog'lanmagan, lekin hisobot tartibli bo'lsin
+            with ProcessPoolExecutor(max_workers=options['processes'], initializer=_close_connections,
+                                     mp_context=multiprocessing.get_context("fork")) as pool:
+                for kind in ("cards", "transfers"):
+                    futures = [pool.submit(create_batch, kind, options, batch_no, start, end, now)
+                               for task_kind, batch_no, start, end in tasks if task_kind == kind]
+                    for future in as_completed(futures):
+                        progress(*future.result())
+        self.stdout.write(self.style.SUCCESS(
+            f"Tayyor: {done['cards']} karta, {done['transfers']} transfer, {time.perf_counter() - started:.1f}s"))
+
+    def _file_rows(self, options):
+        """Card rows in the formats seen in real uploads (spaces, other date formats, mixed case)."""
+        rng = random.Random(f"{options['seed']}-file")
+        for _, batch_no, start, end in self._batches("cards", options['cards'], options):
+            for number, expire, phone, status, balance in card_rows(options, batch_no, start, end):
+                if rng.random() < options['dirty_ratio']:
+                    yield number[:-1], expire, phone, status, balance  # 15 raqam: rad etiladi
+                    continue
+                if rng.random() < 0.3:
+                    number = " ".join(number[i:i + 4] for i in range(0, 16, 4))
+                if rng.random() < 0.3:
+                    month, year = expire.split("/")
+                    expire = f"20{year}-{month}"
+                if rng.random() < 0.3:
+                    phone = f"{phone[4:6]} {phone[6:9]} {phone[9:11]} {phone[11:]}"
+                yield number, expire, phone, status.capitalize() if rng.random() < 0.3 else status, balance
+
+    def _write_file(self, path, options):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+        if path.suffix == ".csv":
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerows(self._file_rows(options))
+        elif path.suffix == ".xlsx":
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet("cards")
+            for row in self._file_rows(options):
+                ws.append(row)
+            wb.save(path)
+        else:
+            raise CommandError("--cards-file .xlsx yoki .csv bo'lishi kerak")
+        self.stdout.write(f"{path}: {options['cards']} qator ({time.perf_counter() - started:.1f}s)")
@@ -0,0 +1,68 @@
+import io
+import pstats
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from src.benchmark import summarize
+from src.profiling import parse_filename
+
+
+class Command(BaseCommand):
+    help = ("PROFILE_DIR dagi .prof fayllarini (src/profiling.py) jamlab, metodlar bo'yicha chaqiruvlar vaqtini va "
+            "eng ko'p vaqt olgan N ta funksiyani chiqaradi.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None, help="profil papkasi (default: PROFILE_DIR)")
+        parser.add_argument('--method', action='append', default=[], help="faqat shu metod(lar), masalan transfer_create")
+        parser.add_argument('--top', type=int, default=25)
+        parser.add_argument('--sort', default='cumulative', choices=['cumulative', 'tottime', 'calls'])
+        parser.add_argument('--min-ms', type=float, default=0, help="faqat shundan sekin chaqiruvlar")
+        parser.add_argument('--slowest', type=int, default=0, help="faqat eng sekin N ta chaqiruv (0 - hammasi)")
+        parser.add_argument('--delete', action='store_true', help="hisobotdan keyin ishlatilgan fayllarni o'chirish")
+
+    def handle(self, *args, **options):
+        directory = Path(options['dir'] or settings.PROFILE_DIR)
+        profiles = []
+        for path in directory.glob("*.prof"):
+            parsed = parse_filename(path)
+            if parsed is None:
+                continue
+            method, ext_id, ms = parsed
+            if options['method'] and method not in options['method']:
+                continue
+            if ms >= options['min_ms']:
+                profiles.append((ms, method, ext_id, path))
+        if not profiles:
+            self.stdout.write(f"{directory} da profil topilmadi.")
+            return
+        profiles.sort(reverse=True)
+        if options['slowest']:
+            profiles = profiles[:options['slowest']]
+
+        durations = defaultdict(list)
+        for ms, method, _, _ in profiles:
+            durations[method].append(ms / 1000)
+        self.stdout.write(f"{'method':<20} {'profiles':>8} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for method, values in sorted(durations.items()):
+            stats = summarize(values)
+            self.stdout.write(f"{method:<20} {stats['count']:>8} {stats['p50_ms']:>9.2f} "
+                              f"{stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}")
+        self.stdout.write("slowest: " + ", ".join(f"{method}/{ext_id} {ms:.1f}ms"
+                                                  for ms, method, ext_id, _ in profiles[:5]))
+
+        report = io.StringIO()
+        stats = pstats.Stats(str(profiles[0][3]), stream=report)
+        for _, _, _, path in profiles[1:]:
+            stats.add(str(path))
+        stats.files = []  # har bir fayl nomi chiqarilmasin
+        stats.strip_dirs().sort_stats(options['sort']).print_stats(options['top'])
+        self.stdout.write(f"{len(profiles)} profiles, top {options['top']} by {options['sort']}:")
+        self.stdout.write(report.getvalue())
+
+        if options['delete']:
+            for _, _, _, path in profiles:
+                path.unlink(missing_ok=True)
+            self.stdout.write(f"{len(profiles)} ta fayl o'chirildi.")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from transfer.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = ("Statistika hisoblagichlari va kunlik rollup'larni Transfer va Card jadvallaridan qayta hisoblab "
+            "tuzatadi. Mavjud bazada birinchi marta ishga tushiring (beat vazifasi faqat oxirgi kunlarni ko'radi).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help="faqat oxirgi N kun rollup'lari (default: hammasi)")
+
+    def handle(self, *args, **options):
+        fixed = reconcile(days=options['days'])
+        self.stdout.write(self.style.SUCCESS(f"{fixed} ta hisoblagich tuzatildi."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from transfer.check_card.rate_store import fake_feed, refresh_rates
+
+
+class Command(BaseCommand):
+    help = "CBU valyuta kurslarini yuklab CurrencyRate jadvaliga yozadi (beat vazifasi bilan bir xil)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fake', action='store_true', help="cbu.uz o'rniga lokal soxta kurslardan foydalanish")
+
+    def handle(self, *args, **options):
+        count = refresh_rates(feed=fake_feed if options['fake'] else None)
+        self.stdout.write(self.style.SUCCESS(f"{count} ta valyuta kursi yangilandi."))
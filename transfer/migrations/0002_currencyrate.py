@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transfer', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=3, unique=True)),
+                ('ccy', models.CharField(max_length=3)),
+                ('rate', models.DecimalField(decimal_places=4, max_digits=20)),
+                ('nominal', models.PositiveIntegerField(default=1)),
+                ('rate_date', models.DateField(blank=True, null=True)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+    ]
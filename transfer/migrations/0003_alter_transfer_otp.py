@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transfer', '0002_currencyrate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transfer',
+            name='otp',
+            field=models.CharField(max_length=128),
+        ),
+    ]
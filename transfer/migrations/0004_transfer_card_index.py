@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transfer', '0003_alter_transfer_otp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transfer',
+            name='receiver_card_index',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='transfer',
+            name='sender_card_index',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='transfer',
+            name='receiver_card_number',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='transfer',
+            name='sender_card_number',
+            field=models.CharField(max_length=255),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excell', '0007_card_balance_entry_id'),
+        ('transfer', '0004_transfer_card_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('debit', 'Debit'), ('credit', 'Credit')], max_length=6)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='ledger_entries', to='excell.card')),
+                ('transfer', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='ledger_entries', to='transfer.transfer')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['card', 'id'], name='transfer_le_card_id_ced65b_idx')],
+            },
+        ),
+    ]
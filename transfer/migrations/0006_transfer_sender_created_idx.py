@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transfer', '0005_ledgerentry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['sender_card_index', '-created_at', '-id'], name='transfer_sender_created_idx'),
+        ),
+    ]
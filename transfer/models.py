@@ -1,5 +1,7 @@
 from django.db import models
 
+from excell.models import Card
+
 
 # Create your models here.
 class TransferState(models.TextChoices):
@@ -10,10 +12,12 @@ class TransferState(models.TextChoices):
 
 class Transfer(models.Model):
     ext_id = models.CharField(max_length=100, unique=True)
-    sender_card_number = models.CharField(max_length=16)
+    sender_card_number = models.CharField(max_length=255)  # Fernet bilan shifrlangan
+    sender_card_index = models.CharField(max_length=64, db_index=True, blank=True, default="")
     sender_card_expiry = models.CharField(max_length=5)
     sender_phone = models.CharField(max_length=13)
-    receiver_card_number = models.CharField(max_length=16)
+    receiver_card_number = models.CharField(max_length=255)  # Fernet bilan shifrlangan
+    receiver_card_index = models.CharField(max_length=64, db_index=True, blank=True, default="")
     receiver_phone = models.CharField(max_length=13)
     sending_amount = models.DecimalField(max_digits=20, decimal_places=2)
     currency = models.CharField(max_length=10)
@@ -22,12 +26,18 @@ class Transfer(models.Model):
                              choices=TransferState.choices,
                              default=TransferState.CREATED)
     try_count = models.IntegerField(default=0)
-    otp = models.CharField(max_length=10)
+    otp = models.CharField(max_length=128)  # otp_hasher.hash_otp natijasi
     created_at = models.DateTimeField(auto_now_add=True)
     confirmed_at = models.DateTimeField(null=True, blank=True)
     cancelled_at = models.DateTimeField(null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # transfer_filter: karta bo'yicha, eng yangisidan keyset sahifalash
+            models.Index(fields=["sender_card_index", "-created_at", "-id"], name="transfer_sender_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.ext_id}"
 
@@ -36,3 +46,81 @@ class Transfer(models.Model):
             "ext_id": self.ext_id,
             "state": self.get_state_display()
         }
+
+
+class CurrencyRate(models.Model):
+    """
+    Last known CBU exchange rate for a currency, refreshed by the
+    `notif_worker.tasks.refresh_currency_rates` beat task.
+    """
+    code = models.CharField(max_length=3, unique=True)  # ISO 4217 raqamli kod, masalan '643'
+    ccy = models.CharField(max_length=3)  # 'RUB', 'USD' ...
+    rate = models.DecimalField(max_digits=20, decimal_places=4)
+    nominal = models.PositiveIntegerField(default=1)
+    rate_date = models.DateField(null=True, blank=True)
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.ccy} ({self.code}): {self.rate}"
+
+
+class LedgerKind(models.TextChoices):
+    DEBIT = "debit", "Debit"
+    CREDIT = "credit", "Credit"
+
+
+class LedgerEntry(models.Model):
+    """
+    Append-only balance movement. A card's balance is Card.balance (the
+    snapshot) plus the entries with id > Card.balance_entry_id.
+    """
+    card = models.ForeignKey(Card, on_delete=models.PROTECT, related_name="ledger_entries")
+    transfer = models.ForeignKey(Transfer, on_delete=models.PROTECT, related_name="ledger_entries")
+    kind = models.CharField(max_length=6, choices=LedgerKind.choices)
+    amount = models.DecimalField(max_digits=20, decimal_places=2)  # chiqim manfiy, kirim musbat
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["card", "id"]),
+        ]
+
+    def __str__(self):
+        return f"{self.card_id} {self.amount}"
+
+
+class Counter(models.Model):
+    """
+    One shard of an incrementally maintained counter (see transfer.stats).
+    Writers add to a random shard, readers sum the shards of a name.
+    """
+    name = models.CharField(max_length=64)  # "transfers.confirmed.860", "cards.active" ...
+    shard = models.PositiveSmallIntegerField()
+    count = models.BigIntegerField(default=0)
+    amount = models.DecimalField(max_digits=24, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ("name", "shard")
+
+    def __str__(self):
+        return f"{self.name}[{self.shard}]: {self.count}"
+
+
+class DailyTransferRollup(models.Model):
+    """
+    Transfers created on `day` by their current state and currency, sharded
+    like Counter. A state transition moves the transfer between the rows of
+    the day it was created.
+    """
+    day = models.DateField()
+    state = models.CharField(max_length=20, choices=TransferState.choices)
+    currency = models.CharField(max_length=10)
+    shard = models.PositiveSmallIntegerField()
+    count = models.BigIntegerField(default=0)
+    amount = models.DecimalField(max_digits=24, decimal_places=2, default=0)  # sending_amount yig'indisi
+
+    class Meta:
+        unique_together = ("day", "state", "currency", "shard")
+
+    def __str__(self):
+        return f"{self.day} {self.state} {self.currency}[{self.shard}]: {self.count}"
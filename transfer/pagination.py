@@ -0,0 +1,68 @@
+"""
+Keyset pagination for transfer_filter.
+
+Pages are ordered by (created_at, id) descending. The cursor holds the
+(created_at, id) of the last returned row, signed so clients can not edit
+it, and the next page starts strictly after it. Every page is one range
+scan on the (sender_card_index, created_at, id) index, however deep the
+client pages.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+
+CURSOR_SALT = "transfer.pagination"
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    return signing.dumps([created_at.isoformat(), pk], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, pk = signing.loads(cursor, salt=CURSOR_SALT)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (signing.BadSignature, TypeError, ValueError) as e:
+        raise InvalidCursor(str(e))
+
+
+def page_size(limit=None):
+    if limit is None:
+        return settings.TRANSFER_FILTER_PAGE_SIZE
+    return max(1, min(int(limit), settings.TRANSFER_FILTER_MAX_PAGE_SIZE))
+
+
+def _page_queryset(queryset, fields, cursor, size):
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        # created_at__lte indeks bo'yicha diapazonni cheklaydi, OR esa bir xil vaqtli qatorlarni id bilan ajratadi
+        queryset = queryset.filter(created_at__lte=created_at).filter(Q(created_at__lt=created_at) | Q(id__lt=pk))
+    return queryset.order_by("-created_at", "-id").values("id", "created_at", *fields)[:size + 1]
+
+
+def _next_page(rows, size):
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    return rows, encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+
+def paginate(queryset, fields, cursor=None, limit=None):
+    """
+    :param fields: fields passed to values(); created_at and id are always fetched
+    :return: (rows, next_cursor) - next_cursor is None on the last page
+    """
+    size = page_size(limit)
+    return _next_page(list(_page_queryset(queryset, fields, cursor, size)), size)
+
+
+async def apaginate(queryset, fields, cursor=None, limit=None):
+    """paginate() with the async ORM."""
+    size = page_size(limit)
+    return _next_page([row async for row in _page_queryset(queryset, fields, cursor, size)], size)
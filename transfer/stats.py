@@ -0,0 +1,183 @@
+"""
+Incrementally maintained transfer and card statistics.
+
+Counters are updated in the same transaction as the change they count, so
+reports read a handful of rows instead of COUNT(*) over the whole history:
+
+* Counter "transfers.<state>.<currency>" - transfers in that state and the
+  sum of their sending_amount;
+* Counter "cards.<status>" - cards by status ("cards.none" without status);
+* DailyTransferRollup - the same transfer numbers per day of creation.
+
+Every row is split into STATS_COUNTER_SHARDS shards and a writer adds to a
+random one, so concurrent transfers rarely wait on the same row. Card edits
+outside the importer and admin, raw SQL and failed hooks make the numbers
+drift; `reconcile` recomputes them from the source tables and writes the
+difference.
+"""
+import random
+from collections import Counter as Multiset, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from excell.models import Card
+from transfer.models import Counter, DailyTransferRollup, Transfer, TransferState
+
+
+def _add(model, keys, count, amount=0, shard=None):
+    shard = random.randrange(settings.STATS_COUNTER_SHARDS) if shard is None else shard
+    rows = model.objects.filter(shard=shard, **keys)
+    if not rows.update(count=F("count") + count, amount=F("amount") + amount):
+        model.objects.bulk_create([model(shard=shard, **keys)], ignore_conflicts=True)
+        rows.update(count=F("count") + count, amount=F("amount") + amount)
+
+
+def _transfer_keys(transfer, state):
+    return (
+        {"name": f"transfers.{state}.{transfer.currency}"},
+        {"day": timezone.localdate(transfer.created_at), "state": state, "currency": transfer.currency},
+    )
+
+
+def transfer_created(transfer):
+    counter, rollup = _transfer_keys(transfer, transfer.state)
+    _add(Counter, counter, 1, transfer.sending_amount)
+    _add(DailyTransferRollup, rollup, 1, transfer.sending_amount)
+
+
+def transfer_moved(transfer, from_state, to_state):
+    for state, sign in ((from_state, -1), (to_state, 1)):
+        counter, rollup = _transfer_keys(transfer, state)
+        _add(Counter, counter, sign, sign * transfer.sending_amount)
+        _add(DailyTransferRollup, rollup, sign, sign * transfer.sending_amount)
+
+
+def cards_changed(removed=(), added=()):
+    """:param removed, added: statuses of deleted / created cards (old / new status of an edited card)"""
+    changes = Multiset(f"cards.{status or 'none'}" for status in added)
+    changes.subtract(f"cards.{status or 'none'}" for status in removed)
+    for name, count in changes.items():
+        if count:
+            _add(Counter, {"name": name}, count)
+
+
+def _counters(prefix):
+    rows = Counter.objects.filter(name__startswith=prefix).values("name").annotate(
+        count=Sum("count"), amount=Sum("amount"))
+    return {row["name"][len(prefix):]: row for row in rows}
+
+
+def totals():
+    """
+    :return: {"transfers", "transfers_by_state": {state: count},
+              "volume_by_currency": {currency: confirmed sending_amount}, "cards", "active_cards"}
+    """
+    by_state = dict.fromkeys(TransferState.values, 0)
+    volume = defaultdict(Decimal)
+    for key, row in _counters("transfers.").items():
+        state, currency = key.split(".", 1)
+        by_state[state] = by_state.get(state, 0) + row["count"]
+        if state == TransferState.CONFIRMED and row["count"]:
+            volume[currency] += row["amount"]
+    cards = _counters("cards.")
+    return {
+        "transfers": sum(by_state.values()),
+        "transfers_by_state": by_state,
+        "volume_by_currency": dict(volume),
+        "cards": sum(row["count"] for row in cards.values()),
+        "active_cards": cards.get("active", {}).get("count", 0),
+    }
+
+
+def daily(day=None):
+    """:return: {state: {currency: {"count", "amount"}}} for transfers created on `day` (today by default)"""
+    rows = DailyTransferRollup.objects.filter(day=day or timezone.localdate()).values(
+        "state", "currency").annotate(count=Sum("count"), amount=Sum("amount"))
+    result = defaultdict(dict)
+    for row in rows:
+        if row["count"]:
+            result[row["state"]][row["currency"]] = {"count": row["count"], "amount": row["amount"]}
+    return dict(result)
+
+
+def _fix(model, fields, actual, stored):
+    """Adds actual - stored to shard 0 of every key. :return: number of corrected keys"""
+    fixed = 0
+    for key in actual.keys() | stored.keys():
+        count, amount = actual.get(key, (0, 0))
+        stored_count, stored_amount = stored.get(key, (0, 0))
+        if count != stored_count or amount != stored_amount:
+            _add(model, dict(zip(fields, key)), count - stored_count, amount - stored_amount, shard=0)
+            fixed += 1
+    return fixed
+
+
+def _grouped(queryset, key):
+    return {key(row): (row["count"], row.get("amount") or 0) for row in queryset}
+
+
+def _snapshot():
+    """
+    Makes the new transaction read one snapshot. Under READ COMMITTED every
+    PostgreSQL statement sees the commits made before it, so a transfer
+    committed between the GROUP BY over Transfer and the read of the counters
+    would be corrected twice. A SQLite transaction reads one snapshot anyway.
+    Must be the first statement of the transaction.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+
+
+def _differences(days):
+    """:return: [(model, key fields, actual, stored)] read from one snapshot"""
+    actual = _grouped(
+        Transfer.objects.values("state", "currency").annotate(count=Count("id"), amount=Sum("sending_amount")),
+        lambda row: (f"transfers.{row['state']}.{row['currency']}",),
+    )
+    actual.update(_grouped(
+        Card.objects.values("status").annotate(count=Count("id")),
+        lambda row: (f"cards.{row['status'] or 'none'}",),
+    ))
+    stored = _grouped(Counter.objects.values("name").annotate(count=Sum("count"), amount=Sum("amount")),
+                      lambda row: (row["name"],))
+    counters = (Counter, ("name",), actual, stored)
+
+    transfers, rollups = Transfer.objects.all(), DailyTransferRollup.objects.all()
+    if days is not None:
+        since = timezone.localdate() - timedelta(days=days - 1)
+        transfers, rollups = transfers.filter(created_at__date__gte=since), rollups.filter(day__gte=since)
+    fields = ("day", "state", "currency")
+    row_key = lambda row: tuple(row[field] for field in fields)  # noqa: E731
+    actual = _grouped(
+        transfers.annotate(day=TruncDate("created_at")).values(*fields).annotate(
+            count=Count("id"), amount=Sum("sending_amount")),
+        row_key,
+    )
+    stored = _grouped(rollups.values(*fields).annotate(count=Sum("count"), amount=Sum("amount")), row_key)
+    return [counters, (DailyTransferRollup, fields, actual, stored)]
+
+
+def reconcile(days=None):
+    """
+    Recomputes the counters and the rollups of the last `days` days (all days
+    when None) from Transfer and Card, and corrects the stored values.
+    Source tables and stored values are read from one snapshot; corrections
+    are increments, so transfers committed after it are not lost.
+    :return: number of corrected counters and rollup rows
+    """
+    if connection.in_atomic_block:
+        # tashqi tranzaksiya (masalan testlar) izolyatsiyasini o'zgartirib bo'lmaydi
+        differences = _differences(days)
+    else:
+        with transaction.atomic():
+            _snapshot()
+            differences = _differences(days)
+    with transaction.atomic():
+        return sum(_fix(*difference) for difference in differences)
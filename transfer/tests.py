@@ -1,3 +1,369 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import bcrypt
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Sum, Value
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from excell.models import Card, CardStatus
+from notif_worker.models import OutboxMessage
+from transfer import async_views, balance, card_cache, checks, stats, views
+from transfer.balance import TransferError
+from transfer.check_card import rate_store
+from transfer.check_card.convert_balance import valyuta
+from transfer.check_card.otp_hasher import hash_otp, verify_otp
+from transfer.loader import Loader
+from transfer.models import Counter, CurrencyRate, LedgerEntry, LedgerKind, Transfer, TransferState
+from transfer.pagination import encode_cursor
+from transfer.views import create_transfer
+
+SENDER = "8600000000000001"
+RECEIVER = "8600000000000002"
+SENDER_PHONE = "+998901112233"
+RECEIVER_PHONE = "+998901112244"
+OTP = 123456
+
+
+class TransferTestCase(TestCase):
+    def setUp(self):
+        Card.objects.create(card_number=SENDER, expire="12/30", phone=SENDER_PHONE, status=CardStatus.ACTIVE,
+                            balance=100000)
+        Card.objects.create(card_number=RECEIVER, expire="12/30", phone=RECEIVER_PHONE, status=CardStatus.ACTIVE,
+                            balance=0)
+
+    def create(self, ext_id="t1", amount=1000):
+        with mock.patch("transfer.views.otp_code", return_value=OTP):
+            return create_transfer(ext_id, SENDER, "12/30", SENDER_PHONE, RECEIVER, RECEIVER_PHONE, amount, "860")
+
+    def rpc(self, method, path="/", **params):
+        response = self.client.post(path, json.dumps({"jsonrpc": "2.0", "id": 1, "method": method, "params": params}),
+                                    content_type="application/json")
+        return json.loads(response.content)
+
+    def balance_of(self, card_number):
+        return Card.objects.get(card_number=card_number).current_balance()
+
+
+class BalanceTests(TransferTestCase):
+    def test_confirm_and_cancel_conserve_ledger_totals(self):
+        transfer = self.create(amount=1000)
+        balance.confirm(transfer)
+        self.assertEqual(self.balance_of(SENDER), Decimal(99000))
+        self.assertEqual(self.balance_of(RECEIVER), Decimal(1000))
+        self.assertEqual(LedgerEntry.objects.aggregate(total=Sum("amount"))["total"], 0)
+
+        balance.cancel(transfer)
+        self.assertEqual(self.balance_of(SENDER), Decimal(100000))
+        self.assertEqual(self.balance_of(RECEIVER), Decimal(0))
+        self.assertEqual(LedgerEntry.objects.aggregate(total=Sum("amount"))["total"], 0)
+        self.assertEqual(Transfer.objects.get(pk=transfer.pk).state, TransferState.CANCELLED)
+
+    def test_second_confirm_is_rejected(self):
+        transfer = self.create()
+        balance.confirm(Transfer.objects.get(pk=transfer.pk))
+        with self.assertRaises(TransferError) as raised:
+            balance.confirm(transfer)  # eski nusxa hali "created" holatida
+        self.assertEqual(raised.exception.code, 400)
+        self.assertEqual(Transfer.objects.get(pk=transfer.pk).state, TransferState.CONFIRMED)
+        self.assertEqual(LedgerEntry.objects.filter(kind=LedgerKind.DEBIT).count(), 1)
+
+    def test_second_cancel_is_rejected(self):
+        transfer = self.create()
+        balance.confirm(transfer)
+        balance.cancel(Transfer.objects.get(pk=transfer.pk))
+        with self.assertRaises(TransferError):
+            balance.cancel(Transfer.objects.get(pk=transfer.pk))
+        self.assertEqual(LedgerEntry.objects.count(), 4)
+        self.assertEqual(self.balance_of(SENDER), Decimal(100000))
+
+    def test_insufficient_balance_is_rejected(self):
+        transfer = self.create(amount=200000)
+        with self.assertRaises(TransferError) as raised:
+            balance.confirm(transfer)
+        self.assertEqual(raised.exception.message, "your balance is not enough!")
+        self.assertFalse(LedgerEntry.objects.exists())
+        self.assertEqual(Transfer.objects.get(pk=transfer.pk).state, TransferState.CREATED)
+
+
+class ReconcileTests(TransferTestCase):
+    def test_reconcile_corrects_drift(self):
+        stats.reconcile()  # setUp kartalari hisoblagichsiz yaratilgan
+        balance.confirm(self.create())
+        self.assertEqual(stats.reconcile(), 0)
+        Counter.objects.filter(name="transfers.confirmed.860").update(count=5)
+        Transfer.objects.filter(ext_id="t1").update(sending_amount=3000)  # hisoblagichsiz o'zgarish
+
+        self.assertEqual(stats.reconcile(), 2)  # hisoblagich va kunlik rollup
+        self.assertEqual(stats.totals()["transfers_by_state"][TransferState.CONFIRMED], 1)
+        self.assertEqual(stats.totals()["volume_by_currency"]["860"], Decimal(3000))
+        self.assertEqual(stats.reconcile(), 0)
+
+
+class CardCacheTests(TransferTestCase):
+    def setUp(self):
+        super().setUp()
+        caches[settings.CARD_CACHE].clear()
+        card_cache._local.clear()
+
+    def batch(self):
+        loader = Loader()
+        loader.prime([{"method": "card.info", "params": {"card_number": number}} for number in (SENDER, RECEIVER)])
+        return SimpleNamespace(loader=loader)
+
+    def card_info(self, card_number, context=None):
+        result = views.card_info.__wrapped__(context or SimpleNamespace(loader=None), card_number, "12/30")
+        return result._value.result["balance"]  # Success -> Right(SuccessResult)
+
+    def acard_info(self, card_number, context):
+        result = async_to_sync(async_views.card_info.__wrapped__)(context, card_number, "12/30")
+        return result._value.result["balance"]
+
+    def change_receiver(self):
+        balance.confirm(self.create(amount=1000))
+        card_cache.forget([SENDER, RECEIVER])  # commit dagi invalidatsiya
+        card_cache._local.clear()  # L1 boshqa jarayonda
+
+    def test_batch_row_read_before_invalidation_is_not_cached(self):
+        context = self.batch()
+        self.assertEqual(self.card_info(SENDER, context), 100000)  # ikkala karta ham shu so'rovda o'qildi
+        self.change_receiver()
+        self.assertEqual(self.card_info(RECEIVER, context), 0)  # batch ichida eski qator
+        self.assertEqual(self.card_info(RECEIVER), 1000)
+
+    def test_batch_row_read_before_invalidation_is_not_cached_async(self):
+        context = self.batch()
+        self.assertEqual(self.acard_info(SENDER, context), 100000)
+        self.change_receiver()
+        self.assertEqual(self.acard_info(RECEIVER, context), 0)
+        self.assertEqual(self.acard_info(RECEIVER, SimpleNamespace(loader=None)), 1000)
+
+    def test_batch_rows_are_cached(self):
+        context = self.batch()
+        self.card_info(SENDER, context)
+        self.card_info(RECEIVER, context)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.card_info(RECEIVER), 0)
+
+
+class IdempotencyTests(TransferTestCase):
+    def setUp(self):
+        super().setUp()
+        caches[settings.IDEMPOTENCY_CACHE].clear()
+
+    def transfer_create(self, sending_amount=1000, currency="860", receiver_phone=RECEIVER_PHONE):
+        return self.rpc("transfer_create", ext_id="t1", sender_card_number=SENDER, sender_card_expiry="12/30",
+                        sender_phone=SENDER_PHONE, receiver_card_number=RECEIVER, receiver_phone=receiver_phone,
+                        sending_amount=sending_amount, currency=currency)
+
+    def assert_created_once(self, response, first):
+        self.assertEqual(response, first)
+        self.assertEqual(Transfer.objects.count(), 1)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_cached_replay(self):
+        first = self.transfer_create()
+        self.assertEqual(first["result"]["state"], TransferState.CREATED.label)
+        with mock.patch("transfer.views.transfer_cards") as cards:
+            self.assert_created_once(self.transfer_create(), first)
+        self.assertFalse(cards.called)
+
+    def test_database_replay_after_cache_expiry(self):
+        first = self.transfer_create()
+        caches[settings.IDEMPOTENCY_CACHE].clear()
+        with mock.patch("transfer.views.create_transfer") as create:
+            self.assert_created_once(self.transfer_create(), first)
+        self.assertFalse(create.called)
+
+    def test_concurrent_call_replays_without_second_outbox_row(self):
+        first = self.transfer_create()
+        caches[settings.IDEMPOTENCY_CACHE].clear()
+
+        def cards_before_insert(ext_id, sender_card_number, receiver_card_number):
+            # parallel chaqiruv ext_id hali yozilmaganini ko'rgan
+            return Card.objects.with_current_balance().filter(
+                card_number__in=[sender_card_number, receiver_card_number]).annotate(ext_id_taken=Value(False))
+
+        with mock.patch("transfer.views.transfer_cards", side_effect=cards_before_insert), \
+                mock.patch("transfer.views.create_transfer", wraps=create_transfer) as create:
+            self.assert_created_once(self.transfer_create(), first)
+        self.assertTrue(create.called)  # INSERT unique ext_id da to'xtadi
+
+    def test_other_parameters_conflict(self):
+        self.transfer_create()
+        self.assertEqual(self.transfer_create(sending_amount=2000)["error"]["code"], 409)
+        caches[settings.IDEMPOTENCY_CACHE].clear()
+        self.assertEqual(self.transfer_create(receiver_phone=SENDER_PHONE)["error"]["code"], 409)
+        self.assertEqual(Transfer.objects.count(), 1)
+
+    def test_unknown_currency_is_rejected(self):
+        for path in ("/", "/async/"):
+            response = self.rpc("transfer_create", path=path, ext_id="t1", sender_card_number=SENDER,
+                                sender_card_expiry="12/30", sender_phone=SENDER_PHONE, receiver_card_number=RECEIVER,
+                                receiver_phone=RECEIVER_PHONE, sending_amount=1000, currency="999")
+            self.assertEqual(response["error"], {"code": 400, "message": "currency rate unavailable"})
+        self.assertFalse(Transfer.objects.exists())
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_amount_and_currency_are_normalized(self):
+        first = self.transfer_create(sending_amount=1000, currency=860)
+        self.assert_created_once(self.transfer_create(sending_amount="1000.00", currency="860"), first)
+        caches[settings.IDEMPOTENCY_CACHE].clear()
+        self.assert_created_once(self.transfer_create(sending_amount=1000.0, currency="860"), first)
+
+
+class RateStoreTests(TestCase):
+    def setUp(self):
+        caches[settings.FX_RATE_CACHE].clear()
+        rate_store.clear_local_rates()
+        self.addCleanup(rate_store.clear_local_rates)
+
+    def test_rate_is_per_unit_of_nominal(self):
+        rate_store.refresh_rates(rate_store.FakeRateFeed({"392": ("JPY", "850.00")}))
+        CurrencyRate.objects.filter(code="392").update(nominal=10)  # CBU: 10 JPY = 850 UZS
+        caches[settings.FX_RATE_CACHE].clear()
+        rate_store.clear_local_rates()
+        self.assertEqual(valyuta(850, "392"), 10)
+
+    @override_settings(FX_RATE_LOCAL_TTL=0)
+    def test_local_cache_rereads_database(self):
+        # REDIS_URL siz: beat boshqa jarayonda kursni yangilaydi, bu jarayon keshiga yozmaydi
+        rate_store.refresh_rates(rate_store.FakeRateFeed({"840": ("USD", "12000")}))
+        caches[settings.FX_RATE_CACHE].clear()
+        self.assertEqual(rate_store.get_rate("840"), 12000)
+        CurrencyRate.objects.filter(code="840").update(rate=13000)
+        self.assertEqual(rate_store.get_rate("840"), 13000)
+
+
+class SharedCacheCheckTests(TestCase):
+    def test_local_cards_cache_is_reported(self):
+        local = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        redis = {"BACKEND": "django_redis.cache.RedisCache", "LOCATION": "redis://localhost:6379/1"}
+        with override_settings(CACHES={"default": local, "rates": redis, "cards": local, "idempotency": redis}):
+            self.assertEqual([error.id for error in checks.check_shared_caches(None)], ["transfer.W001"])
+            self.assertEqual(checks.local_caches(), ["cards"])
+        with override_settings(CACHES={"default": local, "rates": redis, "cards": redis, "idempotency": redis}):
+            self.assertEqual(checks.check_shared_caches(None), [])
+
+
+class TransferFilterTests(TransferTestCase):
+    def setUp(self):
+        super().setUp()
+        for number in range(6):
+            self.create(ext_id=f"t{number}")
+        # t1..t5 bir xil vaqtda: sahifa chegarasi bir xil created_at li qatorlar orasiga tushadi
+        same = Transfer.objects.get(ext_id="t1").created_at
+        Transfer.objects.exclude(ext_id="t0").update(created_at=same)
+        Transfer.objects.filter(ext_id="t0").update(created_at=same - timedelta(minutes=1))
+
+    def page(self, path="/", **params):
+        return self.rpc("transfer_filter", path=path, card_number=SENDER, **params)
+
+    def walk(self, path):
+        ext_ids, cursor = [], None
+        while True:
+            result = self.page(path, limit=2, **({"cursor": cursor} if cursor else {}))["result"]
+            ext_ids.extend(item["ext_id"] for item in result["items"])
+            cursor = result["next_cursor"]
+            if cursor is None:
+                return ext_ids
+
+    def test_pages_cover_rows_with_the_same_created_at(self):
+        for path in ("/", "/async/"):
+            self.assertEqual(self.walk(path), ["t5", "t4", "t3", "t2", "t1", "t0"])
+
+    def test_last_page_has_no_cursor(self):
+        self.assertIsNone(self.page(limit=6)["result"]["next_cursor"])
+        self.assertIsNotNone(self.page(limit=5)["result"]["next_cursor"])
+
+    def test_tampered_cursor_is_rejected(self):
+        cursor = self.page(limit=2)["result"]["next_cursor"]
+        # boshqa qiymat eski imzo bilan
+        forged = encode_cursor(timezone.now(), 10 ** 6).rsplit(":", 1)[0] + ":" + cursor.rsplit(":", 1)[1]
+        for bad in (forged, cursor[:-1] + ("A" if cursor[-1] != "A" else "B"), "garbage"):
+            for path in ("/", "/async/"):
+                self.assertEqual(self.page(path, cursor=bad)["error"], {"code": 400, "message": "invalid cursor!"})
+
+    @override_settings(TRANSFER_FILTER_MAX_PAGE_SIZE=3)
+    def test_limit_is_capped(self):
+        self.assertEqual(len(self.page(limit=1000)["result"]["items"]), 3)
+        self.assertEqual(len(self.page(limit=0)["result"]["items"]), 1)
+        self.assertEqual(self.page(limit="many")["error"]["code"], 400)
+
+
+class ConfirmTransferTests(TransferTestCase):
+    def confirm_meanwhile(self, *args, **kwargs):
+        # OTP tekshirilayotganda boshqa so'rov transferni tasdiqlab ulguradi
+        balance.confirm(Transfer.objects.get(ext_id="t1"))
+        return False
+
+    def assert_confirmed_once(self):
+        transfer = Transfer.objects.get(ext_id="t1")
+        self.assertEqual(transfer.state, TransferState.CONFIRMED)
+        self.assertIsNotNone(transfer.confirmed_at)
+        self.assertEqual(transfer.try_count, 1)
+        self.assertEqual(LedgerEntry.objects.filter(kind=LedgerKind.DEBIT).count(), 1)
+        self.assertEqual(self.balance_of(SENDER), Decimal(99000))
+
+    def test_wrong_otp_does_not_overwrite_concurrent_confirm(self):
+        self.create()
+        with mock.patch("transfer.views.verify_otp", side_effect=self.confirm_meanwhile):
+            self.assertEqual(self.rpc("confirm_transfer", ext_id="t1", otp="000000")["error"]["code"], 400)
+        self.assertEqual(self.rpc("confirm_transfer", ext_id="t1", otp=str(OTP))["error"]["message"],
+                         "Transfer is in an invalid state!")
+        self.assert_confirmed_once()
+
+    def test_wrong_otp_does_not_overwrite_concurrent_confirm_async(self):
+        stale = self.create()
+        balance.confirm(Transfer.objects.get(pk=stale.pk))
+
+        async def first(queryset):
+            return stale  # tasdiqlashdan oldin o'qilgan qator
+
+        with mock.patch("django.db.models.query.QuerySet.afirst", first):
+            response = self.rpc("confirm_transfer", path="/async/", ext_id="t1", otp="000000")
+        self.assertEqual(response["error"]["code"], 400)
+        self.assert_confirmed_once()
+
+    @override_settings(OTP_BCRYPT_ROUNDS=4)
+    def test_async_bcrypt_check_runs_off_the_event_loop(self):
+        transfer = self.create()
+        Transfer.objects.filter(pk=transfer.pk).update(otp=hash_otp(OTP, mode="bcrypt"))  # eski bcrypt qatori
+        loops, original = [], bcrypt.checkpw
+
+        def checkpw(*args):
+            try:
+                loops.append(asyncio.get_running_loop())
+            except RuntimeError:
+                loops.append(None)  # oqimda, event loop bo'sh
+            return original(*args)
+
+        with mock.patch("transfer.check_card.otp_hasher.bcrypt.checkpw", side_effect=checkpw):
+            response = self.rpc("confirm_transfer", path="/async/", ext_id="t1", otp=str(OTP))
+        self.assertEqual(response["result"]["state"], TransferState.CONFIRMED.label)
+        self.assertEqual(loops, [None])
+
+    def test_attempt_limit(self):
+        self.create()
+        for _ in range(3):
+            self.assertEqual(self.rpc("confirm_transfer", ext_id="t1", otp="000000")["error"]["code"], 400)
+        self.assertEqual(self.rpc("confirm_transfer", ext_id="t1", otp=str(OTP))["error"]["code"], 429)
+        self.assertEqual(Transfer.objects.get(ext_id="t1").try_count, 3)
+
+    def test_attempt_limit_reached_meanwhile(self):
+        transfer = self.create()
+
+        def exhaust(*args, **kwargs):
+            Transfer.objects.filter(pk=transfer.pk).update(try_count=3)
+            return verify_otp(*args, **kwargs)
+
+        with mock.patch("transfer.views.verify_otp", side_effect=exhaust):
+            self.assertEqual(self.rpc("confirm_transfer", ext_id="t1", otp="000000")["error"]["code"], 429)
+        self.assertEqual(Transfer.objects.get(pk=transfer.pk).try_count, 3)
@@ -1,7 +1,10 @@
 from django.urls import path
 
-from transfer.views import jsonrpc
+from transfer.async_views import async_jsonrpc
+from transfer.views import jsonrpc, prometheus_metrics
 
 urlpatterns = [
-    path('', jsonrpc)
+    path('', jsonrpc),
+    path('async/', async_jsonrpc),
+    path('metrics', prometheus_metrics),
 ]
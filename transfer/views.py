@@ -1,29 +1,39 @@
+import json
 from datetime import timezone, datetime
 
-import bcrypt
-from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F
 from django.http import HttpResponse
-from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from jsonrpcserver import Error, Success, dispatch, method
+from jsonrpcserver.methods import global_methods
 from jsonrpcserver.result import Result
 
-from excell.models import Card
+from excell.models import Card, CardStatus
+from logger.logger import log_request_response
+from notif_worker.outbox import enqueue_otp
+from src import metrics, profiling
+from transfer import balance, card_cache, idempotency, stats
+from transfer.balance import TransferError
 from transfer.check_card.check import is_card_expired
-from transfer.check_card.convert_balance import valyuta, convert_rub_to_uzs
+from transfer.check_card.convert_balance import valyuta
 from transfer.check_card.create_otp import otp_code
-from transfer.check_card.fernet import encrypt_card, decrypt_card
-from transfer.check_card.send_otp_telegram import send_otp_telegram
+from transfer.check_card.fernet import encrypt_card, card_index
+from transfer.check_card.otp_hasher import hash_otp, verify_otp
+from transfer.check_card.rate_store import RateUnavailable
+from transfer.loader import Loader, get_loader
 from transfer.models import Transfer, TransferState
+from transfer.pagination import InvalidCursor, paginate
 
 
 @method(name='card.info')
-# @log_request_response
+@log_request_response
 def card_info(context, card_number, expire):
     """
     ------------------------------------------------------------------------------------
     Retrieves information about a specific card using card number and expiry date.
-    Results are cached for 30 seconds to improve performance.
+    Results are cached in the process and in Redis until the card's balance
+    changes (transfer.card_cache).
     ------------------------------------------------------------------------------------
     :param context: The request context or session object.
     :param card_number: The number of the card to retrieve information for.
@@ -33,22 +43,20 @@ def card_info(context, card_number, expire):
     :return: A dictionary containing card details if found, otherwise an error message.
              Example: {"card_number", "expire", "balance", ...}
     """
-    card_cache_key = f"cache_key_{card_number}_{expire}"
-    card_cache = cache.get(card_cache_key)
+    def fetch():
+        # batch ichidagi barcha card.info kartalari bitta so'rovda o'qiladi
+        loader = get_loader(context)
+        card = loader.get("card", card_number)
+        return (None if card is None else card.card_result()), loader.version("card", card_number)
 
-    if card_cache:
-        return Success(card_cache)
-
-    try:
-        card = Card.objects.get(card_number=card_number, expire=expire)
-        cache.set(key=card_cache_key, value=card.card_result(), timeout=30)
-        return Success(card.card_result())
-    except Card.DoesNotExist:
+    result = card_cache.get(card_number, fetch)
+    if result is None or result["expire"] != expire:
         return Error(message="card not found", code=404)
+    return Success(result)
 
 
 @method(name="transfer_create")
-# @log_request_response
+@log_request_response
 def transfer_create(context,
                     ext_id,
                     sender_card_number,
@@ -74,60 +82,150 @@ def transfer_create(context,
     :param receiver_phone : Phone number associated with the receiver's card. this is the type of variable str
     :param sending_amount : The amount of money to be transferred. this is the type of variable float
     :param currency : The currency of the sending amount (e.g. 'RUB', 'UZS'). this is the type of variable str
-    :return: {"ext_id","state"}
+    :return: {"ext_id","state"}; a repeated call with the same ext_id and parameters gets the same answer
     """
-    if Transfer.objects.filter(ext_id=ext_id).first():
-        return Error(message="ext_id exists!", code=409)
-    try:
-        sender_card = Card.objects.get(card_number=sender_card_number)
-        if is_card_expired(sender_card_expiry):
-            return Error(message="sender card expired!", code=400)
-        if sender_card.status != 'active':
-            return Error(message="sender card status is inactive", code=400)
-        if sender_card.phone == "None":
-            return Error(message="sms not connected!", code=400)
-        if sender_card.phone != sender_phone:
-            return Error(message="both phone numbers are not uniform!", code=400)
-        if sender_card.balance < sending_amount:
-            return Error(message="your balance is not enough!", code=400)
-    except Card.DoesNotExist:
+    fingerprint = idempotency.fingerprint(sender_card_number, sender_card_expiry, sender_phone,
+                                          receiver_card_number, receiver_phone, sending_amount, currency)
+    # mijozning takroriy so'rovi bazaga tegmasdan javob oladi
+    replay = idempotency.replay(ext_id, fingerprint)
+    if replay is not None:
+        return replay
+    cards = list(transfer_cards(ext_id, sender_card_number, receiver_card_number))
+    if not cards or cards[0].ext_id_taken:
+        replay = replay_existing(ext_id, fingerprint)
+        if replay is not None:
+            return replay
+    error = check_cards(cards, sender_card_number, sender_card_expiry, sender_phone,
+                        receiver_card_number, sending_amount)
+    if error:
+        return error
+    result = create_or_replay(ext_id, fingerprint, sender_card_number, sender_card_expiry, sender_phone,
+                              receiver_card_number, receiver_phone, sending_amount, currency)
+    get_loader(context).forget("transfer", ext_id)
+    return result
+
+
+def transfer_cards(ext_id, sender_card_number, receiver_card_number):
+    """Sender and receiver cards in one query, annotated with `ext_id_taken`."""
+    return Card.objects.with_current_balance().filter(
+        card_number__in=[sender_card_number, receiver_card_number]
+    ).annotate(ext_id_taken=Exists(Transfer.objects.filter(ext_id=ext_id)))
+
+
+def check_cards(cards, sender_card_number, sender_card_expiry, sender_phone, receiver_card_number, sending_amount):
+    """:return: Error when the cards of transfer_cards() can not be used, otherwise None"""
+    cards = {card.card_number: card for card in cards}
+    sender_card = cards.get(sender_card_number)
+    if sender_card is None:
         return Error(message="card not found!", code=404)
-    try:
-        receiver_card = Card.objects.get(card_number=receiver_card_number)
-        if receiver_card.status != "active":
-            return Error(message="the receiving card is invalid!", code=400)
-        if is_card_expired(receiver_card.expire):
-            return Error(message="receiving card expired!", code=400)
-        if receiver_card.phone == "None":
-            return Error(message="SMS not connected!", code=400)
-    except Card.DoesNotExist:
+    error = check_sender(sender_card, sender_card_expiry, sender_phone, sending_amount)
+    if error:
+        return error
+    receiver_card = cards.get(receiver_card_number)
+    if receiver_card is None:
         return Error(message="receiver card not found!", code=404)
+    return check_receiver(receiver_card)
+
+
+def check_sender(sender_card, sender_card_expiry, sender_phone, sending_amount):
+    """:return: Error for an unusable sender card, otherwise None"""
+    if is_card_expired(sender_card_expiry):
+        return Error(message="sender card expired!", code=400)
+    if sender_card.status != CardStatus.ACTIVE:
+        return Error(message="sender card status is inactive", code=400)
+    if sender_card.phone == "None":
+        return Error(message="sms not connected!", code=400)
+    if sender_card.phone != sender_phone:
+        return Error(message="both phone numbers are not uniform!", code=400)
+    if sender_card.current_balance() < sending_amount:
+        return Error(message="your balance is not enough!", code=400)
+    return None
+
+
+def check_receiver(receiver_card):
+    """:return: Error for an unusable receiver card, otherwise None"""
+    if receiver_card.status != CardStatus.ACTIVE:
+        return Error(message="the receiving card is invalid!", code=400)
+    if is_card_expired(receiver_card.expire):
+        return Error(message="receiving card expired!", code=400)
+    if receiver_card.phone == "None":
+        return Error(message="SMS not connected!", code=400)
+    return None
+
+
+def replay_existing(ext_id, fingerprint):
+    """:return: the answer for an ext_id that already has a transfer, None when it has not"""
+    transfer = Transfer.objects.filter(ext_id=ext_id).first()
+    return None if transfer is None else idempotency.replay_transfer(transfer, fingerprint)
+
+
+def create_or_replay(ext_id, fingerprint, *args):
+    """create_transfer(ext_id, *args). :return: Success, or the replay when a concurrent call won the ext_id"""
+    try:
+        transfer = create_transfer(ext_id, *args)
+    except RateUnavailable:
+        # kurs yo'q: transfer yozilmaydi (valyuta() INSERT dan oldin chaqiriladi)
+        return Error(message="currency rate unavailable", code=400)
+    except IntegrityError:
+        # shu ext_id bilan parallel chaqiruv birinchi yozdi (OTP va statistika rollback bo'ldi)
+        replay = replay_existing(ext_id, fingerprint)
+        if replay is None:
+            raise
+        return replay
+    return idempotency.remember(ext_id, fingerprint, transfer.to_result())
+
+
+def create_transfer(ext_id, sender_card_number, sender_card_expiry, sender_phone,
+                    receiver_card_number, receiver_phone, sending_amount, currency):
+    """
+    Saves a validated transfer and queues its OTP in one transaction.
+    :raises RateUnavailable: if the currency has no usable rate (nothing is saved)
+    """
     # convert sender amount
     convert_amount = valyuta(sending_amount, currency)
     # otp code generated
     otp = otp_code()
-    # send otp cod
-    send_otp_telegram(otp)
-    code = bcrypt.hashpw(str(otp).encode(), bcrypt.gensalt()).decode()
-    transfer = Transfer.objects.create(
-        ext_id=ext_id,
-        sender_card_number=encrypt_card(sender_card_number),
-        sender_card_expiry=sender_card_expiry,
-        sender_phone=sender_phone,
-        receiver_card_number=encrypt_card(receiver_card_number),
-        receiver_phone=receiver_phone,
-        sending_amount=sending_amount,
-        currency=currency,
-        receiving_amount=convert_amount,
-        state=TransferState.CREATED,
-        try_count=0,
-        otp=code
-    )
-    return Success(transfer.to_result())
+    code = hash_otp(otp, salt=ext_id)
+    with transaction.atomic():
+        transfer = Transfer.objects.create(
+            ext_id=ext_id,
+            sender_card_number=encrypt_card(sender_card_number),
+            sender_card_index=card_index(sender_card_number),
+            sender_card_expiry=sender_card_expiry,
+            sender_phone=sender_phone,
+            receiver_card_number=encrypt_card(receiver_card_number),
+            receiver_card_index=card_index(receiver_card_number),
+            receiver_phone=receiver_phone,
+            sending_amount=sending_amount,
+            currency=currency,
+            receiving_amount=convert_amount,
+            state=TransferState.CREATED,
+            try_count=0,
+            otp=code
+        )
+        stats.transfer_created(transfer)
+        # otp kod worker orqali yuboriladi (tranzaksiya commit bo'lgandan keyin)
+        enqueue_otp(otp)
+    return transfer
+
+
+MAX_OTP_ATTEMPTS = 3
+
+
+def failed_attempt(transfer):
+    """:return: queryset that counts a wrong OTP only while the attempt limit is not reached"""
+    return Transfer.objects.filter(pk=transfer.pk, try_count__lt=MAX_OTP_ATTEMPTS)
+
+
+def forget_moved(context, ext_id):
+    # balanslar o'zgardi: batch dagi keyingi card.info / transfer_state qayta o'qiydi
+    loader = get_loader(context)
+    loader.forget("transfer", ext_id)
+    loader.clear("card")
 
 
 @method(name="confirm_transfer")
-# @log_request_response
+@log_request_response
 def confirm_transfer(context, ext_id, otp) -> Result:
     """
     ------------------------------------------------------------------------------------
@@ -144,31 +242,27 @@ def confirm_transfer(context, ext_id, otp) -> Result:
     except Transfer.DoesNotExist:
         return Error(message="not found transfer!", code=404)
 
-    if transfer.try_count >= 3:
+    if transfer.try_count >= MAX_OTP_ATTEMPTS:
         return Error(message="Attempt limit exceeded.", code=429)
 
-    if not bcrypt.checkpw(otp.encode(), transfer.otp.encode()):
-        transfer.try_count += 1
-        transfer.save()
+    if not verify_otp(otp, transfer.otp, salt=transfer.ext_id):
+        # butun qatorni saqlash parallel tasdiqlangan holatni eski qiymat bilan ustidan yozib yuborardi
+        if not failed_attempt(transfer).update(try_count=F("try_count") + 1):
+            return Error(message="Attempt limit exceeded.", code=429)
         return Error(message="Invalid code!", code=400)
 
     if transfer.state != TransferState.CREATED:
         return Error(message="Transfer is in an invalid state!", code=400)
-    else:
-        sender_card = Card.objects.get(card_number=decrypt_card(transfer.sender_card_number))
-        receiver_card = Card.objects.get(card_number=decrypt_card(transfer.receiver_card_number))
-        sender_card.balance -= transfer.sending_amount
-        sender_card.save(update_fields=['balance'])
-        receiver_card.balance += transfer.receiving_amount
-        receiver_card.save(update_fields=['balance'])
-        transfer.state = TransferState.CONFIRMED
-        transfer.confirmed_at = timezone.now()
-        transfer.save(update_fields=['state', 'confirmed_at'])
-        return Success(transfer.to_result())
+    try:
+        balance.confirm(transfer)
+    except TransferError as e:
+        return Error(message=e.message, code=e.code)
+    forget_moved(context, ext_id)
+    return Success(transfer.to_result())
 
 
 @method(name="transfer_cancel")
-# @log_request_response
+@log_request_response
 def transfer_cancel(context, ext_id) -> Result:
     """
     ------------------------------------------------------------------------------------
@@ -188,23 +282,16 @@ def transfer_cancel(context, ext_id) -> Result:
     if transfer.state == TransferState.CREATED:
         return Error(message="The transfer has already been created!", code=400)
 
-    sender_card = Card.objects.get(card_number=transfer.sender_card_number)
-    receiver_card = Card.objects.get(card_number=transfer.receiver_card_number)
-
-    if transfer.sending_amount >= convert_rub_to_uzs(receiver_card.balance):
-        return Error(message="Insufficient funds to be refunded!", code=400)
-
-    sender_card.balance += transfer.sending_amount
-    receiver_card.balance -= transfer.receiving_amount
-    sender_card.save()
-    receiver_card.save()
-    transfer.state = "cancelled"
-    transfer.cancelled_at = timezone.now()
-    transfer.save()
+    try:
+        balance.cancel(transfer)
+    except TransferError as e:
+        return Error(message=e.message, code=e.code)
+    forget_moved(context, ext_id)
     return Success(transfer.to_result())
 
 
 @method(name="transfer_state")
+@log_request_response
 def transfer_state(context, ext_id):
     """
     ------------------------------------------------------------------------------------
@@ -215,19 +302,19 @@ def transfer_state(context, ext_id):
                    ext_id -> this is the type of variable str
     :return: {"message"} where message contains the current state of the transfer
     """
-    try:
-        transfer = Transfer.objects.get(ext_id=ext_id)
-        return Success({"message": transfer.state})
-    except Transfer.DoesNotExist:
+    transfer = get_loader(context).get("transfer", ext_id)
+    if transfer is None:
         return Error(message="transfer not found!", code=404)
+    return Success({"message": transfer.state})
 
 
 @method(name="transfer_filter")
-def transfer_filter(context, card_number, start_date=None, end_date=None, status=None):
+@log_request_response
+def transfer_filter(context, card_number, start_date=None, end_date=None, status=None, cursor=None, limit=None):
     """
     ------------------------------------------------------------------------------------
     Filters transfer history based on the sender card number, optional date range,
-    and status. Returns a list of matching transfers with basic info.
+    and status. Returns one page of matching transfers, newest first.
     ------------------------------------------------------------------------------------
     :param context: The request context or session object.
     :param card_number: Sender’s card number to filter transfers.
@@ -238,11 +325,32 @@ def transfer_filter(context, card_number, start_date=None, end_date=None, status
                      end_date -> this is the type of variable str
     :param status: (Optional) Status of the transfer (e.g., 'created', 'confirmed', 'cancelled').
                    status -> this is the type of variable str
-    :return: A list of dictionaries containing:
-             {"ext_id", "amount", "currency", "receiver", "state", "created_at"}
+    :param cursor: (Optional) next_cursor of the previous page. cursor -> this is the type of variable str
+    :param limit: (Optional) Page size, capped by TRANSFER_FILTER_MAX_PAGE_SIZE. this is the type of variable int
+    :return: {"items": [{"ext_id", "amount", "currency", "receiver", "state", "created_at"}, ...],
+              "next_cursor"} - next_cursor is null on the last page
     """
+    queryset = Transfer.objects.filter(**filter_fields(card_number, start_date, end_date, status))
+    try:
+        rows, next_cursor = paginate(
+            queryset,
+            FILTER_FIELDS,
+            cursor=cursor,
+            limit=limit,
+        )
+    except InvalidCursor:
+        return Error(message="invalid cursor!", code=400)
+    except (TypeError, ValueError):
+        return Error(message="invalid limit!", code=400)
+    return Success(filter_result(rows, next_cursor))
+
+
+FILTER_FIELDS = ("ext_id", "sending_amount", "currency", "receiver_card_number", "state")
+
+
+def filter_fields(card_number, start_date=None, end_date=None, status=None):
     filter_by_fields = {
-        "sender_card_number": card_number
+        "sender_card_index": card_index(card_number)
     }
     if start_date:
         filter_by_fields["created_at__gte"] = datetime.strptime(start_date, "%Y-%m-%d")  # __gte bu kalit soz ,
@@ -253,25 +361,45 @@ def transfer_filter(context, card_number, start_date=None, end_date=None, status
 
     if status:
         filter_by_fields['state'] = status
+    return filter_by_fields
+
 
-    transfer_history_list = Transfer.objects.filter(**filter_by_fields)
-    result = [
+def filter_result(rows, next_cursor):
+    items = [
         {
-            "ext_id": t.ext_id,
-            "amount": float(t.sending_amount),
-            "currency": t.currency,
-            "receiver": t.receiver_card_number,
-            "state": t.state,
-            "created_at": t.created_at.strftime("%Y-%m-%d %H:%M")
+            "ext_id": t["ext_id"],
+            "amount": float(t["sending_amount"]),
+            "currency": t["currency"],
+            "receiver": t["receiver_card_number"],
+            "state": t["state"],
+            "created_at": t["created_at"].strftime("%Y-%m-%d %H:%M")
         }
-        for t in transfer_history_list
+        for t in rows
     ]
-
-    return Success(result)
+    return {"items": items, "next_cursor": next_cursor}
 
 
 @csrf_exempt
 def jsonrpc(request):
+    body = request.body.decode()
+    request.loader = Loader()
+    try:
+        calls = json.loads(body)
+    except ValueError:
+        # noto'g'ri JSON: xato javobini jsonrpcserver o'zi qaytaradi
+        return HttpResponse(dispatch(body, context=request), content_type="application/json")
+    request.loader.prime(calls)
+    methods = metrics.instrument(profiling.profile_methods(global_methods))
     return HttpResponse(
-        dispatch(request.body.decode(), context=request), content_type="application/json"
+        dispatch(body, methods=methods, deserializer=lambda _: calls, context=request), content_type="application/json"
     )
+
+
+def prometheus_metrics(request):
+    """
+    ------------------------------------------------------------------------------------
+    Metrics of all processes (JSON-RPC methods, database queries, outbound HTTP)
+    in the Prometheus text format. Allowed only from ALLOWED_IPS.
+    ------------------------------------------------------------------------------------
+    """
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")